@@ -0,0 +1,426 @@
+"""
+Local stand-in for the parts of the Ambari REST API this utility uses, for offline
+benchmarks (see suite.py). Serves:
+
+    GET /api/v1/clusters
+    GET /api/v1/clusters/{cluster}[?fields=Clusters/desired_configs]
+    GET /api/v1/clusters/{cluster}/configurations?type=..&tag=..   (and OR-ed (type=..&tag=..)|(..) predicates)
+    GET /api/v1/clusters/{cluster}/services/{service}
+    GET /api/v1/clusters/{cluster}/hosts[?fields=..&page_size=..&from=..]
+    GET /api/v1/clusters/{cluster}/host_components[?HostRoles/component_name=..]
+    PUT /api/v1/clusters/{cluster}   (Clusters/desired_configs, one type or a list)
+
+Responses honour `fields` (partial response) and `minimal_response=true` (no hrefs), and are
+gzip-compressed like Ambari's (api.gzip.compression.enabled) when the client accepts it and
+they are at least 10 KiB. Cluster size, config size and per-request latency are configurable,
+and every request, connection and payload byte is counted so callers can report what an
+action cost.
+Overload can be simulated with random stalls and transient 503s on GETs:
+
+    python benchmarks/mock_ambari.py --hosts 5000 --latency-ms 20 --port 8080
+    python benchmarks/mock_ambari.py --stall-rate 0.05 --stall-ms 3000 --error-rate 0.02
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_CLUSTER = 'bench'
+DEFAULT_USERNAME = 'admin'
+DEFAULT_PASSWORD = 'admin'
+
+# Properties of the config types discovery and configure_knox read; padded to the requested size
+BASE_CONFIGS = {
+    'core-site': {'fs.defaultFS': 'hdfs://{namenode}:8020'},
+    'hdfs-site': {'dfs.http.policy': 'HTTP_ONLY', 'dfs.namenode.http-address': '{namenode}:50070',
+                  'dfs.namenode.https-address': '{namenode}:50470'},
+    'yarn-site': {'yarn.log.server.web-service.url': 'http://{namenode}:8188/ws/v1/applicationhistory'},
+    'admin-properties': {'policymgr_external_url': 'http://{namenode}:6080'},
+    'infra-solr-env': {'infra_solr_port': '8886', 'infra_solr_ssl_enabled': 'false'},
+    'gateway-site': {'gateway.port': '8443', 'gateway.path': 'gateway'},
+    'topology': {'content': '<topology><gateway/></topology>'},
+}
+# Roles placed on the first hosts, in order; every host also runs these
+MASTER_ROLES = ['NAMENODE', 'INFRA_SOLR', 'KNOX_GATEWAY', 'RANGER_ADMIN', 'APP_TIMELINE_SERVER']
+WORKER_ROLES = ['DATANODE', 'NODEMANAGER']
+# Served per host on /hosts when no fields are asked for beyond the defaults Ambari always returns
+HOST_DETAILS = {'cpu_count': 16, 'os_type': 'redhat7', 'rack_info': '/default-rack', 'host_status': 'HEALTHY',
+                'total_mem': 131072000, 'maintenance_state': 'OFF'}
+CONFIG_PREDICATE = re.compile(r'type=([^&|()]+)&tag=([^&|()]+)')
+# Ambari's default api.gzip.compression.min.size
+GZIP_MIN_SIZE = 10240
+STACK_ID = 'HDP-3.1'
+# Components listed on each service resource (what a full GET .../services/{name} carries besides ServiceInfo)
+SERVICE_COMPONENTS = {
+    'HDFS': ['DATANODE', 'HDFS_CLIENT', 'JOURNALNODE', 'NAMENODE', 'ZKFC'],
+    'YARN': ['APP_TIMELINE_SERVER', 'NODEMANAGER', 'RESOURCEMANAGER', 'YARN_CLIENT'],
+    'RANGER': ['RANGER_ADMIN', 'RANGER_TAGSYNC', 'RANGER_USERSYNC'],
+    'AMBARI_INFRA_SOLR': ['INFRA_SOLR', 'INFRA_SOLR_CLIENT'],
+    'KNOX': ['KNOX_GATEWAY'],
+}
+
+
+class MockCluster:
+    """
+    In-memory cluster state: hosts spread over `domains` DNS domains, their components,
+    and every config version ever written, keyed by (type, tag).
+    """
+
+    def __init__(self, name=DEFAULT_CLUSTER, hosts=100, domains=1, properties=50, value_size=32,
+                 namenode_ha=False, knox=True):
+        self.name = name
+        self.services = {'HDFS', 'YARN', 'RANGER', 'AMBARI_INFRA_SOLR'} | ({'KNOX'} if knox else set())
+        self.hostnames = [f"node{i:05d}.dc{i % max(1, domains)}.example.com" for i in range(max(1, hosts))]
+        self.components = dict((hostname, list(WORKER_ROLES)) for hostname in self.hostnames)
+        roles = list(MASTER_ROLES)
+        if namenode_ha:
+            roles.insert(1, 'NAMENODE')
+        for i, role in enumerate(roles):
+            self.components[self.hostnames[i % len(self.hostnames)]].append(role)
+        self.configs = {}
+        self.desired = {}
+        self.lock = threading.Lock()
+        namenode = self.hostnames[0]
+        for config_type, base in BASE_CONFIGS.items():
+            config = dict((key, value.format(namenode=namenode)) for key, value in base.items())
+            for i in range(max(0, properties - len(config))):
+                config[f"mock.{config_type}.property.{i}"] = 'x' * value_size
+            self.put(config_type, 'version1', config, {})
+
+    def put(self, config_type, tag, properties, attributes):
+        with self.lock:
+            self.configs[(config_type, tag)] = (properties, attributes)
+            self.desired[config_type] = tag
+
+    def service_item(self, service, base_url):
+        href = f"{base_url}/api/v1/clusters/{self.name}/services/{service}"
+        return {
+            'href': href,
+            'ServiceInfo': {'cluster_name': self.name, 'service_name': service, 'state': 'STARTED',
+                            'maintenance_state': 'OFF', 'repository_state': 'CURRENT', 'desired_stack': STACK_ID,
+                            'credential_store_enabled': False, 'credential_store_supported': False,
+                            'sso_integration_supported': service in ('RANGER', 'KNOX'), 'kerberos_enabled': False},
+            'alerts_summary': {'CRITICAL': 0, 'MAINTENANCE': 0, 'OK': 4, 'UNKNOWN': 0, 'WARNING': 0},
+            'components': [{'href': f"{href}/components/{component}",
+                            'ServiceComponentInfo': {'cluster_name': self.name, 'component_name': component,
+                                                     'service_name': service}}
+                           for component in SERVICE_COMPONENTS.get(service, [])],
+            'artifacts': [],
+        }
+
+    def config_item(self, config_type, tag, base_url):
+        properties, attributes = self.configs[(config_type, tag)]
+        return {'href': f"{base_url}/api/v1/clusters/{self.name}/configurations?type={config_type}&tag={tag}",
+                'tag': tag, 'type': config_type, 'version': 1,
+                'Config': {'cluster_name': self.name, 'stack_id': STACK_ID},
+                'properties': properties, 'properties_attributes': attributes}
+
+    def host_item(self, hostname, base_url):
+        href = f"{base_url}/api/v1/clusters/{self.name}/hosts/{hostname}"
+        return {
+            'href': href,
+            'Hosts': dict(HOST_DETAILS, cluster_name=self.name, host_name=hostname),
+            'host_components': [
+                {'href': f"{href}/host_components/{component}",
+                 'HostRoles': {'cluster_name': self.name, 'component_name': component, 'host_name': hostname}}
+                for component in self.components[hostname]],
+        }
+
+
+def project(item, fields):
+    """
+    Keeps only the requested Ambari `fields` (e.g. Hosts/host_name,host_components/HostRoles/component_name)
+    of a response item, like Ambari's partial response; 'href' is always kept.
+    """
+    result = {'href': item['href']} if 'href' in item else {}
+    for field in fields:
+        _copy_path(item, result, field.split('/'))
+    return result
+
+def _copy_path(source, target, path):
+    key = path[0]
+    if key == '*':
+        target.update(source)
+        return
+    if key not in source:
+        return
+    value = source[key]
+    if len(path) == 1:
+        target[key] = value
+    elif isinstance(value, list):
+        existing = target.setdefault(key, [{} for _ in value])
+        for element, projected in zip(value, existing):
+            if 'href' in element:
+                projected['href'] = element['href']
+            _copy_path(element, projected, path[1:])
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(key, {}), path[1:])
+
+def shape(body, query, default_fields=None):
+    """Applies `fields` (to each item of a collection) and `minimal_response=true` to a response body."""
+    fields = query['fields'][0].split(',') if 'fields' in query else default_fields
+    if fields:
+        if 'items' in body:
+            body = dict(body, items=[project(item, fields) for item in body['items']])
+        else:
+            body = project(body, fields)
+    if query.get('minimal_response', [''])[0] == 'true':
+        body = strip_hrefs(body)
+    return body
+
+def strip_hrefs(value):
+    if isinstance(value, dict):
+        return dict((key, strip_hrefs(item)) for key, item in value.items() if key != 'href')
+    if isinstance(value, list):
+        return [strip_hrefs(item) for item in value]
+    return value
+
+
+class MockAmbariServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP(S) server for a MockCluster. `latency` seconds are added to every request;
+    a `stall_rate` fraction of requests stalls for `stall` seconds on top of that, and an
+    `error_rate` fraction of GETs answers 503. Large responses are gzipped for clients that
+    accept it unless `compress` is off. stats() returns counters since the last reset_stats().
+    """
+    daemon_threads = True
+
+    def __init__(self, cluster, host='127.0.0.1', port=0, latency=0.0, tls=False,
+                 username=DEFAULT_USERNAME, password=DEFAULT_PASSWORD, stall_rate=0.0, stall=0.0, error_rate=0.0,
+                 compress=True):
+        super().__init__((host, port), MockAmbariHandler)
+        self.cluster = cluster
+        self.latency = latency
+        self.compress = compress
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.error_rate = error_rate
+        self.credentials = 'Basic ' + base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.protocol = 'https' if tls else 'http'
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._cert_dir = None
+        self.reset_stats()
+        if tls:
+            self._cert_dir = tempfile.TemporaryDirectory()
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*self_signed_certificate(self._cert_dir.name, host))
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"{self.protocol}://{self.server_address[0]}:{self.port}"
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.counters = Counter()
+
+    def count(self, **counts):
+        with self._stats_lock:
+            self.counters.update(counts)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.counters)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients give up on stalled requests (timeouts, hedging); that is expected, not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._cert_dir is not None:
+            self._cert_dir.cleanup()
+
+
+class MockAmbariHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY (set by Jetty too) small
+    # responses wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count(connections=1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body, indent=2).encode('utf-8') if body is not None else b''
+        self.server.count(bytes_json=len(payload))
+        compressed = (self.server.compress and len(payload) >= GZIP_MIN_SIZE
+                      and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        if compressed:
+            payload = gzip.compress(payload, compresslevel=6)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.count(bytes_out=len(payload))
+
+    def _begin(self, method):
+        self.server.count(requests=1, **{method: 1})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.stall_rate and random.random() < self.server.stall_rate:
+            self.server.count(stalls=1)
+            time.sleep(self.server.stall)
+        if method == 'GET' and self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.count(errors=1)
+            self._send(503, {'status': 503, 'message': 'Service Unavailable'})
+            return False
+        if self.headers.get('Authorization') != self.server.credentials:
+            self._send(403, {'status': 403, 'message': 'Full authentication is required to access this resource'})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._begin('GET'):
+            return
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        cluster = self.server.cluster
+        base = f"/api/v1/clusters/{cluster.name}"
+        base_url = f"{self.server.protocol}://{self.headers.get('Host', '')}"
+        if url.path == '/api/v1/clusters':
+            return self._send(200, shape({'href': base_url + '/api/v1/clusters', 'items': [
+                {'href': base_url + base, 'Clusters': {'cluster_name': cluster.name, 'version': STACK_ID}}]}, query))
+        if url.path == base:
+            with cluster.lock:
+                desired = dict((config_type, {'tag': tag, 'version': 1}) for config_type, tag in cluster.desired.items())
+            return self._send(200, shape({'href': base_url + base, 'Clusters': {
+                'cluster_name': cluster.name, 'version': STACK_ID, 'security_type': 'NONE', 'desired_configs': desired}},
+                query))
+        if url.path == base + '/configurations':
+            with cluster.lock:
+                items = [cluster.config_item(config_type, tag, base_url)
+                         for config_type, tag in CONFIG_PREDICATE.findall(unquote(url.query))
+                         if (config_type, tag) in cluster.configs]
+            return self._send(200, shape({'href': base_url + self.path, 'items': items}, query))
+        if url.path.startswith(base + '/services/'):
+            service = url.path.rsplit('/', 1)[-1]
+            if service in cluster.services:
+                return self._send(200, shape(cluster.service_item(service, base_url), query))
+            return self._send(404, {'status': 404, 'message': f"The requested resource doesn't exist: Service not found, "
+                                                              f"Cluster={cluster.name}, Service={service}"})
+        if url.path == base + '/hosts':
+            return self._hosts(query)
+        if url.path == base + '/host_components':
+            component = query.get('HostRoles/component_name', [None])[0]
+            items = [{'HostRoles': {'cluster_name': cluster.name, 'component_name': c, 'host_name': h}}
+                     for h in cluster.hostnames for c in cluster.components[h] if component in (None, c)]
+            return self._send(200, {'items': items})
+        self._send(404, {'status': 404, 'message': f"The requested resource doesn't exist: {url.path}"})
+
+    def _hosts(self, query):
+        cluster = self.server.cluster
+        hostnames = cluster.hostnames
+        component = query.get('host_components/HostRoles/component_name', [None])[0]
+        if component:
+            hostnames = [h for h in hostnames if component in cluster.components[h]]
+        start = int(query.get('from', ['0'])[0])
+        page_size = int(query.get('page_size', [str(len(hostnames) or 1)])[0])
+        fields = query.get('fields', [''])[0].split(',') if 'fields' in query else ['Hosts/cluster_name', 'Hosts/host_name']
+        base_url = f"{self.server.protocol}://{self.headers.get('Host', '')}"
+        items = [project(cluster.host_item(h, base_url), fields) for h in hostnames[start:start + page_size]]
+        body = {'href': f"{base_url}/api/v1/clusters/{cluster.name}/hosts", 'items': items}
+        self._send(200, shape(body, {'minimal_response': query.get('minimal_response', [''])}))
+
+    def do_PUT(self):
+        if not self._begin('PUT'):
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length)
+        self.server.count(bytes_in=len(raw))
+        cluster = self.server.cluster
+        if not self.headers.get('X-Requested-By'):
+            return self._send(400, {'status': 400, 'message': 'CSRF protection is turned on. X-Requested-By HTTP header is required.'})
+        if urlsplit(self.path).path != f"/api/v1/clusters/{cluster.name}":
+            return self._send(404, {'status': 404, 'message': "The requested resource doesn't exist"})
+        try:
+            desired = json.loads(raw)['Clusters']['desired_configs']
+        except (ValueError, KeyError, TypeError):
+            return self._send(400, {'status': 400, 'message': 'Invalid desired_configs request'})
+        for config in (desired if isinstance(desired, list) else [desired]):
+            cluster.put(config['type'], config['tag'], config.get('properties', {}),
+                        config.get('properties_attributes', {}))
+        self.server.count(config_versions=len(desired) if isinstance(desired, list) else 1)
+        self._send(200, None)
+
+
+def self_signed_certificate(directory, host):
+    """Creates a throwaway self-signed certificate with the openssl CLI; returns (certfile, keyfile)."""
+    certfile = os.path.join(directory, 'mock-ambari.crt')
+    keyfile = os.path.join(directory, 'mock-ambari.key')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', f"/CN={host}", '-keyout', keyfile, '-out', certfile],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+def add_cluster_arguments(parser):
+    parser.add_argument('--hosts', type=int, default=1000, help='Hosts in the mock cluster')
+    parser.add_argument('--domains', type=int, default=2, help='DNS domains the hosts are spread over')
+    parser.add_argument('--properties', type=int, default=200, help='Properties per config type')
+    parser.add_argument('--value-size', type=int, default=32, help='Bytes per padding property value')
+    parser.add_argument('--namenode-ha', action='store_true', help='Place two NAMENODE components')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency added to every request')
+    parser.add_argument('--tls', action='store_true', help='Serve HTTPS with a throwaway self-signed certificate')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Fraction of requests that stall')
+    parser.add_argument('--stall-ms', type=float, default=3000.0, help='How long a stalled request hangs')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of GETs answered with 503')
+    parser.add_argument('--no-gzip', action='store_true', help='Never compress responses')
+
+def server_from_args(args, host='127.0.0.1', port=0):
+    return MockAmbariServer(cluster_from_args(args), host, port, args.latency_ms / 1000.0, args.tls,
+                            stall_rate=args.stall_rate, stall=args.stall_ms / 1000.0, error_rate=args.error_rate,
+                            compress=not args.no_gzip)
+
+def cluster_from_args(args):
+    return MockCluster(hosts=args.hosts, domains=args.domains, properties=args.properties,
+                       value_size=args.value_size, namenode_ha=args.namenode_ha)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_cluster_arguments(parser)
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on')
+    args = parser.parse_args()
+    server = server_from_args(args, args.bind, args.port)
+    print(f"Mock Ambari for cluster '{server.cluster.name}' ({args.hosts} hosts) on {server.base_url}; Ctrl-C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.stats()}")
+
+if __name__ == '__main__':
+    main()
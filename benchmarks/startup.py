@@ -0,0 +1,119 @@
+"""
+Startup-time benchmark for `main.py --check-knox`.
+
+Serves a canned KNOX service response from a local HTTP server, points the CLI at it
+through a temporary config.ini (KNOX_UTILITY_CONFIG), and times complete CLI runs in
+fresh interpreters. The interpreter's own startup (`python -c pass`) is measured the
+same way and subtracted, so the budget applies to what this project adds and is
+comparable across machines.
+
+    python benchmarks/startup.py                 # 30 runs, 100 ms overhead budget
+    python benchmarks/startup.py --importtime    # also show the slowest imports
+
+Exits non-zero when the median overhead is over budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_RUNS = 30
+DEFAULT_BUDGET_MS = 100.0
+CLUSTER = 'bench'
+
+
+class KnoxServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlsplit(self.path).path == f'/api/v1/clusters/{CLUSTER}/services/KNOX':
+            status, body = 200, {'ServiceInfo': {'service_name': 'KNOX', 'cluster_name': CLUSTER}}
+        else:
+            status, body = 404, {'status': 404, 'message': 'Service not found'}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def time_runs(command, runs, env):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{result.stdout.decode()}")
+    return timings
+
+def describe(label, timings):
+    timings = sorted(timings)
+    p90 = timings[int(len(timings) * 0.9) - 1]
+    print(f"{label:<24} min {timings[0]:7.1f} ms  median {statistics.median(timings):7.1f} ms  p90 {p90:7.1f} ms")
+
+def slowest_imports(command, env, top):
+    result = subprocess.run([command[0], '-X', 'importtime'] + command[1:], cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    rows = []
+    for line in result.stderr.decode().splitlines():
+        parts = line.split('|')
+        if line.startswith('import time:') and len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    print("Slowest imports (cumulative, one run):")
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:7.1f} ms {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Timed runs per command')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='Allowed median overhead of --check-knox over bare interpreter startup')
+    parser.add_argument('--importtime', action='store_true', help='Show the slowest imports of one run')
+    parser.add_argument('--top', type=int, default=15, help='Imports listed with --importtime')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KnoxServiceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'config.ini')
+        with open(config_path, 'w') as f:
+            f.write(f"[ambari]\nhost = 127.0.0.1\nport = {server.server_port}\nprotocol = http\n"
+                    f"cluster_name = {CLUSTER}\nconfig_cache_max_mb = 0\n")
+        env = dict(os.environ, KNOX_UTILITY_CONFIG=config_path)
+        check_knox = [sys.executable, 'main.py', '--local', 'false', '--check-knox']
+        baseline = [sys.executable, '-c', 'pass']
+
+        # Warm the OS file cache and __pycache__ before timing, and make sure the check really ran
+        output = subprocess.run(check_knox, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE).stdout.decode()
+        if 'KNOX is installed.' not in output:
+            raise RuntimeError(f"Unexpected --check-knox output:\n{output}")
+        time_runs(check_knox, 1, env)
+        time_runs(baseline, 2, env)
+        interpreter = time_runs(baseline, args.runs, env)
+        cli = time_runs(check_knox, args.runs, env)
+        if args.importtime:
+            slowest_imports(check_knox, env, args.top)
+    server.shutdown()
+
+    describe('python -c pass', interpreter)
+    describe('main.py --check-knox', cli)
+    overhead = statistics.median(cli) - statistics.median(interpreter)
+    verdict = 'within' if overhead <= args.budget_ms else 'OVER'
+    print(f"Median overhead {overhead:.1f} ms: {verdict} the {args.budget_ms:.0f} ms budget")
+    return 0 if overhead <= args.budget_ms else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
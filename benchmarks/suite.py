@@ -0,0 +1,193 @@
+"""
+Offline benchmark suite: runs CLI actions against a local mock Ambari server
+(mock_ambari.py) and reports wall time, requests, connections and payload bytes
+for each, so changes in how the utility talks to Ambari show up without a cluster.
+
+    python benchmarks/suite.py                               # 1000 hosts, no latency
+    python benchmarks/suite.py --hosts 20000 --latency-ms 25
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json       # exit 1 on regressions
+    python benchmarks/suite.py --stall-rate 0.05 --stall-ms 2000 --option hedge_percentile=90
+
+Every action runs in a fresh interpreter with `--local false` and a temporary config.ini
+(KNOX_UTILITY_CONFIG), so timings include start-up just as on the command line. Each run is
+traced (--profile) to report the time spent decoding JSON responses, and the mock reports
+bytes on the wire (gzip-compressed where negotiated) next to the JSON they carried.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import mock_ambari
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MAIN = os.path.join(REPO_ROOT, 'main.py')
+DEFAULT_RUNS = 3
+DEFAULT_TOLERANCE = 0.25
+
+# fresh: every timed run starts from the mock's initial configs (otherwise the
+# previous run's writes are kept, e.g. to measure a configure-knox that changes nothing)
+Scenario = namedtuple('Scenario', 'name args fresh')
+
+SCENARIOS = [
+    Scenario('check-knox', [MAIN, '--check-knox'], False),
+    Scenario('get-topology-vars', ['-c', 'import sys; from knox_utils import tracing; tracer = tracing.enable(); '
+                                         'from knox_utils.cluster import get_topology_vars; get_topology_vars(); '
+                                         'tracer.write_json(sys.argv[1])'], False),
+    Scenario('set-knox-whitelist', [MAIN, '--set-knox-whitelist'], True),
+    Scenario('configure-knox', [MAIN, '--configure-knox'], True),
+    Scenario('configure-knox (no-op)', [MAIN, '--configure-knox'], False),
+    Scenario('export-snapshot', [MAIN, '--export-snapshot', 'snapshot.json.gz'], False),
+]
+# Counters compared by --compare besides wall time; any increase in these is a regression
+EXACT_COUNTERS = ['requests', 'PUT', 'config_versions']
+
+
+def write_config(directory, server, config_cache, options=()):
+    path = os.path.join(directory, 'config.ini')
+    with open(path, 'w') as f:
+        f.write("[ambari]\n"
+                f"host = {server.server_address[0]}\nport = {server.port}\nprotocol = {server.protocol}\n"
+                f"cluster_name = {server.cluster.name}\n"
+                f"username = {mock_ambari.DEFAULT_USERNAME}\npassword = {mock_ambari.DEFAULT_PASSWORD}\n"
+                f"config_cache_max_mb = {64 if config_cache else 0}\n"
+                f"config_cache_dir = {os.path.join(directory, 'configs')}\n"
+                f"template_cache_dir = {os.path.join(directory, 'jinja')}\n"
+                f"tls_state_file = {os.path.join(directory, 'tls.json')}\n"
+                f"journal_path = {os.path.join(directory, 'changes.journal')}\n"
+                f"history_dir = {os.path.join(directory, 'history')}\n"
+                + ''.join(f"{key.strip()} = {value.strip()}\n" for key, _, value in (o.partition('=') for o in options)))
+    return path
+
+def parse_seconds(trace_path):
+    """Time the traced run spent in JSON decoding phases ('parse ...')."""
+    with open(trace_path) as f:
+        return sum(phase['seconds'] for phase in json.load(f)['phases'] if phase['name'].startswith('parse'))
+
+def run_once(scenario, server, cluster_args, env, workdir):
+    if scenario.fresh:
+        server.cluster = mock_ambari.cluster_from_args(cluster_args)
+    server.reset_stats()
+    trace_path = os.path.join(workdir, 'trace.json')
+    extra = ['--local', 'false', '--profile', trace_path] if scenario.args[0] == MAIN else [trace_path]
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable] + scenario.args + extra,
+                            cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - started
+    output = result.stdout.decode(errors='replace')
+    if result.returncode != 0 or '[ERROR]' in output:
+        raise RuntimeError(f"{scenario.name} failed (exit {result.returncode}):\n{output[-2000:]}")
+    return seconds, dict(server.stats(), parse_seconds=parse_seconds(trace_path))
+
+def run_scenario(scenario, server, cluster_args, env, workdir, runs):
+    server.cluster = mock_ambari.cluster_from_args(cluster_args)
+    # Untimed warm-up: fills __pycache__ and, for non-fresh scenarios, leaves the cluster configured
+    run_once(scenario, server, cluster_args, env, workdir)
+    timings = []
+    parse_timings = []
+    counters = {}
+    for _ in range(runs):
+        seconds, counters = run_once(scenario, server, cluster_args, env, workdir)
+        timings.append(seconds * 1000)
+        parse_timings.append(counters['parse_seconds'] * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 1),
+        'min_ms': round(min(timings), 1),
+        'max_ms': round(max(timings), 1),
+        'requests': counters.get('requests', 0),
+        'GET': counters.get('GET', 0),
+        'PUT': counters.get('PUT', 0),
+        'connections': counters.get('connections', 0),
+        'bytes_out': counters.get('bytes_out', 0),
+        'bytes_in': counters.get('bytes_in', 0),
+        'json_bytes': counters.get('bytes_json', 0),
+        'parse_ms': round(statistics.median(parse_timings), 2),
+        'config_versions': counters.get('config_versions', 0),
+        'stalls': counters.get('stalls', 0),
+        'errors': counters.get('errors', 0),
+    }
+
+def print_report(results):
+    print(f"{'action':<24} {'median ms':>10} {'min ms':>9} {'max ms':>9} {'requests':>9} {'GET/PUT':>9} {'conns':>6} "
+          f"{'bytes down':>11} {'json bytes':>11} {'parse ms':>9} {'bytes up':>10}")
+    for name, r in results.items():
+        print(f"{name:<24} {r['median_ms']:>10.1f} {r['min_ms']:>9.1f} {r.get('max_ms', 0):>9.1f} {r['requests']:>9} "
+              f"{str(r['GET']) + '/' + str(r['PUT']):>9} {r['connections']:>6} {r['bytes_out']:>11} {r.get('json_bytes', 0):>11} "
+              f"{r.get('parse_ms', 0):>9.2f} {r['bytes_in']:>10}")
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regression messages against a saved run."""
+    regressions = []
+    for name, r in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        for counter in EXACT_COUNTERS:
+            if r.get(counter, 0) > before.get(counter, 0):
+                regressions.append(f"{name}: {counter} {before.get(counter, 0)} -> {r.get(counter, 0)}")
+        for measure in ('median_ms', 'bytes_out'):
+            if before.get(measure) and r[measure] > before[measure] * (1 + tolerance):
+                regressions.append(f"{name}: {measure} {before[measure]} -> {r[measure]} (over {tolerance:.0%} tolerance)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mock_ambari.add_cluster_arguments(parser)
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Timed runs per action')
+    parser.add_argument('--only', action='append', choices=[s.name for s in SCENARIOS], help='Run only this action (repeatable)')
+    parser.add_argument('--config-cache', action='store_true', help='Keep the on-disk config cache enabled between runs')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra [ambari] setting for the utility, e.g. request_retries=0 (repeatable)')
+    parser.add_argument('--save', help='Write the results as JSON to this path')
+    parser.add_argument('--compare', help='Compare with results saved by --save; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative increase of median time and bytes down for --compare')
+    args = parser.parse_args()
+
+    server = mock_ambari.server_from_args(args).start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ, KNOX_UTILITY_CONFIG=write_config(workdir, server, args.config_cache, args.option),
+                       PYTHONPATH=os.pathsep.join(p for p in [REPO_ROOT, os.environ.get('PYTHONPATH')] if p))
+            for scenario in SCENARIOS:
+                if args.only and scenario.name not in args.only:
+                    continue
+                results[scenario.name] = run_scenario(scenario, server, args, env, workdir, args.runs)
+    finally:
+        server.stop()
+
+    print(f"Mock cluster: {args.hosts} hosts in {args.domains} domain(s), {args.properties} properties per config type, "
+          f"{args.latency_ms:g} ms latency{', TLS' if args.tls else ''}"
+          + (f", {args.stall_rate:.0%} stalls of {args.stall_ms:g} ms" if args.stall_rate else '')
+          + (f", {args.error_rate:.0%} GET errors" if args.error_rate else '')
+          + f"; median of {args.runs} run(s)")
+    print_report(results)
+    settings = dict((key, getattr(args, key)) for key in
+                    ('hosts', 'domains', 'properties', 'value_size', 'namenode_ha', 'latency_ms', 'tls', 'runs',
+                     'stall_rate', 'stall_ms', 'error_rate', 'no_gzip', 'option'))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print(f"[WARN] Baseline was recorded with different settings: {baseline.get('settings')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,39 +1,76 @@
-import os
-import configparser
-import time
+from .params import CONFIG_PATH
 
-CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.ini'))
+_UNSET = object()
 
 # Handles reading and updating config.ini
 class KnoxConfig:
+    """
+    The [ambari] options as resolved by params.Resolver (config.ini, environment, overrides).
+    set() writes config.ini right away, except inside a `with KnoxConfig() as config:` block:
+    there keys are only staged, and leaving the block writes them all in one atomic replace.
+    A block left with an error unstages only the keys it set, so keys staged on the shared
+    resolver by an enclosing block or another KnoxConfig are kept.
+
+    ambari.properties is not a resolver layer: params.Resolver.sync_ambari_properties() copies
+    its protocol/port into config.ini, which is where get() then finds them.
+    """
+
     def __init__(self, config_path=CONFIG_PATH):
+        from . import params
         self.config_path = config_path
-        self.config = configparser.ConfigParser()
-        self.config.read(self.config_path)
-        if 'ambari' not in self.config:
-            self.config['ambari'] = {}
+        self.resolver = params.resolver() if config_path == CONFIG_PATH else params.Resolver(config_path)
+        # One dict per open `with` block: key -> what was staged before the block set it
+        self._blocks = []
+
+    def __enter__(self):
+        self._blocks.append({})
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        block = self._blocks.pop()
+        if exc_type is not None:
+            # Nothing this block staged is written or read back; earlier staged values return
+            for key, previous in block.items():
+                if previous is _UNSET:
+                    self.resolver.staged.pop(key, None)
+                else:
+                    self.resolver.staged[key] = previous
+        elif self._blocks:
+            # Nested: the enclosing block saves (or unstages) these keys
+            for key, previous in block.items():
+                self._blocks[-1].setdefault(key, previous)
+        else:
+            self.save()
 
     def get(self, key, fallback=None):
-        return self.config['ambari'].get(key, fallback)
+        value = self.resolver.raw(key)
+        return fallback if value is None else value
 
     def set(self, key, value):
-        self.config['ambari'][key] = str(value)
-        self.save()
+        if self._blocks:
+            self._blocks[-1].setdefault(key.lower(), self.resolver.staged.get(key.lower(), _UNSET))
+        self.resolver.set(key, value)
+        if not self._blocks:
+            self.save()
 
     def save(self):
-        with open(self.config_path, 'w') as configfile:
-            self.config.write(configfile)
+        from . import params
+        if self.resolver.save() and self.resolver is params.resolver():
+            params.reload()
 
     def update_from_dict(self, d):
         for k, v in d.items():
-            self.config['ambari'][k] = str(v)
+            self.resolver.set(k, v)
         self.save()
 
     def as_dict(self):
-        return dict(self.config['ambari'])
+        return self.resolver.options()
 
 # Usage:
 # from knox_utils import KnoxConfig
 # config = KnoxConfig()
 # config.get('username')
-# config.update_from_dict({'protocol': 'https'})
+# config.update_from_dict({'protocol': 'https', 'port': 8443})
+# with KnoxConfig() as config:
+#     config.set('protocol', 'https')
+#     config.set('port', 8443)
@@ -0,0 +1,355 @@
+import asyncio
+import base64
+import contextvars
+import gzip
+import json
+import ssl
+import time
+from urllib.parse import quote
+
+from . import configs, tracing
+from .host_index import HostComponentIndex, HOST_COMPONENTS_FIELDS
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 30
+
+SERVICE_URL = configs.CLUSTERS_URL + '/services/{1}?fields=ServiceInfo/service_name'
+HOSTS_URL = configs.CLUSTERS_URL + '/hosts'
+HOSTS_PAGE_URL = HOSTS_URL + '?fields={1}&minimal_response=true&page_size={2}&from={3}'
+DEFAULT_HOSTS_PAGE_SIZE = 1000
+
+
+async def run_in_executor(func, *args):
+    """
+    Runs a blocking call in the loop's default executor under a copy of the caller's
+    context, so e.g. its print() output still goes to the calling fleet task's log.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, func, *args)
+
+
+class AsyncAmbariClient:
+    """
+    asyncio-native counterpart of configs.api_accessor and the direct Ambari lookups in cluster.py.
+
+    Requests are plain HTTP/1.1 over asyncio streams with keep-alive connection reuse.
+    A semaphore limits in-flight requests (and therefore open connections) to
+    max_concurrency, so many operations can share one event loop.
+
+    For https the certificate check follows the shared per-host TLS policy (tls.py)
+    unless unsafe is given: True skips verification, False requires a verifiable chain.
+    http_proxy / https_proxy / no_proxy are honoured as by configs.ConnectionPool.
+    """
+
+    def __init__(self, host, port, protocol, username, password, cluster_name,
+                 unsafe=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, config_cache=None):
+        self.host = host
+        self.port = int(port)
+        self.protocol = protocol
+        self.cluster_name = cluster_name
+        self.ambari = configs.ambari_address(host, self.port)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.config_cache = config_cache
+        self._ssl = None
+        if protocol == configs.HTTPS_PROTOCOL and unsafe is not None:
+            self._ssl = ssl.create_default_context()
+            if unsafe:
+                self._ssl.check_hostname = False
+                self._ssl.verify_mode = ssl.CERT_NONE
+        auth = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self._headers = (
+            f"Host: {host}:{self.port}\r\n"
+            f"Authorization: Basic {auth}\r\n"
+            "X-Requested-By: ambari\r\n"
+            "Connection: keep-alive\r\n"
+            "Accept-Encoding: gzip\r\n"
+        )
+        self.proxy = configs.get_proxy(protocol, host, self.port)
+        self._target = ''
+        if self.proxy is not None and protocol == configs.HTTP_PROTOCOL:
+            # A plain-http proxy is sent the absolute URL of each request
+            self._target = f"http://{host}:{self.port}"
+            if self.proxy.authorization:
+                self._headers += f"Proxy-Authorization: {self.proxy.authorization}\r\n"
+        self._semaphore = None
+        self._idle = []
+        self._host_index = None
+
+    @classmethod
+    def from_params(cls, **kwargs):
+        """Builds a client for the Ambari server configured in config.ini."""
+        from .params import AMBARI_HOST, PORT, PROTOCOL, USERNAME, PASSWORD, CLUSTER_NAME
+        from .cluster import get_config_cache
+        kwargs.setdefault('config_cache', get_config_cache())
+        return cls(AMBARI_HOST, PORT, PROTOCOL, USERNAME, PASSWORD, CLUSTER_NAME, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    # ---- transport ----
+
+    async def fetch(self, api_url, request_type=configs.GET_REQUEST_TYPE, request_body=None):
+        """
+        Performs one request and returns (status, body text) without raising on HTTP errors.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if isinstance(request_body, str):
+            request_body = request_body.encode('utf-8')
+        async with self._semaphore:
+            started = time.perf_counter()
+            retries = 0
+            try:
+                connection, reused = await self._checkout()
+                while True:
+                    try:
+                        status, body, keep_alive, wire_bytes = await asyncio.wait_for(
+                            self._roundtrip(connection, request_type, api_url, request_body), self.timeout)
+                        break
+                    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                        connection[1].close()
+                        # A PUT may have reached the server before the connection dropped: never resend it
+                        if not reused or request_type != configs.GET_REQUEST_TYPE:
+                            raise
+                        # The server closed an idle keep-alive connection; retry once on a fresh one
+                        retries += 1
+                        connection, reused = await self._open(), False
+                    except BaseException:
+                        connection[1].close()
+                        raise
+            except Exception as exc:
+                tracing.record_request('asyncio', request_type, api_url, None, time.perf_counter() - started,
+                                       len(request_body or b''), 0, retries, str(exc) or type(exc).__name__)
+                raise
+            tracing.record_request('asyncio', request_type, api_url, status, time.perf_counter() - started,
+                                   len(request_body or b''), wire_bytes, retries, bytes_decoded=len(body))
+            if hasattr(self._ssl, 'remember'):
+                self._ssl.remember(connection[1].get_extra_info('ssl_object'))
+            if keep_alive:
+                self._idle.append(connection)
+            else:
+                connection[1].close()
+        return status, body.decode('utf-8')
+
+    async def request(self, api_url, request_type=configs.GET_REQUEST_TYPE, request_body=None):
+        """
+        Same contract as the configs.api_accessor closure: returns the body, raises on failure.
+        """
+        try:
+            status, body = await self.fetch(api_url, request_type, request_body)
+        except Exception as exc:
+            raise Exception('Problem with accessing api. Reason: {0}'.format(exc))
+        if status >= 400:
+            raise Exception('Problem with accessing api. Reason: HTTP Error {0}'.format(status))
+        return body
+
+    async def _checkout(self):
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection[0].at_eof():
+                return connection, True
+            connection[1].close()
+        return await self._open(), False
+
+    async def _open(self):
+        if self._ssl is None and self.protocol == configs.HTTPS_PROTOCOL:
+            from . import tls
+            # Deciding may probe the server once (blocking), so keep it off the event loop
+            self._ssl = await run_in_executor(tls.get_context, self.host, self.port)
+        if self.proxy is None:
+            connecting = asyncio.open_connection(self.host, self.port, ssl=self._ssl)
+        elif self.protocol == configs.HTTPS_PROTOCOL:
+            # The CONNECT handshake is a few blocking round trips; run it off the event loop
+            sock = await run_in_executor(configs.connect, self.host, self.port, self.timeout, self.proxy)
+            connecting = asyncio.open_connection(sock=sock, ssl=self._ssl, server_hostname=self.host)
+        else:
+            connecting = asyncio.open_connection(self.proxy.host, self.proxy.port)
+        reader, writer = await asyncio.wait_for(connecting, self.timeout)
+        ssl_object = writer.get_extra_info('ssl_object')
+        if ssl_object is not None and hasattr(self._ssl, 'check_peer'):
+            try:
+                self._ssl.check_peer(ssl_object)
+            except ssl.SSLError:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def _roundtrip(self, connection, method, api_url, body):
+        reader, writer = connection
+        head = f"{method} {self._target}{api_url} HTTP/1.1\r\n{self._headers}"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        writer.write(head.encode('latin-1') + b"\r\n" + (body or b""))
+        await writer.drain()
+
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("connection closed by server")
+            version, status, _ = status_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            # Interim responses (100 Continue, 102, 103) have no body and precede the real one
+            if not 100 <= int(status) < 200:
+                break
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            response_body = b''.join(chunks)
+        elif 'content-length' in headers:
+            response_body = await reader.readexactly(int(headers['content-length']))
+        else:
+            response_body = await reader.read()
+            keep_alive = False
+        wire_bytes = len(response_body)
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            response_body = gzip.decompress(response_body)
+        return int(status), response_body, keep_alive, wire_bytes
+
+    # ---- config operations (configs.py equivalents) ----
+
+    async def get_desired_tags(self):
+        return configs.parse_desired_tags(await self.request(configs.DESIRED_CONFIGS_URL.format(self.cluster_name)))
+
+    async def get_config_tag(self, config_type):
+        response = await self.request(configs.DESIRED_CONFIG_URL.format(self.cluster_name, quote(config_type)))
+        config_tag = configs.parse_config_tag(response, config_type)
+        if config_tag is None:
+            raise Exception('"{0}" not found in desired configs of cluster "{1}"'.format(config_type, self.cluster_name))
+        return config_tag
+
+    async def get_configs_by_tag(self, type_tags, check=True):
+        type_tags = list(type_tags)
+        responses = await asyncio.gather(*[self.request(url) for url in configs.configurations_urls(self.cluster_name, type_tags)])
+        configs_by_tag = {}
+        for response in responses:
+            configs_by_tag.update(configs.parse_configurations(response))
+        if check:
+            configs.check_configurations(type_tags, configs_by_tag)
+        return configs_by_tag
+
+    async def get_current_config(self, config_type):
+        config_tag = await self.get_config_tag(config_type)
+        configs_by_tag = await self.get_configs_by_tag([(config_type, config_tag)])
+        return configs_by_tag[(config_type, config_tag)]
+
+    async def snapshot(self, config_types):
+        """
+        Fetches desired tags once plus every existing type in config_types, and returns
+        them as a primed configs.ClusterConfigSnapshot that serves reads from memory.
+        """
+        tags = await self.get_desired_tags()
+        snapshot = configs.ClusterConfigSnapshot(self.cluster_name, None, self.config_cache, self.ambari)
+        snapshot.prime(tags, {})
+        missing = snapshot.resolve_cached([(config_type, tags[config_type]) for config_type in config_types if config_type in tags])
+        if missing:
+            snapshot.store(await self.get_configs_by_tag(missing, check=False), missing)
+        return snapshot
+
+    async def create_new_desired_config(self, config_type, properties, attributes, version_note):
+        new_tag, new_config = configs.new_desired_config(config_type, properties, attributes, version_note)
+        configs.logger.info('### PUTting Site:{0}, Tag:{1}'.format(config_type, new_tag))
+        await self.request(configs.CLUSTERS_URL.format(self.cluster_name), configs.PUT_REQUEST_TYPE, json.dumps(new_config))
+        configs.logger.info('### NEW Site:{0}, Tag:{1}'.format(config_type, new_tag))
+        if configs.config_history is not None:
+            configs.config_history.record(self.ambari, self.cluster_name, config_type, new_tag, properties, attributes,
+                                          version_note)
+        return new_tag
+
+    async def update_config(self, config_type, config_updater, version_note, snapshot=None):
+        """
+        config_updater(cluster, config_type, client) may be a plain function or a coroutine function.
+        Returns a configs.ConfigDiff; the PUT is skipped when nothing changed.
+        """
+        updated = config_updater(self.cluster_name, config_type, self)
+        properties, attributes = await updated if asyncio.iscoroutine(updated) else updated
+        if snapshot is None:
+            snapshot = await self.snapshot([config_type])
+        if snapshot.has(config_type):
+            current_properties, current_attributes = snapshot.get(config_type)
+        else:
+            current_properties, current_attributes = {}, {}
+        diff = configs.diff_config(config_type, current_properties, current_attributes, properties, attributes)
+        if not diff.has_changes:
+            configs.logger.info('### No changes for Site:{0}, skipping PUT'.format(config_type))
+            return diff
+        new_tag = await self.create_new_desired_config(config_type, properties, attributes, version_note)
+        if configs.change_journal is not None:
+            configs.change_journal.append(self.ambari, self.cluster_name, new_tag, version_note, [configs.property_changes(
+                config_type, current_properties, current_attributes, properties, attributes)])
+        snapshot.record(config_type, new_tag, properties, attributes)
+        return diff._replace(tag=new_tag)
+
+    async def apply_change_set(self, change_set, version_note):
+        """Async configs.ConfigChangeSet.apply: one PUT for every changed type in the set."""
+        diffs, config_tag, new_config = change_set.prepare(version_note)
+        if new_config is not None:
+            await self.request(configs.CLUSTERS_URL.format(self.cluster_name), configs.PUT_REQUEST_TYPE, json.dumps(new_config))
+        return change_set.commit(diffs, config_tag)
+
+    # ---- host/service lookups (cluster.py equivalents) ----
+
+    async def get_service(self, service_name):
+        """Returns the service resource (ServiceInfo/service_name only), or None if it is not installed."""
+        status, body = await self.fetch(SERVICE_URL.format(self.cluster_name, service_name))
+        try:
+            data = json.loads(body)
+        except Exception:
+            data = {}
+        if status == 404 or (isinstance(data, dict) and data.get('status') == 404):
+            return None
+        if status >= 400:
+            raise Exception('Problem with accessing api. Reason: HTTP Error {0}'.format(status))
+        return data
+
+    async def get_host_index(self, page_size=DEFAULT_HOSTS_PAGE_SIZE):
+        """
+        Returns the cluster's host_index.HostComponentIndex. It is fetched page by page
+        on first use and shared by every later (or concurrent) caller on this client.
+        """
+        if self._host_index is None:
+            self._host_index = asyncio.ensure_future(self._fetch_host_index(page_size))
+        try:
+            return await asyncio.shield(self._host_index)
+        except Exception:
+            self._host_index = None
+            raise
+
+    async def _fetch_host_index(self, page_size):
+        index = HostComponentIndex()
+        start = 0
+        while True:
+            url = HOSTS_PAGE_URL.format(self.cluster_name, quote(HOST_COMPONENTS_FIELDS, safe='/,'), page_size, start)
+            items = json.loads(await self.request(url)).get('items', [])
+            index.add_items(items)
+            if len(items) < page_size:
+                return index
+            start += page_size
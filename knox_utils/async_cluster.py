@@ -0,0 +1,168 @@
+import asyncio
+
+from . import cluster, configs, topology, whitelist
+from .async_client import AsyncAmbariClient
+
+# Discovery task answered from the host/component index instead of configs
+HOST_INDEX_TASK = 'hosts'
+
+
+async def is_knox_installed(client=None):
+    if client is None:
+        async with AsyncAmbariClient.from_params() as client:
+            return await is_knox_installed(client)
+    service = await client.get_service('KNOX')
+    return service is not None and 'ServiceInfo' in service
+
+async def set_knox_proxy_users(client, snapshot=None, change_set=None):
+    """
+    Async set_knox_proxy_users: sets proxyuser.knox.* in core-site, or only plans it into change_set.
+    """
+    print("[INFO] Configuring Knox proxyuser in Hadoop core-site via Ambari API (async)...")
+    snapshot = snapshot or await client.snapshot(['core-site'])
+
+    def update_proxyuser_knox(cluster_name, config_type, client):
+        properties, attributes = snapshot.get(config_type)
+        properties.update(cluster.KNOX_PROXYUSER_PROPERTIES)
+        return properties, attributes
+    try:
+        if change_set is not None:
+            change_set.update('core-site', update_proxyuser_knox)
+            print("[INFO] Knox proxyuser properties planned for core-site.")
+            return
+        change = await client.update_config('core-site', update_proxyuser_knox, "Set proxyuser.knox.* for Knox gateway", snapshot)
+        if change.has_changes:
+            print(f"[SUCCESS] Knox proxyuser properties updated in core-site ({change.summary()}).")
+        else:
+            print("[INFO] Knox proxyuser properties already set in core-site; no new config version created.")
+    except Exception as e:
+        print(f"[ERROR] Failed to update core-site config: {e}")
+
+async def set_knox_whitelist(client, snapshot=None, change_set=None):
+    """
+    Async set_knox_whitelist: derives gateway.dispatch.whitelist from the domains of all
+    cluster hostnames, and updates gateway-site or only plans it into change_set.
+    """
+    from .params import WHITELIST_MAX_ALTERNATIVES, WHITELIST_MAX_MATCH_US
+    print("[INFO] Configuring Knox whitelist based on cluster hostname patterns (async)...")
+    if snapshot is None:
+        host_index, snapshot = await asyncio.gather(client.get_host_index(), client.snapshot(['gateway-site']))
+    else:
+        host_index = await client.get_host_index()
+    hostnames = host_index.hostnames
+    if not hostnames:
+        error_msg = "[ERROR] No hostnames found in cluster"
+        print(error_msg)
+        raise ValueError(error_msg)
+    print(f"[INFO] Found {len(hostnames)} cluster hostnames")
+    trie = whitelist.SuffixTrie()
+    trie.add(hostnames)
+    whitelist_regex = whitelist.build_whitelist(trie, WHITELIST_MAX_ALTERNATIVES)
+    try:
+        result = whitelist.check_whitelist(whitelist_regex, list(trie.samples.values()), WHITELIST_MAX_MATCH_US)
+    except ValueError as e:
+        print(f"[ERROR] Generated whitelist failed its checks, not applying it: {e}")
+        raise
+    whitelist.print_benchmark('Generated whitelist', result)
+
+    def update_knox_whitelist(cluster_name, config_type, client):
+        properties, attributes = snapshot.get(config_type)
+        properties['gateway.dispatch.whitelist'] = whitelist_regex
+        print(f"[INFO] Setting gateway.dispatch.whitelist = {whitelist_regex}")
+        return properties, attributes
+    try:
+        if change_set is not None:
+            change_set.update('gateway-site', update_knox_whitelist)
+            print("[INFO] Knox whitelist planned for gateway-site.")
+            return
+        change = await client.update_config('gateway-site', update_knox_whitelist,
+                                            "Set Knox gateway.dispatch.whitelist for hostname pattern", snapshot)
+        if change.has_changes:
+            print(f"[SUCCESS] Knox whitelist property updated in gateway-site configuration ({change.summary()}).")
+        else:
+            print("[INFO] Knox whitelist already up to date in gateway-site; no new config version created.")
+    except Exception as e:
+        print(f"[ERROR] Failed to update gateway-site config: {e}")
+        raise
+
+async def _discover_hosts(client):
+    try:
+        return cluster._host_vars(await client.get_host_index())
+    except Exception as e:
+        print(f"[WARN] Could not fetch component hosts from Ambari API: {e}")
+        return {}
+
+async def _topology_snapshot(client):
+    try:
+        return await client.snapshot(cluster.TOPOLOGY_CONFIG_TYPES)
+    except Exception as e:
+        print(f"[WARN] Could not batch-load topology configs: {e}")
+        snapshot = configs.ClusterConfigSnapshot(client.cluster_name, None)
+        snapshot.prime({}, {})
+        return snapshot
+
+async def get_topology_vars(client, snapshot=None):
+    """
+    Async get_topology_vars: config-based discovery tasks run from one batched snapshot
+    while the host/component index is fetched concurrently on the event loop.
+    """
+    if snapshot is None:
+        snapshot, hosts = await asyncio.gather(_topology_snapshot(client), _discover_hosts(client))
+    else:
+        hosts = await _discover_hosts(client)
+    results = {HOST_INDEX_TASK: hosts}
+    for name, task in cluster.DISCOVERY_TASKS.items():
+        if name != HOST_INDEX_TASK:
+            results[name] = task(snapshot)
+    topology_vars = cluster._assemble_topology_vars(
+        results, f"{client.protocol}://{client.host}:{client.port}", client.host, str(client.port))
+    print("[DEBUG] Topology variables initialized:")
+    for k, v in topology_vars.items():
+        print(f"  {k}: {v}")
+    return topology_vars
+
+async def apply_topology_to_knox(client, rendered, snapshot=None, change_set=None):
+    """
+    Async apply_topology_to_knox for a topology.RenderedTopology; skipped when its sha256
+    matches the topology content already in Ambari.
+    """
+    snapshot = snapshot or await client.snapshot(['topology'])
+    if topology.is_current(rendered, snapshot):
+        print(f"[INFO] Knox advanced topology unchanged (sha256 {rendered.sha256[:12]}); skipping.")
+        return
+
+    def update_knox_topology(cluster_name, config_type, client):
+        properties, attributes = snapshot.get(config_type)
+        properties['content'] = rendered.xml
+        return properties, attributes
+    try:
+        if change_set is not None:
+            change_set.update('topology', update_knox_topology)
+            print("[INFO] Knox advanced topology planned.")
+            return
+        change = await client.update_config('topology', update_knox_topology,
+                                            'Update Knox advanced topology via automation', snapshot)
+        if change.has_changes:
+            print("[SUCCESS] Applied advanced topology to Knox via Ambari API.")
+        else:
+            print("[INFO] Knox advanced topology already up to date; no new config version created.")
+    except Exception as e:
+        print(f"[ERROR] Failed to apply topology to Knox: {e}")
+
+async def configure_knox(client=None):
+    """
+    Async configure_knox. Fetches every config it needs in one snapshot, plans the core-site,
+    gateway-site and topology changes concurrently, then submits them in one PUT.
+    """
+    if client is None:
+        async with AsyncAmbariClient.from_params() as client:
+            return await configure_knox(client)
+    print("[INFO] Running Knox configuration steps (async)...")
+    snapshot = await client.snapshot(cluster.KNOX_CONFIG_TYPES + cluster.TOPOLOGY_CONFIG_TYPES)
+    change_set = configs.ConfigChangeSet(client.cluster_name, None, snapshot)
+    _, _, topology_vars = await asyncio.gather(
+        set_knox_proxy_users(client, snapshot, change_set),
+        set_knox_whitelist(client, snapshot, change_set),
+        get_topology_vars(client, snapshot))
+    await apply_topology_to_knox(client, topology.render(topology_vars), snapshot, change_set)
+    cluster.report_change_set(await client.apply_change_set(change_set, cluster.KNOX_VERSION_NOTE))
@@ -1,20 +1,153 @@
-import requests
-from .params import AMBARI_BASE_URL, USERNAME, PASSWORD, CLUSTER_NAME
-import urllib3
-import json
+import threading
 import time
 
+_accessor = None
+_snapshot = None
+_host_index = None
+_host_index_time = None
+_host_index_lock = threading.Lock()
+
+# Config types read by get_topology_vars and configure_knox
+TOPOLOGY_CONFIG_TYPES = ['hdfs-site', 'admin-properties', 'infra-solr-env', 'yarn-site']
+KNOX_CONFIG_TYPES = ['core-site', 'gateway-site', 'topology']
+
+# All set_knox_whitelist needs from each host when it pages through them itself
+HOST_NAME_FIELDS = 'Hosts/host_name'
+
+# Shared version note for the single change set submitted by configure_knox
+KNOX_VERSION_NOTE = "Configure Knox gateway (proxyuser, whitelist, topology) via automation"
+
+# core-site properties set by set_knox_proxy_users
+KNOX_PROXYUSER_PROPERTIES = {
+    'hadoop.proxyuser.knox.groups': '*',
+    'hadoop.proxyuser.knox.hosts': '*'
+}
+
+
+def get_accessor():
+    """
+    Returns the shared configs.py API accessor for the configured Ambari server.
+    The accessor owns a keep-alive connection pool, so it is created once and
+    reused by every config read/write made during this process.
+    """
+    global _accessor
+    if _accessor is None:
+        from .params import AMBARI_HOST, PROTOCOL, PORT, MAX_CONNECTIONS, USERNAME, PASSWORD
+        from .params import REQUEST_TIMEOUT, REQUEST_DEADLINE, REQUEST_RETRIES
+        from .params import HEDGE_PERCENTILE, HEDGE_MIN_MS, HEDGE_INITIAL_MS
+        from . import configs
+        context = None
+        if PROTOCOL == configs.HTTPS_PROTOCOL:
+            from . import tls
+            context = tls.get_context(AMBARI_HOST, PORT)
+        _accessor = configs.api_accessor(
+            host=AMBARI_HOST,
+            login=USERNAME,
+            password=PASSWORD,
+            protocol=PROTOCOL,
+            port=PORT,
+            max_connections=MAX_CONNECTIONS,
+            context=context,
+            policy=configs.DEFAULT_POLICY._replace(
+                timeout=REQUEST_TIMEOUT,
+                deadline=REQUEST_DEADLINE or None,
+                retries=max(0, REQUEST_RETRIES),
+                hedge_percentile=HEDGE_PERCENTILE or None,
+                hedge_min_delay=HEDGE_MIN_MS / 1000.0,
+                hedge_initial_delay=HEDGE_INITIAL_MS / 1000.0)
+        )
+    return _accessor
+
+def get_snapshot():
+    """
+    Returns the shared ClusterConfigSnapshot: desired config tags are fetched once
+    per process and config bodies are batch-loaded and served from memory.
+    """
+    global _snapshot
+    if _snapshot is None:
+        from . import configs
+        from .params import CLUSTER_NAME
+        _snapshot = configs.ClusterConfigSnapshot(CLUSTER_NAME, get_accessor(), get_config_cache())
+    return _snapshot
+
+def get_config_cache(ambari_host=None, ambari_port=None, cluster_name=None):
+    """
+    Returns a persistent config_cache.ConfigCache for a cluster (default: the configured one),
+    or None when config_cache_max_mb is 0.
+    """
+    from .params import AMBARI_HOST, PORT, CLUSTER_NAME, CONFIG_CACHE_DIR, CONFIG_CACHE_MAX_MB
+    from .config_cache import ConfigCache
+    if CONFIG_CACHE_MAX_MB <= 0:
+        return None
+    return ConfigCache(ambari_host or AMBARI_HOST, ambari_port or PORT, cluster_name or CLUSTER_NAME,
+                       CONFIG_CACHE_DIR, CONFIG_CACHE_MAX_MB * 1024 * 1024)
+
+def get_host_index():
+    """
+    Returns the shared host_index.HostComponentIndex: every host and its components
+    are fetched once per process, in pages, and then looked up from memory.
+    """
+    global _host_index, _host_index_time
+    with _host_index_lock:
+        if _host_index is None:
+            from .host_index import HostComponentIndex
+            from . import tracing
+            print("[INFO] Fetching cluster hosts and components from Ambari API...")
+            index = HostComponentIndex()
+            for page, items in enumerate(iter_cluster_host_pages(), 1):
+                with tracing.phase('index hosts'):
+                    index.add_items(items)
+                print(f"[INFO] Page {page}: {len(items)} host(s), {len(index)} so far")
+            _host_index = index
+            _host_index_time = time.monotonic()
+    return _host_index
+
+def host_index_age():
+    """Seconds since the shared host index was fetched, or None if it has not been."""
+    if _host_index_time is None:
+        return None
+    return time.monotonic() - _host_index_time
+
+def reset_host_index():
+    """Drops the shared host index; the next get_host_index() fetches it again."""
+    global _host_index, _host_index_time
+    with _host_index_lock:
+        _host_index = None
+        _host_index_time = None
+
+def seed(accessor, snapshot, host_index):
+    """
+    Installs a ready-made accessor, ClusterConfigSnapshot and HostComponentIndex as the shared
+    ones, e.g. served from an offline snapshot file (see offline.py).
+    """
+    global _accessor, _snapshot, _host_index, _host_index_time
+    with _host_index_lock:
+        _accessor = accessor
+        _snapshot = snapshot
+        _host_index = host_index
+        _host_index_time = time.monotonic()
+
+def print_cache_stats():
+    if _snapshot is not None and _snapshot.cache is not None:
+        print(f"[INFO] Config cache: {_snapshot.cache.summary()}")
+    pool = getattr(_accessor, 'pool', None)
+    if pool is not None and (pool.retried or pool.hedged):
+        print(f"[INFO] Ambari GETs: {pool.retried} retried, {pool.hedged} hedged ({pool.hedge_wins} won by the hedge)")
+    if pool is not None and pool.context is not None:
+        from . import tls
+        for line in tls.summary():
+            print(f"[INFO] TLS {line}")
 
 def get_ambari_cluster_name():
     """
     Fetches the cluster name from Ambari via API call.
     Returns the cluster name as a string, or None if not found.
     """
+    import json
     try:
-        url = f"{AMBARI_BASE_URL}/api/v1/clusters"
-        response = requests.get(url, auth=(USERNAME, PASSWORD), timeout=10)
-        if response.status_code == 200:
-            data = response.json()
+        status, body = get_accessor().fetch("/api/v1/clusters?fields=Clusters/cluster_name")
+        if status == 200:
+            data = json.loads(body)
             items = data.get('items', [])
             if items and 'Clusters' in items[0] and 'cluster_name' in items[0]['Clusters']:
                 return items[0]['Clusters']['cluster_name']
@@ -23,203 +156,131 @@ def get_ambari_cluster_name():
         return None
 
 def is_knox_installed():
-    url = f"{AMBARI_BASE_URL}/api/v1/clusters/{CLUSTER_NAME}/services/KNOX"
-    if AMBARI_BASE_URL.startswith('https'):
-        try:
-            response = requests.get(url, auth=(USERNAME, PASSWORD), timeout=10)
-        except requests.exceptions.SSLError:
-            print("[WARN] SSL verification failed. Retrying with SSL verification disabled.")
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-            response = requests.get(url, auth=(USERNAME, PASSWORD), timeout=10, verify=False)
-    else:
-        response = requests.get(url, auth=(USERNAME, PASSWORD), timeout=10)
+    # Goes through the shared http.client accessor (one keep-alive pool and TLS context per server)
+    import json
+    from .params import CLUSTER_NAME
+    # ServiceInfo/service_name is enough to tell it exists; the full resource lists every component
+    status, body = get_accessor().fetch(f"/api/v1/clusters/{CLUSTER_NAME}/services/KNOX?fields=ServiceInfo/service_name")
     try:
-        data = response.json()
+        data = json.loads(body)
     except Exception:
         data = {}
     # Check for 404 or error message in response
-    if response.status_code == 404 or (
+    if status == 404 or (
         isinstance(data, dict) and data.get('status') == 404 and 'Service not found' in data.get('message', '')):
         return False
     # Check for ServiceInfo in response (Knox present)
-    if response.status_code == 200 and 'ServiceInfo' in data:
+    if status == 200 and 'ServiceInfo' in data:
         return True
     # Fallback: treat as not installed if not clear
     return False
 
-def set_knox_proxy_users():
+def set_knox_proxy_users(change_set=None):
     """
     Adds/updates proxyuser.knox.* properties in core-site (Hadoop) via Ambari API using configs.py logic.
     Sets proxyuser.knox.groups=* and proxyuser.knox.hosts=*
+    With a configs.ConfigChangeSet the change is only planned; the caller applies the set.
     """
-    from .params import AMBARI_HOST, USERNAME, PASSWORD, PROTOCOL, PORT, CLUSTER_NAME
     from . import configs
+    from .params import CLUSTER_NAME
     print("[INFO] Configuring Knox proxyuser in Hadoop core-site via Ambari API using configs.py...")
     try:
-        accessor = configs.api_accessor(
-            host=AMBARI_HOST,
-            login=USERNAME,
-            password=PASSWORD,
-            protocol=PROTOCOL,
-            port=PORT,
-            unsafe=True
-        )
+        accessor = get_accessor()
         version_note = "Set proxyuser.knox.* for Knox gateway"
         def update_proxyuser_knox(cluster, config_type, accessor):
             try:
-                properties, attributes = configs.get_current_config(cluster, config_type, accessor)
+                properties, attributes = get_snapshot().get(config_type)
             except Exception as e:
                 print(f"[ERROR] Failed to fetch current core-site config: {e}")
                 raise
-            properties['hadoop.proxyuser.knox.groups'] = '*'
-            properties['hadoop.proxyuser.knox.hosts'] = '*'
+            properties.update(KNOX_PROXYUSER_PROPERTIES)
             return properties, attributes
         try:
-            configs.update_config(
+            if change_set is not None:
+                change_set.update('core-site', update_proxyuser_knox)
+                print("[INFO] Knox proxyuser properties planned for core-site.")
+                return
+            change = configs.update_config(
                 cluster=CLUSTER_NAME,
                 config_type='core-site',
                 config_updater=update_proxyuser_knox,
                 accessor=accessor,
-                version_note=version_note
+                version_note=version_note,
+                snapshot=get_snapshot()
             )
-            print("[SUCCESS] Knox proxyuser properties updated in core-site using configs.py.")
+            if change.has_changes:
+                print(f"[SUCCESS] Knox proxyuser properties updated in core-site using configs.py ({change.summary()}).")
+            else:
+                print("[INFO] Knox proxyuser properties already set in core-site; no new config version created.")
         except Exception as e:
             print(f"[ERROR] Failed to update core-site config: {e}")
     except Exception as e:
         print(f"[ERROR] Unexpected error in set_knox_proxy_users: {e}")
 
-def set_knox_whitelist():
+def set_knox_whitelist(change_set=None):
     """
     Configures Knox gateway.dispatch.whitelist property in Advanced gateway-site configuration
     based on hostname patterns discovered from cluster hosts via Ambari API.
     
-    Fetches all cluster hostnames, analyzes them for common domain patterns,
-    and generates appropriate whitelist regex if a consistent pattern is found.
+    Feeds every cluster hostname into a domain suffix trie and generates a whitelist regex
+    covering every domain found (see whitelist.py). Hosts are paged in asking for their names
+    only, each page going into the trie as it arrives, unless the shared host/component index
+    is already loaded (configure_knox, the daemon, --snapshot) and can be reused.
+    With a configs.ConfigChangeSet the change is only planned; the caller applies the set.
     """
-    from .params import AMBARI_HOST, USERNAME, PASSWORD, PROTOCOL, PORT, CLUSTER_NAME, AMBARI_BASE_URL
-    from . import configs
-    import requests
-    import urllib3
+    from . import configs, tracing, whitelist
+    from .params import CLUSTER_NAME, WHITELIST_MAX_ALTERNATIVES, WHITELIST_MAX_MATCH_US
     
     print("[INFO] Configuring Knox whitelist based on cluster hostname patterns...")
     
-    # Create accessor for API calls
+    # Shared accessor for API calls
     try:
-        accessor = configs.api_accessor(
-            host=AMBARI_HOST,
-            login=USERNAME,
-            password=PASSWORD,
-            protocol=PROTOCOL,
-            port=PORT,
-            unsafe=True
-        )
+        accessor = get_accessor()
     except Exception as e:
         print(f"[ERROR] Failed to create API accessor: {e}")
         raise
     
-    # Fetch all cluster hostnames via Ambari API
+    trie = whitelist.SuffixTrie()
     try:
-        print("[INFO] Fetching cluster hostnames from Ambari API...")
-        hosts_url = f"{AMBARI_BASE_URL}/api/v1/clusters/{CLUSTER_NAME}/hosts"
-        
-        if AMBARI_BASE_URL.startswith('https'):
-            try:
-                response = requests.get(hosts_url, auth=(USERNAME, PASSWORD), timeout=10)
-            except requests.exceptions.SSLError:
-                print("[WARN] SSL verification failed. Retrying with SSL verification disabled.")
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                response = requests.get(hosts_url, auth=(USERNAME, PASSWORD), timeout=10, verify=False)
+        if _host_index is not None:
+            trie.add(get_host_index().hostnames)
         else:
-            response = requests.get(hosts_url, auth=(USERNAME, PASSWORD), timeout=10)
-        
-        if response.status_code != 200:
-            error_msg = f"[ERROR] Failed to fetch cluster hosts. Status: {response.status_code}"
-            print(error_msg)
-            raise ValueError(error_msg)
-        
-        hosts_data = response.json()
-        hostnames = []
-        
-        for item in hosts_data.get('items', []):
-            hostname = item.get('Hosts', {}).get('host_name')
-            if hostname:
-                hostnames.append(hostname)
-        
-        if not hostnames:
+            print("[INFO] Fetching cluster hostnames from Ambari API...")
+            for page, items in enumerate(iter_cluster_host_pages(HOST_NAME_FIELDS), 1):
+                with tracing.phase('build whitelist'):
+                    trie.add(item['Hosts']['host_name'] for item in items)
+                print(f"[INFO] Page {page}: {len(items)} host(s), {trie.hosts + trie.skipped} so far")
+
+        if not trie.hosts + trie.skipped:
             error_msg = "[ERROR] No hostnames found in cluster"
             print(error_msg)
             raise ValueError(error_msg)
-        
-        print(f"[INFO] Found {len(hostnames)} cluster hostnames: {hostnames}")
-        
+
+        print(f"[INFO] Found {trie.hosts + trie.skipped} cluster hostnames")
+
     except Exception as e:
         print(f"[ERROR] Failed to fetch cluster hostnames: {e}")
         raise
-    
-    # Analyze hostnames for common domain pattern
-    print("[INFO] Analyzing hostnames for common domain patterns...")
-    
-    # Extract domain suffixes (last 2 parts when split by '.')
-    domain_suffixes = []
-    valid_hostnames = []
-    
-    for hostname in hostnames:
-        parts = hostname.split('.')
-        if len(parts) >= 3:  # Must have at least 3 parts for FQDN
-            domain_suffix = '.'.join(parts[-2:])  # Get last 2 parts
-            domain_suffixes.append(domain_suffix)
-            valid_hostnames.append(hostname)
-            print(f"[DEBUG] {hostname} → domain suffix: {domain_suffix}")
-        else:
-            print(f"[WARN] Skipping hostname with insufficient parts: {hostname} ({len(parts)} parts)")
-    
-    if not domain_suffixes:
-        error_msg = "[ERROR] No valid FQDNs found in cluster hostnames. All hostnames must have at least 3 parts (hostname.domain.tld)"
-        print(error_msg)
-        raise ValueError(error_msg)
-    
-    # Check if all domain suffixes are the same
-    unique_suffixes = set(domain_suffixes)
-    
-    if len(unique_suffixes) == 1:
-        # All hostnames share the same domain suffix
-        common_domain = list(unique_suffixes)[0]
-        print(f"[SUCCESS] Found common domain pattern: {common_domain}")
-        
-        # Generate whitelist regex pattern
-        escaped_domain = common_domain.replace(".", "\\.")
-        whitelist_regex = f'^https?:\\/\\/(.+\\.{escaped_domain}):[0-9]+\\/?.*$'
-        
-        print(f"[INFO] Generated whitelist regex: {whitelist_regex}")
-        
-    elif len(unique_suffixes) > 1:
-        # Multiple different domain suffixes found
-        error_msg = f"[ERROR] Multiple domain suffixes found in cluster hostnames: {unique_suffixes}. Cannot generate consistent whitelist pattern."
-        print(error_msg)
-        print(f"[INFO] Hostnames analyzed: {valid_hostnames}")
-        raise ValueError(error_msg)
-    
-    else:
-        # This shouldn't happen, but just in case
-        error_msg = "[ERROR] Unexpected error in domain suffix analysis"
-        print(error_msg)
-        raise ValueError(error_msg)
-    
+
+    with tracing.phase('build whitelist'):
+        whitelist_regex = whitelist.build_whitelist(trie, WHITELIST_MAX_ALTERNATIVES)
+
+    # Never apply a whitelist that misses a domain, lets a rejection probe through or is slow to match;
+    # it is checked against the first host seen in every domain
+    try:
+        with tracing.phase('check whitelist'):
+            result = whitelist.check_whitelist(whitelist_regex, list(trie.samples.values()), WHITELIST_MAX_MATCH_US)
+    except ValueError as e:
+        print(f"[ERROR] Generated whitelist failed its checks, not applying it: {e}")
+        raise
+    whitelist.print_benchmark('Generated whitelist', result)
+
     try:
-        accessor = configs.api_accessor(
-            host=AMBARI_HOST,
-            login=USERNAME,
-            password=PASSWORD,
-            protocol=PROTOCOL,
-            port=PORT,
-            unsafe=True
-        )
-        
         version_note = "Set Knox gateway.dispatch.whitelist for hostname pattern"
         
         def update_knox_whitelist(cluster, config_type, accessor):
             try:
-                properties, attributes = configs.get_current_config(cluster, config_type, accessor)
+                properties, attributes = get_snapshot().get(config_type)
             except Exception as e:
                 print(f"[ERROR] Failed to fetch current gateway-site config: {e}")
                 raise
@@ -231,14 +292,22 @@ def set_knox_whitelist():
             return properties, attributes
         
         try:
-            configs.update_config(
+            if change_set is not None:
+                change_set.update('gateway-site', update_knox_whitelist)
+                print("[INFO] Knox whitelist planned for gateway-site.")
+                return
+            change = configs.update_config(
                 cluster=CLUSTER_NAME,
                 config_type='gateway-site',
                 config_updater=update_knox_whitelist,
                 accessor=accessor,
-                version_note=version_note
+                version_note=version_note,
+                snapshot=get_snapshot()
             )
-            print("[SUCCESS] Knox whitelist property updated in gateway-site configuration.")
+            if change.has_changes:
+                print(f"[SUCCESS] Knox whitelist property updated in gateway-site configuration ({change.summary()}).")
+            else:
+                print("[INFO] Knox whitelist already up to date in gateway-site; no new config version created.")
         except Exception as e:
             print(f"[ERROR] Failed to update gateway-site config: {e}")
             raise
@@ -247,36 +316,117 @@ def set_knox_whitelist():
         print(f"[ERROR] Unexpected error in set_knox_whitelist: {e}")
         raise
 
-def flush_topology_to_local(topology_vars):
+def benchmark_knox_whitelist():
     """
-    Renders the advanced topology Jinja template using topology_vars and writes the output to a local file.
+    Builds the whitelist regex for the cluster without applying it, and times it
+    (and the legacy single-domain pattern, when one applies) against every host URL.
     """
-    from jinja2 import Environment, FileSystemLoader
-    import os
-    template_dir = os.path.join(os.path.dirname(__file__), '../templates')
-    env = Environment(loader=FileSystemLoader(template_dir))
-    template = env.get_template('advaned_topology_template.j2')
-    rendered = template.render(**topology_vars)
-    output_path = os.path.join(os.path.dirname(__file__), '../rendered_topology.xml')
-    with open(output_path, 'w') as f:
-        f.write(rendered)
-    print(f"[SUCCESS] Rendered topology written to {output_path}")
+    from .params import WHITELIST_MAX_ALTERNATIVES
+    from . import whitelist
+
+    print("[INFO] Benchmarking Knox whitelist against cluster hostnames...")
+    hostnames = get_host_index().hostnames
+    whitelist_regex = whitelist.build_whitelist_regex(hostnames, WHITELIST_MAX_ALTERNATIVES)
+    whitelist.print_benchmark('Generated whitelist', whitelist.benchmark_whitelist(whitelist_regex, hostnames))
+    common_suffix = whitelist.common_suffix(hostnames)
+    if common_suffix:
+        legacy_regex = whitelist.legacy_whitelist(common_suffix)
+        whitelist.print_benchmark('Legacy whitelist', whitelist.benchmark_whitelist(legacy_regex, hostnames))
+    else:
+        print("[INFO] Hosts span several domain suffixes; the legacy pattern could not be generated for comparison.")
+    return whitelist_regex
+
+def iter_cluster_host_pages(fields=None, page_size=None):
+    """
+    Streams cluster hosts from Ambari one page at a time, requesting only `fields`
+    (default: host names and their component names) and no hrefs (minimal_response).
+    Yields the list of items per page.
+    """
+    from .params import CLUSTER_NAME, HOSTS_PAGE_SIZE
+    from .host_index import HOST_COMPONENTS_FIELDS
+    from . import tracing
+    from urllib.parse import urlencode
+    import json
+    fields = fields or HOST_COMPONENTS_FIELDS
+    page_size = page_size or HOSTS_PAGE_SIZE
+    # Same keep-alive pool and TLS context (see tls.py) as every other Ambari call
+    accessor = get_accessor()
+    start = 0
+    while True:
+        query = urlencode({'fields': fields, 'minimal_response': 'true', 'page_size': page_size, 'from': start},
+                          safe='/,')
+        status, body = accessor.fetch(f"/api/v1/clusters/{CLUSTER_NAME}/hosts?{query}")
+
+        if status != 200:
+            error_msg = f"[ERROR] Failed to fetch cluster hosts. Status: {status}"
+            print(error_msg)
+            raise ValueError(error_msg)
+
+        with tracing.phase('parse hosts'):
+            items = json.loads(body).get('items', [])
+        yield items
+        if len(items) < page_size:
+            return
+        start += page_size
+
+def render_topology(topology_vars):
+    """
+    Renders the advanced topology Jinja template using topology_vars and returns the XML.
+    """
+    from . import topology
+    return topology.render(topology_vars).xml
+
+def flush_topology_to_local(topology_vars, output_path=None):
+    """
+    Renders the advanced topology Jinja template using topology_vars and writes the output to a local file
+    (default rendered_topology.xml). The file is only an artifact; apply_topology_to_knox does not need it.
+    """
+    from . import topology
+    return topology.write_artifact(topology.render(topology_vars), output_path)
 
 def configure_knox():
     """
     Calls set_knox_proxy_users, set_knox_whitelist and will call other Knox configuration functions as needed.
     """
+    from . import configs
+    from .params import CLUSTER_NAME
     print("[INFO] Running Knox configuration steps...")
-    set_knox_proxy_users()
-    set_knox_whitelist()
+    # One desired_configs lookup and one batched fetch for every config type used below
+    try:
+        get_snapshot().load(KNOX_CONFIG_TYPES + TOPOLOGY_CONFIG_TYPES)
+    except Exception as e:
+        print(f"[WARN] Could not preload cluster configs: {e}")
+    # Plan every change first, then submit them together as one coherent config version
+    change_set = configs.ConfigChangeSet(CLUSTER_NAME, get_accessor(), get_snapshot())
+    # Discovery loads the host/component index first, so set_knox_whitelist reuses it instead of
+    # paging through the hosts a second time
     topology_vars = get_topology_vars()
-    flush_topology_to_local(topology_vars)
-    apply_topology_to_knox()
-    # Future: call other Knox-related configuration functions here
+    set_knox_proxy_users(change_set)
+    set_knox_whitelist(change_set)
+    apply_topology_to_knox(change_set, topology_vars)
+    # Future: plan other Knox-related configuration changes here
+    report_change_set(change_set.apply(KNOX_VERSION_NOTE))
+
+def report_change_set(diffs):
+    """
+    Prints the outcome of an applied configs.ConfigChangeSet.
+    """
+    changed = [diff for diff in diffs if diff.has_changes]
+    for diff in diffs:
+        if diff.has_changes:
+            print(f"[SUCCESS] {diff.config_type} updated ({diff.summary()}).")
+        else:
+            print(f"[INFO] {diff.config_type} already up to date.")
+    if changed:
+        print(f"[SUCCESS] Applied {len(changed)} config type(s) in one request (tag {changed[0].tag}).")
+    else:
+        print("[INFO] Knox configuration already up to date; no new config versions created.")
 
-def get_topology_vars():
+def get_topology_vars(max_workers=None):
     """
     Prepares to apply the advanced topology template by collecting all required variables.
+    Service discovery runs as independent DISCOVERY_TASKS on a thread pool of
+    max_workers threads (default: discovery_workers in config.ini).
     
     Variables needed from the Jinja template (excluding those inside {% raw %} tags):
     - ambariui_protocol
@@ -301,183 +451,251 @@ def get_topology_vars():
     - is_ranger_installed
     - is_solr_installed
     """
-    from .params import AMBARI_HOST, AMBARI_BASE_URL, PORT
-    ambariws_protocol = 'ws'  # as per user instruction
-    ambariws_host = AMBARI_HOST
-    ambariws_port = PORT
-    # Placeholders for the rest, to be filled in next steps
-    ranger_protocol = None
-    ranger_host = None
-    ranger_port = None
-    rangerui_protocol = None
-    rangerui_host = None
-    rangerui_port = None
-    solr_protocol = None
-    solr_host = None
-    solr_port = None
-    hdfsui_protocol = None
+    topology_vars = build_topology_vars(run_discovery(max_workers=max_workers))
+    print("[DEBUG] Topology variables initialized:")
+    for k, v in topology_vars.items():
+        print(f"  {k}: {v}")
+    return topology_vars
+
+def run_discovery(task_names=None, max_workers=None):
+    """
+    Runs the named DISCOVERY_TASKS (default: all of them) concurrently and returns
+    their topology_vars fragments keyed by task name. A failed task yields {}.
+    """
+    from .params import DISCOVERY_WORKERS
+    from concurrent.futures import ThreadPoolExecutor
+    task_names = list(DISCOVERY_TASKS) if task_names is None else list(task_names)
+    snapshot = get_snapshot()
+    # All config types these tasks read are fetched in one batch by whichever task reads first
+    snapshot.expect([t for name in task_names for t in DISCOVERY_CONFIG_TYPES[name]])
+    workers = max_workers or DISCOVERY_WORKERS
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(name, executor.submit(DISCOVERY_TASKS[name], snapshot)) for name in task_names]
+        for name, future in futures:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"[WARN] Discovery task '{name}' failed: {e}")
+                results[name] = {}
+    return results
+
+def build_topology_vars(results):
+    """Builds the template's topology_vars from run_discovery() fragments."""
+    from .params import AMBARI_BASE_URL, AMBARI_HOST, PORT
+    return _assemble_topology_vars(results, AMBARI_BASE_URL, AMBARI_HOST, PORT)
+
+def _hdfs_vars(hdfs_site):
+    hdfsui_protocol = 'https' if hdfs_site.get('dfs.http.policy', '').lower() == 'https_only' else 'http'
+    # Try both dfs.namenode.{protocol}-address and dfs.namenode.http-address/dfs.namenode.https-address for compatibility
     hdfsui_host = None
     hdfsui_port = None
-    is_namenode_ha = False
-    is_ranger_installed = False
-    is_solr_installed = False
+    address_key = f'dfs.namenode.{hdfsui_protocol}-address'
+    if address_key in hdfs_site:
+        address = hdfs_site[address_key]
+        if ':' in address:
+            hdfsui_host, hdfsui_port = address.split(':', 1)
+    else:
+        # Fallback to legacy keys
+        legacy_key = 'dfs.namenode.https-address' if hdfsui_protocol == 'https' else 'dfs.namenode.http-address'
+        if legacy_key in hdfs_site:
+            address = hdfs_site[legacy_key]
+            if ':' in address:
+                hdfsui_host, hdfsui_port = address.split(':', 1)
+    return {'hdfsui_protocol': hdfsui_protocol, 'hdfsui_port': hdfsui_port}
+
+def _ranger_vars(ranger_admin_properties):
+    ranger_base_url = ranger_admin_properties.get('policymgr_external_url', None)
+    return {
+        'is_ranger_installed': True,
+        'ranger_base_url': ranger_base_url,
+        'rangerui_base_url': ranger_base_url
+    }
+
+def _solr_vars(solr_env):
+    return {
+        'is_solr_installed': True,
+        'solr_protocol': 'https' if solr_env.get('infra_solr_ssl_enabled', 'false').lower() == 'true' else 'http',
+        'solr_port': solr_env.get('infra_solr_port', None)
+    }
+
+def _yarn_vars(yarn_site):
+    yarn_log_url = yarn_site.get('yarn.log.server.web-service.url', None)
     yarnui_protocol = None
     yarnui_host = None
     yarnui_port = None
+    if yarn_log_url:
+        # Remove everything from /ws onward
+        import re
+        match = re.match(r'^(https?)://([^:/]+)(?::(\d+))?', yarn_log_url)
+        if match:
+            yarnui_protocol = match.group(1)
+            yarnui_host = match.group(2)
+            yarnui_port = match.group(3)
+    return {'yarnui_protocol': yarnui_protocol, 'yarnui_host': yarnui_host, 'yarnui_port': yarnui_port}
 
-    from . import configs
-    protocol = AMBARI_BASE_URL.split(':')[0]  # Extract protocol from AMBARI_BASE_URL
-    accessor = configs.api_accessor(
-        host=AMBARI_HOST,
-        login=USERNAME,
-        password=PASSWORD,
-        protocol=protocol,
-        port=ambariws_port,
-        unsafe=True
-    )
-    # Example: Fetch hdfs-site, ranger-admin-site, solr-env, and custom config types
+def _host_vars(host_index):
+    return {
+        'namenode_host': host_index.first_host('NAMENODE'),
+        'is_namenode_ha': host_index.is_namenode_ha,
+        'solr_host': host_index.first_host('INFRA_SOLR')
+    }
+
+def _discover_hdfs(snapshot):
     try:
-        hdfs_site, _ = configs.get_current_config(CLUSTER_NAME, 'hdfs-site', accessor)
-        hdfsui_protocol = 'https' if hdfs_site.get('dfs.http.policy', '').lower() == 'https_only' else 'http'
-        # Try both dfs.namenode.{protocol}-address and dfs.namenode.http-address/dfs.namenode.https-address for compatibility
-        hdfsui_host = None
-        hdfsui_port = None
-        address_key = f'dfs.namenode.{hdfsui_protocol}-address'
-        if address_key in hdfs_site:
-            address = hdfs_site[address_key]
-            if ':' in address:
-                hdfsui_host, hdfsui_port = address.split(':', 1)
-        else:
-            # Fallback to legacy keys
-            legacy_key = 'dfs.namenode.https-address' if hdfsui_protocol == 'https' else 'dfs.namenode.http-address'
-            if legacy_key in hdfs_site:
-                address = hdfs_site[legacy_key]
-                if ':' in address:
-                    hdfsui_host, hdfsui_port = address.split(':', 1)
-        # Use Ambari API to get NameNode host
-        namenode_host = None
-        nn_service_url = f"{AMBARI_BASE_URL}/api/v1/clusters/{CLUSTER_NAME}/hosts?host_components/HostRoles/component_name=NAMENODE"
-        try:
-            response = requests.get(nn_service_url, auth=(USERNAME, PASSWORD), timeout=10, verify=False)
-            if response.status_code == 200:
-                data = response.json()
-                items = data.get('items', [])
-                if items:
-                    namenode_host = items[0]['Hosts']['host_name']
-        except Exception as e:
-            print(f"[WARN] Could not fetch NameNode host from Ambari API: {e}")
+        hdfs_site, _ = snapshot.get('hdfs-site')
     except Exception as e:
         print(f"[WARN] Could not fetch hdfs-site: {e}")
+        return {}
+    return _hdfs_vars(hdfs_site)
 
+def _discover_hosts(snapshot):
+    # NameNode/Solr hosts and NameNode HA come from the shared host/component index
     try:
-        ranger_admin_properties, _ = configs.get_current_config(CLUSTER_NAME, 'admin-properties', accessor)
-        is_ranger_installed = True
-        ranger_base_url = ranger_admin_properties.get('policymgr_external_url', None)
-        rangerui_base_url = ranger_base_url
+        return _host_vars(get_host_index())
+    except Exception as e:
+        print(f"[WARN] Could not fetch component hosts from Ambari API: {e}")
+        return {}
 
+def _discover_ranger(snapshot):
+    try:
+        ranger_admin_properties, _ = snapshot.get('admin-properties')
     except Exception as e:
         print(f"[INFO] Ranger not installed or could not fetch ranger-admin-site: {e}")
-        is_ranger_installed = False
+        return {'is_ranger_installed': False}
+    return _ranger_vars(ranger_admin_properties)
 
+def _discover_solr(snapshot):
     try:
-        solr_env, _ = configs.get_current_config(CLUSTER_NAME, 'infra-solr-env', accessor)
-        is_solr_installed = True
-        solr_protocol = 'https' if solr_env.get('infra_solr_ssl_enabled', 'false').lower() == 'true' else 'http'
-        # Use Ambari API to get Solr host
-        solr_host = None
-        solr_port = solr_env.get('infra_solr_port', None)
-        try:
-            solr_service_url = f"{AMBARI_BASE_URL}/api/v1/clusters/{CLUSTER_NAME}/hosts?host_components/HostRoles/component_name=INFRA_SOLR"
-            response = requests.get(solr_service_url, auth=(USERNAME, PASSWORD), timeout=10, verify=False)
-            if response.status_code == 200:
-                data = response.json()
-                items = data.get('items', [])
-                if items:
-                    solr_host = items[0]['Hosts']['host_name']
-        except Exception as e:
-            print(f"[WARN] Could not fetch Solr host from Ambari API: {e}")
+        solr_env, _ = snapshot.get('infra-solr-env')
     except Exception as e:
         print(f"[INFO] Solr not installed or could not fetch infra-solr-env: {e}")
-        is_solr_installed = False
+        return {'is_solr_installed': False}
+    return _solr_vars(solr_env)
 
+def _discover_yarn(snapshot):
     try:
-        yarn_site, _ = configs.get_current_config(CLUSTER_NAME, 'yarn-site', accessor)
-        yarn_log_url = yarn_site.get('yarn.log.server.web-service.url', None)
-        yarnui_protocol = None
-        yarnui_host = None
-        yarnui_port = None
-        if yarn_log_url:
-            # Remove everything from /ws onward
-            import re
-            match = re.match(r'^(https?)://([^:/]+)(?::(\d+))?', yarn_log_url)
-            if match:
-                yarnui_protocol = match.group(1)
-                yarnui_host = match.group(2)
-                yarnui_port = match.group(3)
+        yarn_site, _ = snapshot.get('yarn-site')
+        return _yarn_vars(yarn_site)
     except Exception as e:
         print(f"[WARN] Could not fetch yarn-site or parse yarn.log.server.web-service.url: {e}")
+        return {}
 
-    topology_vars = {
-        'ambari_ui_url': AMBARI_BASE_URL,
-        'ambariws_protocol': ambariws_protocol,
-        'ambariws_host': ambariws_host,
-        'ambariws_port': ambariws_port,
-        'ranger_base_url': ranger_base_url,
-        'rangerui_base_url': rangerui_base_url,
-        'solr_protocol': solr_protocol,
-        'solr_host': solr_host,
-        'solr_port': solr_port,
-        'hdfsui_protocol': hdfsui_protocol,
-        'hdfsui_host': namenode_host,
-        'hdfsui_port': hdfsui_port,
-        'namenode_host': namenode_host,
-        'yarnui_protocol': yarnui_protocol,
-        'yarnui_host': yarnui_host,
-        'yarnui_port': yarnui_port,
-        'is_namenode_ha': is_namenode_ha,
-        'is_ranger_installed': is_ranger_installed,
-        'is_solr_installed': is_solr_installed
+# Independent service-discovery tasks run by get_topology_vars; each returns a fragment of topology_vars
+DISCOVERY_TASKS = {
+    'hdfs': _discover_hdfs,
+    'hosts': _discover_hosts,
+    'ranger': _discover_ranger,
+    'solr': _discover_solr,
+    'yarn': _discover_yarn,
+}
+
+# Config types each discovery task reads. A task only has to run again when one of their
+# desired_configs tags moves; 'hosts' reads the host/component index instead.
+DISCOVERY_CONFIG_TYPES = {
+    'hdfs': ['hdfs-site'],
+    'hosts': [],
+    'ranger': ['admin-properties'],
+    'solr': ['infra-solr-env'],
+    'yarn': ['yarn-site'],
+}
+
+def _assemble_topology_vars(results, ambari_base_url, ambari_host, ambari_port):
+    """
+    Merges discovery task fragments (keyed by task name) into the topology_vars dict the template expects.
+    """
+    discovered = {
+        'ranger_base_url': None,
+        'rangerui_base_url': None,
+        'solr_protocol': None,
+        'solr_host': None,
+        'solr_port': None,
+        'hdfsui_protocol': None,
+        'hdfsui_port': None,
+        'namenode_host': None,
+        'yarnui_protocol': None,
+        'yarnui_host': None,
+        'yarnui_port': None,
+        'is_namenode_ha': False,
+        'is_ranger_installed': False,
+        'is_solr_installed': False
+    }
+    for name in DISCOVERY_TASKS:
+        discovered.update(results.get(name, {}))
+    if not discovered['is_solr_installed']:
+        discovered['solr_host'] = None
+    return {
+        'ambari_ui_url': ambari_base_url,
+        'ambariws_protocol': 'ws',  # as per user instruction
+        'ambariws_host': ambari_host,
+        'ambariws_port': ambari_port,
+        'ranger_base_url': discovered['ranger_base_url'],
+        'rangerui_base_url': discovered['rangerui_base_url'],
+        'solr_protocol': discovered['solr_protocol'],
+        'solr_host': discovered['solr_host'],
+        'solr_port': discovered['solr_port'],
+        'hdfsui_protocol': discovered['hdfsui_protocol'],
+        'hdfsui_host': discovered['namenode_host'],
+        'hdfsui_port': discovered['hdfsui_port'],
+        'namenode_host': discovered['namenode_host'],
+        'yarnui_protocol': discovered['yarnui_protocol'],
+        'yarnui_host': discovered['yarnui_host'],
+        'yarnui_port': discovered['yarnui_port'],
+        'is_namenode_ha': discovered['is_namenode_ha'],
+        'is_ranger_installed': discovered['is_ranger_installed'],
+        'is_solr_installed': discovered['is_solr_installed']
     }
-    print("[DEBUG] Topology variables initialized:")
-    for k, v in topology_vars.items():
-        print(f"  {k}: {v}")
-    return topology_vars
 
-def apply_topology_to_knox():
+def apply_topology_to_knox(change_set=None, topology_vars=None, rendered=None):
     """
-    Reads the rendered topology XML from disk and applies it to Knox's advanced topology via Ambari API using configs.py.
+    Applies the advanced topology to Knox via Ambari API using configs.py. With topology_vars
+    the template is rendered in memory (unless the caller passes that render as `rendered`);
+    otherwise the rendered topology XML is read from disk.
+    Nothing is written or sent when its sha256 matches the topology content already in Ambari.
+    With a configs.ConfigChangeSet the change is only planned; the caller applies the set.
     """
-    from .params import AMBARI_HOST, USERNAME, PASSWORD, AMBARI_BASE_URL, CLUSTER_NAME, PORT
-    from . import configs
+    from . import configs, topology
+    from .params import CLUSTER_NAME, RENDERED_TOPOLOGY_PATH
     import os
-    rendered_path = os.path.join(os.path.dirname(__file__), '../rendered_topology.xml')
-    if not os.path.exists(rendered_path):
-        print(f"[ERROR] Rendered topology file not found at {rendered_path}")
-        return
-    with open(rendered_path, 'r') as f:
-        topology_xml = f.read()
+    if rendered is None and topology_vars is not None:
+        rendered = topology.render(topology_vars)
+    elif rendered is None:
+        rendered_path = RENDERED_TOPOLOGY_PATH or topology.DEFAULT_RENDERED_PATH
+        if not os.path.exists(rendered_path):
+            print(f"[ERROR] Rendered topology file not found at {rendered_path}")
+            return
+        with open(rendered_path, 'r') as f:
+            xml = f.read()
+        rendered = topology.RenderedTopology(xml, topology.content_hash(xml))
+    topology_xml = rendered.xml
     # Use configs.py to update Knox's advanced topology
     try:
-        accessor = configs.api_accessor(
-            host=AMBARI_HOST,
-            login=USERNAME,
-            password=PASSWORD,
-            protocol=AMBARI_BASE_URL.split(':')[0],
-            port=PORT,
-            unsafe=True
-        )
+        accessor = get_accessor()
+        if topology.is_current(rendered, get_snapshot()):
+            print(f"[INFO] Knox advanced topology unchanged (sha256 {rendered.sha256[:12]}); skipping.")
+            return
+        if topology_vars is not None and RENDERED_TOPOLOGY_PATH:
+            topology.write_artifact(rendered, RENDERED_TOPOLOGY_PATH)
         def update_knox_topology(cluster, config_type, accessor):
-            properties, attributes = configs.get_current_config(cluster, config_type, accessor)
+            properties, attributes = get_snapshot().get(config_type)
             # Set the 'content' property for the topology config type (Ambari/Knox expects this)
             properties['content'] = topology_xml
             return properties, attributes
-        configs.update_config(
+        if change_set is not None:
+            change_set.update('topology', update_knox_topology)
+            print("[INFO] Knox advanced topology planned.")
+            return
+        change = configs.update_config(
             cluster=CLUSTER_NAME,
             config_type='topology',  # This should match the config type used in Ambari for Knox topology
             config_updater=update_knox_topology,
             accessor=accessor,
-            version_note='Update Knox advanced topology via automation'
+            version_note='Update Knox advanced topology via automation',
+            snapshot=get_snapshot()
         )
+        if not change.has_changes:
+            print("[INFO] Knox advanced topology already up to date; no new config version created.")
+            return
         print("[SUCCESS] Applied advanced topology to Knox via Ambari API.")
         print("[INFO] If you want to verify, check the 'topology' config type in Ambari for the Knox service.")
     except Exception as e:
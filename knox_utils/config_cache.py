@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'knox-utility', 'configs')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ConfigCache:
+    """
+    On-disk cache of Ambari config bodies keyed by server, cluster, type and tag.
+
+    A (type, tag) version never changes once created, so entries never go stale; the
+    cache is only bounded in size. Reads bump an entry's mtime and eviction removes
+    the least recently used files first once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, ambari_host, ambari_port, cluster, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        namespace = re.sub(r'[^A-Za-z0-9._-]', '_', f"{ambari_host}_{ambari_port}_{cluster}")
+        self.path = os.path.join(self.cache_dir, namespace)
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _entry_path(self, config_type, tag):
+        safe_type = re.sub(r'[^A-Za-z0-9._-]', '_', config_type)
+        safe_tag = re.sub(r'[^A-Za-z0-9._-]', '_', tag)
+        return os.path.join(self.path, safe_type, f"{safe_tag}.json.gz")
+
+    def get(self, config_type, tag):
+        """Returns (properties, attributes) for a cached version, or None."""
+        path = self._entry_path(config_type, tag)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f, object_pairs_hook=OrderedDict)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry['properties'], entry['properties_attributes']
+
+    def put(self, config_type, tag, properties, attributes):
+        path = self._entry_path(config_type, tag)
+        tmp_path = None
+        try:
+            # A version cached before is replaced, not added to the total
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as f:
+                f.write(json.dumps({'properties': properties, 'properties_attributes': attributes}).encode('utf-8'))
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"[WARN] Could not write config cache entry {path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += size - previous
+            self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json.gz'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        if self._size is not None and self._size <= self.max_bytes:
+            return
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def summary(self):
+        return f"{self.hits} hit(s), {self.misses} miss(es)"
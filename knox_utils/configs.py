@@ -16,19 +16,27 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
-import optparse
-from optparse import OptionGroup
-from collections import OrderedDict
+from collections import OrderedDict, deque, namedtuple
 import sys
-import urllib.request, urllib.error, urllib.parse, ssl
+import urllib.error, urllib.parse, ssl
+import http.client
+import queue
+import random
+import select
+import threading
 import time
 import json
 import base64
-import xml
-import xml.etree.ElementTree as ET
+import copy
+import gzip
 import os
 import logging
 
+try:
+  from knox_utils import tracing
+except ImportError:
+  import tracing  # run as a script from knox_utils/
+
 logger = logging.getLogger('AmbariConfig')
 
 HTTP_PROTOCOL = 'http'
@@ -52,9 +60,32 @@ TAG = 'tag'
 ITEMS = 'items'
 TAG_PREFIX = 'version'
 
+# Connection pool defaults
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_TIMEOUT = 30
+
+# Config types fetched per batched configurations request (bounds the URL length)
+MAX_TYPES_PER_REQUEST = 20
+
+# Change journal (see knox_utils/journal.py). When set, every config version written is passed to
+# change_journal.append(ambari, cluster, tag, note, changes) with its property_changes();
+# ambari is the server's ambari_address(), as accessors carry it in their `ambari` attribute.
+change_journal = None
+
+# Config history (see knox_utils/history.py). When set, every version read from Ambari is passed to
+# config_history.observe(ambari, cluster, type, tag, properties, attributes) and every version
+# written to config_history.record(..., note).
+config_history = None
+
+# Only the parts of a config version that are read (no href, version or Config/stack_id)
+CONFIGURATION_FIELDS = 'type,tag,properties,properties_attributes'
+
 CLUSTERS_URL = '/api/v1/clusters/{0}'
 DESIRED_CONFIGS_URL = CLUSTERS_URL + '?fields=Clusters/desired_configs'
-CONFIGURATION_URL = CLUSTERS_URL + '/configurations?type={1}&tag={2}'
+# Only one type's desired_configs entry, rather than every type's
+DESIRED_CONFIG_URL = CLUSTERS_URL + '?fields=Clusters/desired_configs/{1}'
+CONFIGURATION_URL = CLUSTERS_URL + '/configurations?type={1}&tag={2}&fields=' + CONFIGURATION_FIELDS
+CONFIGURATIONS_URL = CLUSTERS_URL + '/configurations?{1}&fields=' + CONFIGURATION_FIELDS
 
 FILE_FORMAT = \
 """
@@ -74,74 +105,814 @@ class UsageException(Exception):
   pass
 
 
-def api_accessor(host, login, password, protocol, port, unsafe=None):
-  def do_request(api_url, request_type=GET_REQUEST_TYPE, request_body=None):
+class ConfigDiff(namedtuple('ConfigDiff', 'config_type added changed removed attributes_changed tag')):
+  """
+  Property-level difference between the live config and the one an updater produced.
+  tag is the new version's tag, or None when the PUT was skipped.
+  """
+  @property
+  def has_changes(self):
+    return bool(self.added or self.changed or self.removed or self.attributes_changed)
+
+  def summary(self, max_keys=10):
+    if not self.has_changes:
+      return 'unchanged'
+    parts = []
+    for label, keys in (('added', self.added), ('changed', self.changed), ('removed', self.removed)):
+      if len(keys) > max_keys:
+        parts.append('{0}: {1}, ... ({2} total)'.format(label, ', '.join(keys[:max_keys]), len(keys)))
+      elif keys:
+        parts.append('{0}: {1}'.format(label, ', '.join(keys)))
+    if self.attributes_changed:
+      parts.append('attributes changed')
+    return '; '.join(parts)
+
+
+class RequestPolicy(namedtuple('RequestPolicy', 'timeout deadline retries backoff hedge_percentile hedge_min_delay '
+                                                 'hedge_initial_delay')):
+  """
+  How hard a GET is tried before it fails. timeout bounds each attempt (connect and
+  every socket read), deadline the whole call including retries (None: unbounded).
+  Failed or 5xx attempts are retried up to `retries` times after a jittered
+  exponential backoff. With hedge_percentile set, a GET still unanswered after that
+  percentile of recent GET latencies (at least hedge_min_delay seconds; hedge_initial_delay
+  until enough latencies are known) is sent again on a second connection and the first
+  answer wins. PUTs are always sent exactly once.
+  """
+  pass
+
+DEFAULT_POLICY = RequestPolicy(timeout=DEFAULT_TIMEOUT, deadline=None, retries=2, backoff=0.2,
+                               hedge_percentile=None, hedge_min_delay=0.05, hedge_initial_delay=1.0)
+# Responses worth another GET: Ambari (or a proxy in front of it) was overloaded or restarting
+RETRY_STATUSES = (500, 502, 503, 504)
+MAX_BACKOFF = 5
+# Recent GET latencies kept for the hedge threshold, and how many are needed before hedging
+LATENCY_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 10
+
+
+def ambari_address(host, port):
+  """'host:port' of an Ambari server, as the journal and history tell servers apart."""
+  return '{0}:{1}'.format(host, port)
+
+
+class Proxy(namedtuple('Proxy', 'host port authorization')):
+  """An HTTP proxy to reach Ambari through; authorization is a Proxy-Authorization value or None."""
+  pass
+
+def get_proxy(protocol, host, port=None):
+  """
+  The proxy for requests to protocol://host:port from the http_proxy / https_proxy and
+  no_proxy environment variables (lower case first, as urllib reads them), or None.
+  """
+  url = os.environ.get(protocol + '_proxy') or os.environ.get(protocol.upper() + '_PROXY')
+  if not url:
+    return None
+  no_proxy = os.environ.get('no_proxy') or os.environ.get('NO_PROXY') or ''
+  for entry in no_proxy.replace(' ', '').split(','):
+    if entry == '*':
+      return None
+    name, _, entry_port = entry.lstrip('.').partition(':')
+    if name and (host == name or host.endswith('.' + name)) and (not entry_port or entry_port == str(port)):
+      return None
+  parts = urllib.parse.urlsplit(url if '://' in url else 'http://' + url)
+  authorization = None
+  if parts.username is not None:
+    credentials = '%s:%s' % (urllib.parse.unquote(parts.username), urllib.parse.unquote(parts.password or ''))
+    authorization = 'Basic %s' % base64.b64encode(credentials.encode()).decode()
+  return Proxy(parts.hostname, parts.port or 80, authorization)
+
+def tunnel_headers(proxy, host, port):
+  """The CONNECT request that opens a tunnel to host:port through proxy."""
+  head = 'CONNECT {0}:{1} HTTP/1.1\r\nHost: {0}:{1}\r\n'.format(host, port)
+  if proxy.authorization:
+    head += 'Proxy-Authorization: %s\r\n' % proxy.authorization
+  return (head + '\r\n').encode('latin-1')
+
+def connect(host, port, timeout, proxy=None):
+  """
+  A socket connected to host:port, tunnelled through proxy (CONNECT) when one is given,
+  ready for a TLS handshake with host.
+  """
+  import socket
+  if proxy is None:
+    return socket.create_connection((host, port), timeout=timeout)
+  sock = socket.create_connection((proxy.host, proxy.port), timeout=timeout)
+  try:
+    sock.sendall(tunnel_headers(proxy, host, port))
+    response = b''
+    while b'\r\n\r\n' not in response:
+      chunk = sock.recv(4096)
+      if not chunk:
+        raise OSError('Proxy {0}:{1} closed the connection during CONNECT'.format(proxy.host, proxy.port))
+      response += chunk
+    status_line = response.split(b'\r\n', 1)[0].decode('latin-1')
+    if status_line.split(' ')[1:2] != ['200']:
+      raise OSError('Proxy {0}:{1} refused CONNECT to {2}:{3}: {4}'.format(proxy.host, proxy.port, host, port, status_line))
+    return sock
+  except BaseException:
+    sock.close()
+    raise
+
+
+class ConnectionPool(object):
+  """
+  Pool of persistent HTTP/1.1 keep-alive connections to a single Ambari server.
+  At most max_connections requests are in flight at once; idle connections are
+  kept open and reused by later requests instead of paying a new TCP/TLS handshake.
+  GETs are retried and hedged according to the RequestPolicy; other methods are not.
+  With http_proxy / https_proxy set (see get_proxy), https goes through a CONNECT tunnel
+  and http requests are sent to the proxy with the absolute URL.
+  """
+  def __init__(self, protocol, host, port, context=None, max_connections=DEFAULT_MAX_CONNECTIONS, timeout=None,
+               policy=None):
+    self.protocol = protocol
+    self.host = host
+    self.port = int(port) if port else None
+    self.context = context
+    self.proxy = get_proxy(protocol, host, self.port)
+    self.policy = policy or DEFAULT_POLICY
+    if timeout is not None:
+      self.policy = self.policy._replace(timeout=timeout)
+    self.timeout = self.policy.timeout
+    self.max_connections = max(1, int(max_connections))
+    self._slots = threading.BoundedSemaphore(self.max_connections)
+    self._idle = queue.LifoQueue()
+    self._latencies = deque(maxlen=LATENCY_SAMPLES)
+    self.created = 0
+    self.retried = 0
+    self.hedged = 0
+    self.hedge_wins = 0
+
+  def _new_connection(self):
+    self.created += 1
+    proxy = self.proxy
+    if self.protocol == HTTPS_PROTOCOL:
+      if proxy is None:
+        return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.context)
+      connection = http.client.HTTPSConnection(proxy.host, proxy.port, timeout=self.timeout, context=self.context)
+      connection.set_tunnel(self.host, self.port,
+                            {'Proxy-Authorization': proxy.authorization} if proxy.authorization else None)
+      return connection
+    if proxy is None:
+      return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+    return http.client.HTTPConnection(proxy.host, proxy.port, timeout=self.timeout)
+
+  def _checkout(self, check_alive=False):
+    while True:
+      try:
+        connection = self._idle.get_nowait()
+      except queue.Empty:
+        return self._new_connection(), False
+      if check_alive and _is_dropped(connection):
+        connection.close()
+        continue
+      return connection, True
+
+  def request(self, method, url, body=None, headers=None):
+    """
+    Sends one request and returns (status, reason, headers, body), with a gzip
+    Content-Encoding already undone. GETs follow the pool's RequestPolicy; any other
+    method is sent once, on a connection checked to be still open, and never retried,
+    so a PUT can not create two config versions.
+    """
+    started = time.perf_counter()
+    trace = {'retries': 0, 'hedged': False}
+    status, response_body, decoded_body, error = None, b'', b'', None
     try:
-      url = '{0}://{1}:{2}{3}'.format(protocol, host, port, api_url)
-      admin_auth = base64.encodebytes(('%s:%s' % (login, password)).encode()).decode().replace('\n', '')
-      request = urllib.request.Request(url)
-      request.add_header('Authorization', 'Basic %s' % admin_auth)
-      request.add_header('X-Requested-By', 'ambari')
-      request.data=request_body
-      request.get_method = lambda: request_type
-
-      if unsafe:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        response = urllib.request.urlopen(request, context=ctx)
+      if method == GET_REQUEST_TYPE:
+        status, reason, response_headers, response_body = self._get(url, headers, trace)
       else:
-        response = urllib.request.urlopen(request)
+        self._slots.acquire()
+        try:
+          status, reason, response_headers, response_body = self._exchange(method, url, body, headers, self.timeout, trace)
+        finally:
+          self._slots.release()
+      decoded_body = decode_body(response_headers, response_body)
+      return status, reason, response_headers, decoded_body
+    except Exception as exc:
+      error = str(exc) or type(exc).__name__
+      raise
+    finally:
+      tracing.record_request('http.client', method, url, status, time.perf_counter() - started, len(body or b''),
+                             len(response_body), trace['retries'], error, len(decoded_body), trace['hedged'])
+
+  def _exchange(self, method, url, body, headers, timeout, trace):
+    """One request/response on one pooled connection. A stale reused connection is only retried for GETs."""
+    idempotent = method == GET_REQUEST_TYPE
+    if self.proxy is not None and self.protocol == HTTP_PROTOCOL:
+      url = 'http://{0}:{1}{2}'.format(self.host, self.port or 80, url)
+      if self.proxy.authorization:
+        headers = dict(headers or {}, **{'Proxy-Authorization': self.proxy.authorization})
+    connection, reused = self._checkout(check_alive=not idempotent)
+    while True:
+      try:
+        connection.timeout = timeout
+        if connection.sock is not None:
+          connection.sock.settimeout(timeout)
+        connection.request(method, url, body=body, headers=headers or {})
+        response = connection.getresponse()
+        response_body = response.read()
+        break
+      except (http.client.HTTPException, OSError):
+        connection.close()
+        if not reused or not idempotent:
+          raise
+        trace['retries'] += 1
+        connection, reused = self._new_connection(), False
+    # Lets a resuming SSL context (knox_utils.tls.TlsContext) keep the session for later handshakes
+    remember = getattr(self.context, 'remember', None)
+    if remember is not None and connection.sock is not None:
+      remember(connection.sock)
+    if response.will_close:
+      connection.close()
+    else:
+      self._idle.put(connection)
+    return response.status, response.reason, response.getheaders(), response_body
+
+  def _get(self, url, headers, trace):
+    policy = self.policy
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    attempt = 0
+    while True:
+      timeout = policy.timeout
+      if deadline is not None:
+        timeout = max(0.001, min(timeout, deadline - time.monotonic()))
+      failure, result = None, None
+      try:
+        result = self._attempt_get(url, headers, timeout, trace)
+      except (http.client.HTTPException, OSError) as exc:
+        failure = exc
+      if failure is None and result[0] not in RETRY_STATUSES:
+        return result
+      attempt += 1
+      delay = random.uniform(0, min(MAX_BACKOFF, policy.backoff * 2 ** attempt))
+      if attempt > policy.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+        if failure is not None:
+          raise failure
+        return result
+      logger.debug('GET %s %s; retry %d in %.2fs', url, failure or result[0], attempt, delay)
+      self.retried += 1
+      trace['retries'] += 1
+      time.sleep(delay)
+
+  def _attempt_get(self, url, headers, timeout, trace):
+    hedge_delay = self._hedge_delay()
+    if hedge_delay is None or hedge_delay >= timeout:
+      self._slots.acquire()
+      try:
+        started = time.monotonic()
+        result = self._exchange(GET_REQUEST_TYPE, url, None, headers, timeout, trace)
+        self._latencies.append(time.monotonic() - started)
+        return result
+      finally:
+        self._slots.release()
+    return self._hedged_get(url, headers, timeout, hedge_delay, trace)
+
+  def _hedged_get(self, url, headers, timeout, hedge_delay, trace):
+    """
+    Sends the GET on one connection and, if it is not answered within hedge_delay,
+    once more on another (only if a pool slot is free). Returns the first response;
+    the slower attempt finishes in the background and returns its connection to the pool.
+    """
+    answers = queue.Queue()
+
+    def attempt(hedge):
+      started = time.monotonic()
+      try:
+        result = self._exchange(GET_REQUEST_TYPE, url, None, headers, timeout, {'retries': 0})
+        self._latencies.append(time.monotonic() - started)
+        answers.put((hedge, result, None))
+      except Exception as exc:
+        answers.put((hedge, None, exc))
+      finally:
+        self._slots.release()
+
+    self._slots.acquire()
+    threading.Thread(target=attempt, args=(False,), name='hedge-primary', daemon=True).start()
+    pending = 1
+    try:
+      answer = answers.get(timeout=hedge_delay)
+    except queue.Empty:
+      answer = None
+      if self._slots.acquire(blocking=False):
+        self.hedged += 1
+        trace['hedged'] = True
+        logger.debug('GET %s unanswered after %.3fs; hedging', url, hedge_delay)
+        threading.Thread(target=attempt, args=(True,), name='hedge-secondary', daemon=True).start()
+        pending += 1
+    while True:
+      if answer is None:
+        answer = answers.get()
+      pending -= 1
+      hedge, result, failure = answer
+      if failure is None:
+        if hedge:
+          self.hedge_wins += 1
+        return result
+      if not pending:
+        raise failure
+      answer = None
+
+  def _hedge_delay(self):
+    """Seconds after which a GET is hedged, or None if hedging is off."""
+    percentile = self.policy.hedge_percentile
+    if not percentile:
+      return None
+    if len(self._latencies) < HEDGE_MIN_SAMPLES:
+      return max(self.policy.hedge_min_delay, self.policy.hedge_initial_delay)
+    latencies = sorted(self._latencies)
+    index = min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))
+    return max(self.policy.hedge_min_delay, latencies[index])
+
+  def close(self):
+    while True:
+      try:
+        self._idle.get_nowait().close()
+      except queue.Empty:
+        return
+
+def decode_body(headers, body):
+  """Undoes a gzip Content-Encoding (requested with Accept-Encoding: gzip); headers are (name, value) pairs."""
+  for name, value in headers:
+    if name.lower() == 'content-encoding' and value.strip().lower() == 'gzip':
+      return gzip.decompress(body)
+  return body
+
+def _is_dropped(connection):
+  """True if an idle keep-alive connection was closed by the server (it turns readable at EOF)."""
+  sock = connection.sock
+  if sock is None:
+    return True
+  try:
+    return bool(select.select([sock], [], [], 0)[0])
+  except (OSError, ValueError):
+    return True
+
+
+def api_accessor(host, login, password, protocol, port, unsafe=None, max_connections=DEFAULT_MAX_CONNECTIONS, context=None,
+                 policy=None):
+  """
+  Returns a do_request(api_url, request_type, request_body) closure over a keep-alive pool.
+  An explicit SSL context (e.g. knox_utils.tls.TlsContext) takes precedence over unsafe;
+  policy (a RequestPolicy) sets the GET timeouts, retries and hedging.
+  """
+  if context is not None:
+    ctx = context
+  elif protocol == HTTPS_PROTOCOL:
+    ctx = ssl.create_default_context()
+    if unsafe:
+      ctx.check_hostname = False
+      ctx.verify_mode = ssl.CERT_NONE
+  else:
+    ctx = None
+  pool = ConnectionPool(protocol, host, port, ctx, max_connections, policy=policy)
+  admin_auth = base64.encodebytes(('%s:%s' % (login, password)).encode()).decode().replace('\n', '')
+  headers = {
+    'Authorization': 'Basic %s' % admin_auth,
+    'X-Requested-By': 'ambari',
+    'Connection': 'keep-alive',
+    # Ambari gzips responses above api.gzip.compression.min.size when asked to
+    'Accept-Encoding': 'gzip'
+  }
 
-      response_body = response.read()
+  def do_request(api_url, request_type=GET_REQUEST_TYPE, request_body=None):
+    try:
+      status, reason, _, response_body = pool.request(request_type, api_url, request_body, headers)
+      if status >= 400:
+        raise urllib.error.HTTPError('{0}://{1}:{2}{3}'.format(protocol, host, port, api_url), status, reason, None, None)
       response_body = response_body.decode('utf-8') if isinstance(response_body, bytes) else response_body
     except Exception as exc:
       raise Exception('Problem with accessing api. Reason: {0}'.format(exc))
     return response_body
+  def fetch(api_url, request_type=GET_REQUEST_TYPE, request_body=None):
+    """Like do_request, but returns (status, body) instead of raising on HTTP errors."""
+    status, _, _, response_body = pool.request(request_type, api_url, request_body, headers)
+    return status, response_body.decode('utf-8')
+  do_request.fetch = fetch
+  do_request.pool = pool
+  do_request.ambari = ambari_address(host, port)
+  do_request.close = pool.close
   return do_request
 
-def get_config_tag(cluster, config_type, accessor):
-  response = accessor(DESIRED_CONFIGS_URL.format(cluster))
+def parse_config_tag(response, config_type):
+  """The tag in a DESIRED_CONFIG_URL response, or None if the cluster has no config_type."""
   try:
-    desired_tags = json.loads(response)
-    current_config_tag = desired_tags[CLUSTERS][DESIRED_CONFIGS][config_type][TAG]
+    with tracing.phase('parse desired_configs'):
+      desired_configs = json.loads(response)[CLUSTERS].get(DESIRED_CONFIGS, {})
   except Exception as exc:
+    raise Exception('"{0}" not found in server response. Response:\n{1}'.format(CLUSTERS, response))
+  desired = desired_configs.get(config_type)
+  return desired[TAG] if desired else None
+
+def find_config_tag(cluster, config_type, accessor):
+  """The desired tag of config_type, or None; only that type's desired_configs entry is fetched."""
+  response = accessor(DESIRED_CONFIG_URL.format(cluster, urllib.parse.quote(config_type)))
+  return parse_config_tag(response, config_type)
+
+def get_config_tag(cluster, config_type, accessor):
+  response = accessor(DESIRED_CONFIG_URL.format(cluster, urllib.parse.quote(config_type)))
+  current_config_tag = parse_config_tag(response, config_type)
+  if current_config_tag is None:
     raise Exception('"{0}" not found in server response. Response:\n{1}'.format(config_type, response))
   return current_config_tag
 
-def create_new_desired_config(cluster, config_type, properties, attributes, accessor, version_note):
-  new_tag = TAG_PREFIX + str(int(time.time() * 1000000))
+def new_tag():
+  return TAG_PREFIX + str(int(time.time() * 1000000))
+
+def desired_config_entry(config_type, config_tag, properties, attributes, version_note):
+  entry = {
+    TYPE: config_type,
+    TAG: config_tag,
+    SERVICE_CONFIG_NOTE:version_note,
+    PROPERTIES: properties
+  }
+  if len(attributes.keys()) > 0:
+    entry[ATTRIBUTES] = attributes
+  return entry
+
+def new_desired_config(config_type, properties, attributes, version_note):
+  """Builds the Clusters/desired_configs PUT body for a new version; returns (tag, body)."""
+  config_tag = new_tag()
   new_config = {
     CLUSTERS: {
-      DESIRED_CONFIGS: {
-        TYPE: config_type,
-        TAG: new_tag,
-        SERVICE_CONFIG_NOTE:version_note,
-        PROPERTIES: properties
-      }
+      DESIRED_CONFIGS: desired_config_entry(config_type, config_tag, properties, attributes, version_note)
     }
   }
-  if len(attributes.keys()) > 0:
-    new_config[CLUSTERS][DESIRED_CONFIGS][ATTRIBUTES] = attributes
+  return config_tag, new_config
+
+def create_new_desired_config(cluster, config_type, properties, attributes, accessor, version_note):
+  new_tag, new_config = new_desired_config(config_type, properties, attributes, version_note)
   request_body = json.dumps(new_config)
   request_body = request_body.encode('utf-8') if isinstance(request_body, str) else request_body
-  new_file = 'doSet_{0}.json'.format(new_tag)
-  logger.info('### PUTting json into: {0}'.format(new_file))
-  output_to_file(new_file)(new_config)
+  logger.info('### PUTting Site:{0}, Tag:{1}'.format(config_type, new_tag))
   accessor(CLUSTERS_URL.format(cluster), PUT_REQUEST_TYPE, request_body)
   logger.info('### NEW Site:{0}, Tag:{1}'.format(config_type, new_tag))
+  if config_history is not None:
+    config_history.record(getattr(accessor, 'ambari', None), cluster, config_type, new_tag, properties, attributes,
+                          version_note)
+  return new_tag
+
+def parse_desired_tags(response):
+  try:
+    with tracing.phase('parse desired_configs'):
+      desired_configs = json.loads(response)[CLUSTERS][DESIRED_CONFIGS]
+  except Exception as exc:
+    raise Exception('"{0}" not found in server response. Response:\n{1}'.format(DESIRED_CONFIGS, response))
+  return dict((config_type, desired[TAG]) for config_type, desired in desired_configs.items())
+
+def get_desired_tags(cluster, accessor):
+  return parse_desired_tags(accessor(DESIRED_CONFIGS_URL.format(cluster)))
+
+def configurations_urls(cluster, type_tags):
+  """
+  Yields one configurations URL per batch of MAX_TYPES_PER_REQUEST (type, tag)
+  pairs, OR-ing them into a single Ambari predicate.
+  """
+  type_tags = list(type_tags)
+  for start in range(0, len(type_tags), MAX_TYPES_PER_REQUEST):
+    batch = type_tags[start:start + MAX_TYPES_PER_REQUEST]
+    predicate = '|'.join('({0}={1}&{2}={3})'.format(TYPE, urllib.parse.quote(config_type), TAG, urllib.parse.quote(config_tag))
+                         for config_type, config_tag in batch)
+    yield CONFIGURATIONS_URL.format(cluster, predicate)
+
+def parse_configurations(response):
+  """Returns {(type, tag): (properties, attributes)} for a configurations response."""
+  configs_by_tag = {}
+  with tracing.phase('parse configurations'):
+    items = json.loads(response, object_pairs_hook=OrderedDict)[ITEMS]
+  for item in items:
+    configs_by_tag[(item[TYPE], item[TAG])] = (item[PROPERTIES], item.get(ATTRIBUTES, OrderedDict()))
+  return configs_by_tag
+
+def check_configurations(type_tags, configs_by_tag):
+  for config_type, config_tag in type_tags:
+    if (config_type, config_tag) not in configs_by_tag:
+      raise Exception('Config "{0}" with tag "{1}" not found in server response'.format(config_type, config_tag))
+
+def get_configs_by_tag(cluster, type_tags, accessor, check=True):
+  """
+  Fetches several (type, tag) config versions in as few requests as possible by
+  OR-ing them into one Ambari predicate per batch of MAX_TYPES_PER_REQUEST.
+  Returns {(type, tag): (properties, attributes)}; a pair missing from the response
+  raises, unless check is False (it is then only absent from the result).
+  """
+  type_tags = list(type_tags)
+  configs_by_tag = {}
+  for url in configurations_urls(cluster, type_tags):
+    configs_by_tag.update(parse_configurations(accessor(url)))
+  if check:
+    check_configurations(type_tags, configs_by_tag)
+  return configs_by_tag
+
+class ClusterConfigSnapshot(object):
+  """
+  In-memory view of a cluster's desired configs. The desired_configs tag map is
+  downloaded once, config bodies are batch-loaded on demand, and every caller gets
+  its own copy of the properties/attributes so updaters can mutate them freely.
+  A version missing from a batched response only fails get() of its own type, so one
+  absent config does not fail every reader that shared the batch.
+  An optional config_cache.ConfigCache serves bodies whose tag has not moved since an earlier run.
+  ambari (default: the accessor's) names the server for the config history.
+  """
+  def __init__(self, cluster, accessor, cache=None, ambari=None):
+    self.cluster = cluster
+    self.accessor = accessor
+    self.cache = cache
+    self.ambari = ambari or getattr(accessor, 'ambari', None)
+    self._tags = None
+    self._configs = {}
+    self._absent = set()
+    self._expected = []
+    self._lock = threading.RLock()
+
+  @property
+  def tags(self):
+    with self._lock:
+      if self._tags is None:
+        self._tags = get_desired_tags(self.cluster, self.accessor)
+      return self._tags
+
+  def refresh_tags(self):
+    """Re-reads desired_configs; bodies of versions that are no longer current are dropped."""
+    with self._lock:
+      self._tags = None
+      tags = self.tags
+      self._configs = dict((key, value) for key, value in self._configs.items() if tags.get(key[0]) == key[1])
+      self._absent = set(key for key in self._absent if tags.get(key[0]) == key[1])
+      return tags
+
+  def has(self, config_type):
+    return config_type in self.tags
+
+  def tag(self, config_type):
+    try:
+      return self.tags[config_type]
+    except KeyError:
+      raise Exception('"{0}" not found in desired configs of cluster "{1}"'.format(config_type, self.cluster))
+
+  def load(self, config_types):
+    """
+    Loads every given config type that exists in the cluster in one batched call.
+    Types missing from desired_configs or from the response are skipped; get() reports them.
+    """
+    with self._lock:
+      missing = self.resolve_cached([(config_type, self.tags[config_type]) for config_type in config_types
+                                     if config_type in self.tags])
+      if missing:
+        logger.info('### Loading {0} config(s): {1}'.format(len(missing), ', '.join(t for t, _ in missing)))
+        self.store(get_configs_by_tag(self.cluster, missing, self.accessor, check=False), missing)
+
+  def resolve_cached(self, type_tags):
+    """
+    Fills (type, tag) pairs from the on-disk cache where possible and
+    returns the pairs that still have to be fetched from Ambari.
+    """
+    with self._lock:
+      missing = []
+      for config_type, config_tag in type_tags:
+        if (config_type, config_tag) in self._configs or (config_type, config_tag) in self._absent \
+            or (config_type, config_tag) in missing:
+          continue
+        cached = self.cache.get(config_type, config_tag) if self.cache is not None else None
+        if cached is None:
+          missing.append((config_type, config_tag))
+        else:
+          self._configs[(config_type, config_tag)] = cached
+          _observe(self.ambari, self.cluster, config_type, config_tag, *cached)
+      return missing
+
+  def store(self, configs_by_tag, requested=()):
+    """
+    Keeps fetched config bodies. Pairs in requested that the response did not hold are
+    remembered as absent: get() of their type raises, other types are unaffected.
+    """
+    absent = [type_tag for type_tag in requested if type_tag not in configs_by_tag]
+    for config_type, config_tag in absent:
+      logger.info('### Config "{0}" with tag "{1}" not found in server response'.format(config_type, config_tag))
+    with self._lock:
+      self._configs.update(configs_by_tag)
+      self._absent.update(absent)
+    for (config_type, config_tag), (properties, attributes) in configs_by_tag.items():
+      _observe(self.ambari, self.cluster, config_type, config_tag, properties, attributes)
+    if self.cache is not None:
+      for (config_type, config_tag), (properties, attributes) in configs_by_tag.items():
+        self.cache.put(config_type, config_tag, properties, attributes)
+
+  def expect(self, config_types):
+    """Declares types that are about to be read, so the first get() loads them all in one batch."""
+    with self._lock:
+      self._expected.extend(t for t in config_types if t not in self._expected)
+
+  def get(self, config_type):
+    with self._lock:
+      self.load([config_type] + self._expected)
+      config_tag = self.tag(config_type)
+      if (config_type, config_tag) in self._absent:
+        raise Exception('Config "{0}" with tag "{1}" not found in server response'.format(config_type, config_tag))
+      properties, attributes = self._configs[(config_type, config_tag)]
+      return copy.deepcopy(properties), copy.deepcopy(attributes)
+
+  def prime(self, tags, configs_by_tag):
+    """Seeds the snapshot with a tag map and config bodies fetched elsewhere (e.g. asynchronously)."""
+    with self._lock:
+      self._tags = dict(tags)
+    self.store(configs_by_tag)
+
+  def record(self, config_type, config_tag, properties, attributes):
+    """Remembers a version this process just wrote so it is not fetched back."""
+    with self._lock:
+      self.tags[config_type] = config_tag
+      self._absent.discard((config_type, config_tag))
+    self.store({(config_type, config_tag): (copy.deepcopy(properties), copy.deepcopy(attributes))})
 
 def get_current_config(cluster, config_type, accessor):
-  config_tag = get_config_tag(cluster, config_type, accessor)
+  return get_config_by_tag(cluster, config_type, get_config_tag(cluster, config_type, accessor), accessor)
+
+def get_config_by_tag(cluster, config_type, config_tag, accessor):
   logger.info("### on (Site:{0}, Tag:{1})".format(config_type, config_tag))
   response = accessor(CONFIGURATION_URL.format(cluster, config_type, config_tag))
   config_by_tag = json.loads(response, object_pairs_hook=OrderedDict)
   current_config = config_by_tag[ITEMS][0]
+  _observe(getattr(accessor, 'ambari', None), cluster, config_type, config_tag, current_config[PROPERTIES],
+           current_config.get(ATTRIBUTES, {}))
   return current_config[PROPERTIES], current_config.get(ATTRIBUTES, {})
 
-def update_config(cluster, config_type, config_updater, accessor, version_note):
-  properties, attributes = config_updater(cluster, config_type, accessor)
-  create_new_desired_config(cluster, config_type, properties, attributes, accessor, version_note)
+def _observe(ambari, cluster, config_type, config_tag, properties, attributes):
+  if config_history is not None:
+    config_history.observe(ambari, cluster, config_type, config_tag, properties, attributes)
+
+def _normalize_attributes(attributes):
+  return dict((name, dict((key, str(value)) for key, value in values.items()))
+              for name, values in attributes.items() if values)
+
+def diff_config(config_type, current_properties, current_attributes, properties, attributes):
+  added = sorted(key for key in properties if key not in current_properties)
+  removed = sorted(key for key in current_properties if key not in properties)
+  changed = sorted(key for key in properties
+                   if key in current_properties and str(current_properties[key]) != str(properties[key]))
+  attributes_changed = _normalize_attributes(current_attributes) != _normalize_attributes(attributes)
+  return ConfigDiff(config_type, added, changed, removed, attributes_changed, None)
+
+def property_changes(config_type, current_properties, current_attributes, properties, attributes):
+  """Like diff_config, but with the values: what the change journal records for one type."""
+  change = {
+    TYPE: config_type,
+    'added': dict((key, properties[key]) for key in properties if key not in current_properties),
+    'changed': dict((key, [current_properties[key], properties[key]]) for key in properties
+                    if key in current_properties and str(current_properties[key]) != str(properties[key])),
+    'removed': dict((key, current_properties[key]) for key in current_properties if key not in properties)
+  }
+  if _normalize_attributes(current_attributes) != _normalize_attributes(attributes):
+    change['attributes'] = [copy.deepcopy(current_attributes), copy.deepcopy(attributes)]
+  return change
+
+def _journal(ambari, cluster, config_tag, version_note, changes):
+  if change_journal is not None:
+    change_journal.append(ambari, cluster, config_tag, version_note, changes)
+
+def get_current_config_or_empty(cluster, config_type, accessor):
+  """Like get_current_config, but a config type the cluster does not have yet is empty."""
+  config_tag = find_config_tag(cluster, config_type, accessor)
+  if config_tag is None:
+    return OrderedDict(), OrderedDict()
+  return get_config_by_tag(cluster, config_type, config_tag, accessor)
+
+def memoized_reads(accessor):
+  """
+  Wraps an accessor so repeated GETs of the same URL are served from memory;
+  other request types go straight through.
+  """
+  responses = {}
+  def do_request(api_url, request_type=GET_REQUEST_TYPE, request_body=None):
+    if request_type != GET_REQUEST_TYPE:
+      return accessor(api_url, request_type, request_body)
+    if api_url not in responses:
+      responses[api_url] = accessor(api_url)
+    return responses[api_url]
+  do_request.ambari = getattr(accessor, 'ambari', None)
+  return do_request
+
+def update_config(cluster, config_type, config_updater, accessor, version_note, snapshot=None):
+  """
+  Runs config_updater and PUTs the result as a new version, unless it is identical to
+  the live config. Returns a ConfigDiff describing added/changed/removed keys.
+  """
+  reads = memoized_reads(accessor)
+  properties, attributes = config_updater(cluster, config_type, reads)
+  if snapshot is not None and snapshot.has(config_type):
+    current_properties, current_attributes = snapshot.get(config_type)
+  elif snapshot is not None:
+    current_properties, current_attributes = OrderedDict(), OrderedDict()
+  else:
+    current_properties, current_attributes = get_current_config_or_empty(cluster, config_type, reads)
+  diff = diff_config(config_type, current_properties, current_attributes, properties, attributes)
+  if not diff.has_changes:
+    logger.info('### No changes for Site:{0}, skipping PUT'.format(config_type))
+    return diff
+  logger.info('### Site:{0} {1}'.format(config_type, diff.summary()))
+  new_tag = create_new_desired_config(cluster, config_type, properties, attributes, accessor, version_note)
+  if change_journal is not None:
+    _journal(getattr(accessor, 'ambari', None), cluster, new_tag, version_note,
+             [property_changes(config_type, current_properties, current_attributes, properties, attributes)])
+  if snapshot is not None:
+    snapshot.record(config_type, new_tag, properties, attributes)
+  return diff._replace(tag=new_tag)
+
+class ConfigChangeSet(object):
+  """
+  Plan/apply layer over create_new_desired_config: collects pending (type, properties,
+  attributes) changes and submits every type that actually changed as one
+  Clusters/desired_configs array in a single PUT with a shared version note.
+  """
+  def __init__(self, cluster, accessor, snapshot=None):
+    self.cluster = cluster
+    self.accessor = memoized_reads(accessor)
+    self.snapshot = snapshot
+    self.ambari = getattr(accessor, 'ambari', None) or getattr(snapshot, 'ambari', None)
+    self.pending = OrderedDict()
+    self._journal_record = None
+    self._version_note = None
+
+  def add(self, config_type, properties, attributes):
+    self.pending[config_type] = (properties, attributes)
+
+  def update(self, config_type, config_updater):
+    properties, attributes = config_updater(self.cluster, config_type, self.accessor)
+    self.add(config_type, properties, attributes)
+
+  def _current(self, config_type):
+    if self.snapshot is None:
+      return get_current_config_or_empty(self.cluster, config_type, self.accessor)
+    if self.snapshot.has(config_type):
+      return self.snapshot.get(config_type)
+    return OrderedDict(), OrderedDict()
+
+  def diffs(self):
+    diffs = []
+    for config_type, (properties, attributes) in self.pending.items():
+      current_properties, current_attributes = self._current(config_type)
+      diffs.append(diff_config(config_type, current_properties, current_attributes, properties, attributes))
+    return diffs
+
+  def prepare(self, version_note):
+    """
+    Diffs the pending changes and builds the PUT body for the changed types.
+    Returns (diffs, tag, body); body is None when nothing changed.
+    """
+    diffs = self.diffs()
+    changed = [diff for diff in diffs if diff.has_changes]
+    for diff in diffs:
+      logger.info('### Site:{0} {1}'.format(diff.config_type, diff.summary()))
+    if not changed:
+      logger.info('### No changes in change set, skipping PUT')
+      return diffs, None, None
+    config_tag = new_tag()
+    new_config = {
+      CLUSTERS: {
+        DESIRED_CONFIGS: [desired_config_entry(diff.config_type, config_tag, self.pending[diff.config_type][0],
+                                               self.pending[diff.config_type][1], version_note) for diff in changed]
+      }
+    }
+    self._version_note = version_note
+    if change_journal is not None:
+      changes = []
+      for diff in changed:
+        current_properties, current_attributes = self._current(diff.config_type)
+        changes.append(property_changes(diff.config_type, current_properties, current_attributes,
+                                        *self.pending[diff.config_type]))
+      self._journal_record = (version_note, changes)
+    logger.info('### PUTting Sites:{0}, Tag:{1}'.format(', '.join(diff.config_type for diff in changed), config_tag))
+    return diffs, config_tag, new_config
+
+  def commit(self, diffs, config_tag):
+    """Records a submitted change set in the snapshot and returns the diffs with their new tag."""
+    if config_tag is not None:
+      logger.info('### NEW Sites:{0}, Tag:{1}'.format(', '.join(d.config_type for d in diffs if d.has_changes), config_tag))
+      if self._journal_record is not None:
+        _journal(self.ambari, self.cluster, config_tag, *self._journal_record)
+      if config_history is not None:
+        for diff in diffs:
+          if diff.has_changes:
+            config_history.record(self.ambari, self.cluster, diff.config_type, config_tag,
+                                  *self.pending[diff.config_type], note=self._version_note)
+    self._journal_record = None
+    if self.snapshot is not None and config_tag is not None:
+      for diff in diffs:
+        if diff.has_changes:
+          self.snapshot.record(diff.config_type, config_tag, *self.pending[diff.config_type])
+    self.pending.clear()
+    return [diff._replace(tag=config_tag) if diff.has_changes else diff for diff in diffs]
+
+  def apply(self, version_note):
+    """
+    PUTs all changed types in one request. Returns a ConfigDiff per pending type;
+    changed ones carry the new tag, unchanged ones are skipped.
+    """
+    diffs, config_tag, new_config = self.prepare(version_note)
+    if new_config is not None:
+      self.accessor(CLUSTERS_URL.format(self.cluster), PUT_REQUEST_TYPE, json.dumps(new_config).encode('utf-8'))
+    return self.commit(diffs, config_tag)
 
 def update_specific_property(config_name, config_value):
   def update(cluster, config_type, accessor):
@@ -155,16 +926,21 @@ def update_from_xml(config_file):
     return read_xml_data_to_map(config_file)
   return update
 
-# Used DOM parser to read data into a map
+# Streams <property> elements with iterparse and drops each one once read, so memory stays flat
 def read_xml_data_to_map(path):
+  import xml.etree.ElementTree as ET
   configurations = {}
   properties_attributes = {}
-  tree = ET.parse(path)
-  root = tree.getroot()
-  for properties in root.iter('property'):
-    name = properties.find('name')
-    value = properties.find('value')
-    final = properties.find('final')
+  root = None
+  for event, element in ET.iterparse(path, events=('start', 'end')):
+    if root is None:
+      root = element
+    if event != 'end' or element.tag != 'property':
+      continue
+    name = element.find('name')
+    value = element.find('value')
+    final = element.find('final')
+    root.clear()
 
     if name != None:
       name_text = name.text if name.text else ""
@@ -187,21 +963,81 @@ def read_xml_data_to_map(path):
 
 def update_from_file(config_file):
   def update(cluster, config_type, accessor):
-    try:
-      with open(config_file) as in_file:
-        file_content = in_file.read()
-    except Exception as e:
-      raise Exception('Cannot find file "{0}" to PUT'.format(config_file))
-    try:
-      file_properties = json.loads(file_content)
-    except Exception as e:
-      raise Exception('File "{0}" should be in the following JSON format ("properties_attributes" is optional):\n{1}'.format(config_file, FILE_FORMAT))
-    new_properties = file_properties.get(PROPERTIES, {})
-    new_attributes = file_properties.get(ATTRIBUTES, {})
+    new_properties, new_attributes = read_json_data_to_map(config_file)
     logger.info('### PUTting file: "{0}"'.format(config_file))
     return new_properties, new_attributes
   return update
 
+def read_json_data_to_map(path):
+  try:
+    in_file = open(path)
+  except Exception as e:
+    raise Exception('Cannot find file "{0}" to PUT'.format(path))
+  try:
+    with in_file:
+      file_properties = json.load(in_file)
+  except Exception as e:
+    raise Exception('File "{0}" should be in the following JSON format ("properties_attributes" is optional):\n{1}'.format(path, FILE_FORMAT))
+  return file_properties.get(PROPERTIES, {}), file_properties.get(ATTRIBUTES, {})
+
+CONFIG_FILE_READERS = {
+  '.xml': read_xml_data_to_map,
+  '.json': read_json_data_to_map,
+}
+
+def read_config_file(path):
+  root, ext = os.path.splitext(path)
+  return CONFIG_FILE_READERS[ext](path)
+
+def list_config_dir(directory):
+  """
+  Returns [(config_type, path)] for every .xml/.json file in directory; the config type
+  is the file name without its extension (core-site.xml -> core-site).
+  """
+  found = OrderedDict()
+  for name in sorted(os.listdir(directory)):
+    config_type, ext = os.path.splitext(name)
+    path = os.path.join(directory, name)
+    if ext not in CONFIG_FILE_READERS or not os.path.isfile(path):
+      continue
+    if config_type in found:
+      raise Exception('Both "{0}" and "{1}" map to config type "{2}"'.format(found[config_type], path, config_type))
+    found[config_type] = path
+  return list(found.items())
+
+def read_config_dir(directory, max_workers=None):
+  """
+  Reads every config file in directory, parsing them in parallel worker processes.
+  Returns an OrderedDict of config_type -> (properties, attributes).
+  """
+  files = list_config_dir(directory)
+  if not files:
+    raise Exception('No .xml or .json config files found in "{0}"'.format(directory))
+  paths = [path for _, path in files]
+  max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+  if max_workers <= 1:
+    results = [read_config_file(path) for path in paths]
+  else:
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+      results = list(executor.map(read_config_file, paths))
+  return OrderedDict((config_type, result) for (config_type, _), result in zip(files, results))
+
+def import_config_dir(cluster, directory, accessor, version_note, max_workers=None):
+  """
+  Sets every config type found in directory from its file, submitting all types that
+  changed as one ConfigChangeSet. Returns the change set's ConfigDiffs.
+  """
+  loaded = read_config_dir(directory, max_workers)
+  for config_type in loaded:
+    logger.info('### {0} from file {1}'.format(config_type, os.path.join(directory, config_type)))
+  snapshot = ClusterConfigSnapshot(cluster, accessor)
+  snapshot.load(list(loaded))
+  change_set = ConfigChangeSet(cluster, accessor, snapshot)
+  for config_type, (properties, attributes) in loaded.items():
+    change_set.add(config_type, properties, attributes)
+  return change_set.apply(version_note)
+
 def delete_specific_property(config_name):
   def update(cluster, config_type, accessor):
     properties, attributes = get_current_config(cluster, config_type, accessor)
@@ -249,6 +1085,14 @@ def set_properties(cluster, config_type, args, accessor, version_note):
   update_config(cluster, config_type, updater, accessor, version_note)
   return 0
 
+def set_properties_from_dir(cluster, directory, accessor, version_note, max_workers=None):
+  logger.info('### Performing "set" from directory {0}:'.format(directory))
+  if not os.path.isdir(directory):
+    logger.error("Directory {0} doesn't exist".format(directory))
+    return -1
+  import_config_dir(cluster, directory, accessor, version_note, max_workers)
+  return 0
+
 def delete_properties(cluster, config_type, args, accessor, version_note):
   logger.info('### Performing "delete":')
   if len(args) == 0:
@@ -273,6 +1117,9 @@ def get_properties(cluster, config_type, args, accessor):
   return 0
 
 def main():
+  # Only needed when run as a script; kept out of module import for the CLI's startup time
+  import optparse
+  from optparse import OptionGroup
 
   parser = optparse.OptionParser(usage="usage: %prog [options]")
 
@@ -285,6 +1132,7 @@ def main():
   parser.add_option("-t", "--port", dest="port", default="8080", help="Optional port number for Ambari server. Default is '8080'. Provide empty string to not use port.")
   parser.add_option("-s", "--protocol", dest="protocol", default="http", help="Optional support of SSL. Default protocol is 'http'")
   parser.add_option("--unsafe", action="store_true", dest="unsafe", help="Skip SSL certificate verification.")
+  parser.add_option("-m", "--max-connections", dest="max_connections", type="int", default=DEFAULT_MAX_CONNECTIONS, help="Optional maximum number of keep-alive connections to the Ambari server. Default is '{0}'".format(DEFAULT_MAX_CONNECTIONS))
   parser.add_option("-a", "--action", dest="action", help="Script action: <get>, <set>, <delete>")
   parser.add_option("-l", "--host", dest="host", help="Server external host name")
   parser.add_option("-n", "--cluster", dest="cluster", help="Name given to cluster. Ex: 'c1'")
@@ -295,8 +1143,13 @@ def main():
   config_options_group.add_option("-f", "--file", dest="file", help="File where entire configurations are saved to, or read from. Supported extensions (.xml, .json>)")
   config_options_group.add_option("-k", "--key", dest="key", help="Key that has to be set or deleted. Not necessary for 'get' action.")
   config_options_group.add_option("-v", "--value", dest="value", help="Optional value to be set. Not necessary for 'get' or 'delete' actions.")
+  config_options_group.add_option("-d", "--directory", dest="directory", help="Directory of .xml/.json files to set in one change set, one config type per file named after it (core-site.xml -> core-site). Only for 'set' action; -c is not needed.")
+  config_options_group.add_option("-j", "--jobs", dest="jobs", type="int", help="Optional number of processes parsing files for -d. Default is the number of CPUs.")
   parser.add_option_group(config_options_group)
 
+  parser.add_option("--journal", dest="journal", help="Optional change journal recording every version written by <set> and <delete>. Default is '~/.local/state/knox-utility/changes.journal'")
+  parser.add_option("--no-journal", action="store_true", dest="no_journal", help="Do not record changes in the change journal.")
+
   (options, args) = parser.parse_args()
 
   logger.setLevel(logging.INFO)
@@ -337,6 +1190,8 @@ def main():
   protocol = options.protocol
 
   #options without default value
+  if options.directory and options.action == SET_ACTION:
+    options.config_type = options.config_type or ''
   if None in [options.action, options.host, options.cluster, options.config_type]:
     parser.error("One of required options is not passed")
 
@@ -346,9 +1201,18 @@ def main():
   config_type = options.config_type
   version_note = options.version_note
 
-  accessor = api_accessor(host, user, password, protocol, port, options.unsafe)
+  accessor = api_accessor(host, user, password, protocol, port, options.unsafe, options.max_connections)
+  if action in (SET_ACTION, DELETE_ACTION) and not options.no_journal:
+    global change_journal
+    try:
+      from knox_utils import journal
+    except ImportError:
+      import journal  # run as a script from knox_utils/
+    change_journal = journal.Journal(options.journal or journal.DEFAULT_PATH)
   if action == SET_ACTION:
 
+    if options.directory:
+      return set_properties_from_dir(cluster, options.directory, accessor, version_note, options.jobs)
     if not options.file and (not options.key or options.value is None):
       parser.error("You should use option (-f) to set file where entire configurations are saved OR (-k) key and (-v) value for one property")
     if options.file:
@@ -0,0 +1,222 @@
+import json
+import os
+import socket
+import sys
+import time
+
+# Read in one recv() per request/response line
+BUFFER_SIZE = 65536
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'knox-utility.sock')
+    return os.path.join('/tmp', f'knox-utility-{os.getuid()}.sock')
+
+def socket_path():
+    from .params import DAEMON_SOCKET
+    return DAEMON_SOCKET or default_socket_path()
+
+
+# ---- server ----
+
+def _check_knox():
+    from .cluster import is_knox_installed
+    installed = is_knox_installed()
+    print("KNOX is installed." if installed else "KNOX is NOT installed.")
+    return installed
+
+def _configure_knox():
+    from .cluster import configure_knox
+    configure_knox()
+
+def _set_knox_whitelist():
+    from .cluster import set_knox_whitelist
+    set_knox_whitelist()
+
+def _benchmark_whitelist():
+    from .cluster import benchmark_knox_whitelist
+    return benchmark_knox_whitelist()
+
+def _refresh():
+    from . import cluster, params
+    cluster.reset_host_index()
+    if cluster._snapshot is not None:
+        cluster.get_snapshot().refresh_tags()
+    # Settings are resolved again on next use; config.ini is only re-parsed if it changed.
+    # The Ambari connection (host, port, credentials) is kept until the daemon restarts.
+    params.reload()
+    print("[INFO] Cached cluster state and settings dropped; they are read again on next use.")
+
+# action -> (function, whether it reads configs that may have changed since the last request)
+DAEMON_ACTIONS = {
+    'check-knox': (_check_knox, False),
+    'configure-knox': (_configure_knox, True),
+    'set-knox-whitelist': (_set_knox_whitelist, True),
+    'benchmark-whitelist': (_benchmark_whitelist, False),
+    'refresh': (_refresh, False),
+}
+
+
+class KnoxDaemon:
+    """
+    Runs main.py actions inside one long-lived process so the Ambari connection pool,
+    config snapshot, config cache and host index stay warm between commands.
+
+    Actions run one at a time. Before an action that reads configs, desired_configs
+    is re-read (one small request) so versions written elsewhere are picked up;
+    the host index is fetched again once it is older than host_index_ttl.
+    """
+
+    def __init__(self, path=None, host_index_ttl=None):
+        from .params import HOST_INDEX_TTL
+        import threading
+        self.path = path or socket_path()
+        self.host_index_ttl = HOST_INDEX_TTL if host_index_ttl is None else host_index_ttl
+        self.started = time.monotonic()
+        self.served = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _prepare(self, refresh_tags):
+        from . import cluster
+        age = cluster.host_index_age()
+        if age is not None and age > self.host_index_ttl:
+            cluster.reset_host_index()
+        if refresh_tags and cluster._snapshot is not None:
+            cluster.get_snapshot().refresh_tags()
+
+    def stats(self):
+        from . import cluster
+        snapshot = cluster._snapshot
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+            'requests_served': self.served,
+            'connections_opened': cluster._accessor.pool.created if cluster._accessor is not None else 0,
+            'requests_retried': cluster._accessor.pool.retried if cluster._accessor is not None else 0,
+            'requests_hedged': cluster._accessor.pool.hedged if cluster._accessor is not None else 0,
+            'host_index_age_seconds': None if cluster.host_index_age() is None else round(cluster.host_index_age(), 1),
+            'config_cache': snapshot.cache.summary() if snapshot is not None and snapshot.cache is not None else None,
+        }
+
+    def handle(self, request):
+        """Runs one request {"action": ...} and returns the response dict."""
+        import io
+        from contextlib import redirect_stdout
+        action = request.get('action')
+        if action == 'stats':
+            return {'status': 'ok', 'output': '', 'result': self.stats()}
+        if action == 'shutdown':
+            import threading
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+            return {'status': 'ok', 'output': '[INFO] Daemon shutting down.\n', 'result': None}
+        if action not in DAEMON_ACTIONS:
+            return {'status': 'error', 'output': f"[ERROR] Unsupported action: {action}\n", 'result': None}
+        function, refresh_tags = DAEMON_ACTIONS[action]
+        output = io.StringIO()
+        with self._lock:
+            started = time.monotonic()
+            status, result = 'ok', None
+            with redirect_stdout(output):
+                try:
+                    self._prepare(refresh_tags)
+                    result = function()
+                except Exception as e:
+                    status = 'error'
+                    print(f"Error running {action}: {e}")
+            self.served += 1
+        if '[ERROR]' in output.getvalue():
+            status = 'error'
+        return {'status': status, 'output': output.getvalue(), 'result': result,
+                'seconds': round(time.monotonic() - started, 3)}
+
+    def serve_forever(self):
+        import socketserver
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                try:
+                    response = daemon.handle(json.loads(line))
+                except ValueError:
+                    response = {'status': 'error', 'output': "[ERROR] Malformed request\n", 'result': None}
+                self.wfile.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+
+        self._claim_socket()
+        old_umask = os.umask(0o177)  # socket is usable by this user only
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        print(f"[INFO] knox-utility daemon listening on {self.path} (pid {os.getpid()})")
+        sys.stdout.flush()
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            from .cluster import print_cache_stats
+            print_cache_stats()
+            print(f"[INFO] Daemon stopped after {self.served} request(s)")
+
+    def _claim_socket(self):
+        """Refuses to start over a live daemon; removes a socket file left by a dead one."""
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.remove(self.path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"[ERROR] A daemon is already listening on {self.path}")
+
+def serve(path=None):
+    KnoxDaemon(path).serve_forever()
+
+
+# ---- client ----
+
+def request(action, path=None, timeout=None):
+    """
+    Sends one action to a running daemon and returns its response dict.
+    Only the standard library's socket and json are used, so this stays cheap to import.
+    """
+    path = path or socket_path()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+    except OSError as e:
+        client.close()
+        raise RuntimeError(f"[ERROR] No knox-utility daemon on {path} ({e}). Start one with: python main.py --serve")
+    with client:
+        client.sendall(json.dumps({'action': action}).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = client.recv(BUFFER_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b'\n'):
+                break
+    return json.loads(b''.join(chunks))
+
+def run_client(action, path=None):
+    """Runs action on the daemon, prints its output and returns a process exit code."""
+    response = request(action, path)
+    sys.stdout.write(response.get('output', ''))
+    if action == 'stats':
+        for key, value in response['result'].items():
+            print(f"{key}: {value}")
+    return 0 if response.get('status') == 'ok' else 1
@@ -0,0 +1,155 @@
+import asyncio
+import configparser
+import contextvars
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+
+from . import async_cluster
+from .async_client import AsyncAmbariClient
+from .cluster import get_config_cache
+
+DEFAULT_WORKERS = 16
+DEFAULT_PER_SERVER = 2
+
+# One [section] per cluster in the inventory; [DEFAULT] can hold shared credentials
+FleetTarget = namedtuple('FleetTarget', 'name host port protocol username password cluster_name max_connections')
+FleetResult = namedtuple('FleetResult', 'target status seconds detail output')
+
+_cluster_output = contextvars.ContextVar('cluster_output', default=None)
+
+
+class _TaskLocalStdout:
+    """
+    Routes print() output into the buffer of the cluster task that produced it,
+    so concurrent clusters do not interleave their logs.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buffer = _cluster_output.get()
+        return (buffer or self._stream).write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+
+def load_inventory(path):
+    """
+    Reads an INI inventory of Ambari endpoints; each section is one cluster:
+
+        [DEFAULT]
+        username = admin
+        password = admin
+        protocol = https
+        port = 8446
+
+        [prod]
+        host = prod.ambari.host
+        cluster_name = prod_cluster
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"[ERROR] Inventory file not found: {path}")
+    inventory = configparser.ConfigParser()
+    inventory.read(path)
+    targets = []
+    for name in inventory.sections():
+        section = inventory[name]
+        if 'host' not in section:
+            raise ValueError(f"[ERROR] Inventory section [{name}] has no host")
+        targets.append(FleetTarget(
+            name=name,
+            host=section.get('host'),
+            port=section.get('port', '8080'),
+            protocol=section.get('protocol', 'http'),
+            username=section.get('username', 'admin'),
+            password=section.get('password', 'admin'),
+            cluster_name=section.get('cluster_name', name),
+            max_connections=section.getint('max_connections', 4)
+        ))
+    return targets
+
+async def _check_knox(client):
+    installed = await async_cluster.is_knox_installed(client)
+    print("KNOX is installed." if installed else "KNOX is NOT installed.")
+    return 'installed' if installed else 'not installed'
+
+FLEET_ACTIONS = {
+    'check-knox': _check_knox,
+    'set-knox-whitelist': async_cluster.set_knox_whitelist,
+    'configure-knox': async_cluster.configure_knox,
+}
+
+async def _run_target(target, action, workers, server_slots):
+    # The server slot is taken first: a cluster queued behind its Ambari server must not
+    # hold a worker slot that a cluster on another server could use
+    async with server_slots[(target.host, target.port)], workers:
+        buffer = io.StringIO()
+        _cluster_output.set(buffer)
+        started = time.monotonic()
+        status, detail = 'OK', ''
+        try:
+            cache = get_config_cache(target.host, target.port, target.cluster_name)
+            async with AsyncAmbariClient(target.host, target.port, target.protocol, target.username,
+                                         target.password, target.cluster_name,
+                                         max_concurrency=target.max_connections, config_cache=cache) as client:
+                detail = await FLEET_ACTIONS[action](client) or ''
+            if cache is not None:
+                print(f"[INFO] Config cache: {cache.summary()}")
+        except Exception as e:
+            status, detail = 'FAILED', str(e)
+        output = buffer.getvalue()
+        if status == 'OK' and '[ERROR]' in output:
+            status = 'ERRORS'
+            detail = next(line for line in output.splitlines() if '[ERROR]' in line)
+        return FleetResult(target, status, time.monotonic() - started, detail, output)
+
+async def run_fleet(targets, action, workers=DEFAULT_WORKERS, per_server=DEFAULT_PER_SERVER):
+    """
+    Runs one action against every target concurrently: at most `workers` clusters
+    at a time overall and at most `per_server` at a time on any one Ambari server.
+    """
+    if action not in FLEET_ACTIONS:
+        raise ValueError(f"[ERROR] Unsupported fleet action: {action}")
+    worker_slots = asyncio.Semaphore(workers)
+    server_slots = {(t.host, t.port): asyncio.Semaphore(per_server) for t in targets}
+    stdout = sys.stdout
+    sys.stdout = _TaskLocalStdout(stdout)
+    try:
+        return await asyncio.gather(*[_run_target(t, action, worker_slots, server_slots) for t in targets])
+    finally:
+        sys.stdout = stdout
+
+def print_results(results, action):
+    rows = [('CLUSTER', 'AMBARI', 'STATUS', 'SECONDS', 'DETAIL')]
+    for r in results:
+        rows.append((r.target.name, f"{r.target.host}:{r.target.port}", r.status, f"{r.seconds:.2f}", r.detail))
+    widths = [max(len(row[i]) for row in rows) for i in range(4)]
+    print(f"[INFO] Fleet {action} results:")
+    for row in rows:
+        print('  '.join(col.ljust(widths[i]) for i, col in enumerate(row[:4])) + '  ' + row[4])
+    failed = sum(1 for r in results if r.status != 'OK')
+    print(f"[INFO] {len(results) - failed}/{len(results)} clusters OK")
+
+def write_logs(results, log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    for r in results:
+        with open(os.path.join(log_dir, f"{r.target.name}.log"), 'w') as f:
+            f.write(r.output)
+    print(f"[INFO] Per-cluster logs written to {log_dir}")
+
+def main_fleet(inventory_path, action, workers=DEFAULT_WORKERS, per_server=DEFAULT_PER_SERVER, log_dir=None):
+    targets = load_inventory(inventory_path)
+    if not targets:
+        print(f"[WARN] No clusters found in inventory {inventory_path}")
+        return []
+    print(f"[INFO] Running {action} on {len(targets)} clusters ({workers} workers, {per_server} per Ambari server)...")
+    results = asyncio.run(run_fleet(targets, action, workers, per_server))
+    print_results(results, action)
+    if log_dir:
+        write_logs(results, log_dir)
+    return results
@@ -0,0 +1,274 @@
+import atexit
+import copy
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from . import journal
+
+DEFAULT_DIR = os.path.join(
+    os.environ.get('XDG_STATE_HOME', os.path.join(os.path.expanduser('~'), '.local', 'state')),
+    'knox-utility', 'history')
+DEFAULT_MAX_VERSIONS = 100
+# A full copy of the config is stored at least every KEYFRAME_INTERVAL versions, so
+# rebuilding any version replays fewer deltas than that
+KEYFRAME_INTERVAL = 16
+
+# One file per Ambari server, cluster and config type (<host>_<port>_<cluster>/<type>.history, like
+# the config cache, so same-named clusters on different servers never share one), in the change
+# journal's frame format (journal.pack):
+# each frame is one version, oldest first. Keyframes ('key' in the header) hold the whole
+# {'properties', 'attributes'}; the others hold a delta from the version before them:
+# {'set': {key: value}, 'removed': [key], 'attributes': ...} (attributes only if they changed).
+# Headers of versions after the first carry that delta's counts; the first kept version of a
+# compacted file has none and is marked 'compacted' instead.
+MAGIC = b'KNOXHST1'
+
+Version = namedtuple('Version', 'header start offset length end')
+
+
+def history_path(directory, ambari, cluster, config_type):
+    """ambari is the server's 'host:port' (configs.ambari_address)."""
+    safe = lambda name: re.sub(r'[^A-Za-z0-9._-]', '_', name)
+    return os.path.join(directory, safe(f"{ambari}_{cluster}"), f"{safe(config_type)}.history")
+
+def read_versions(path):
+    """Every intact version in a history file, oldest first (headers only)."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return []
+            return [Version(*frame) for frame in journal.frames(f)]
+    except FileNotFoundError:
+        return []
+
+def delta(properties, attributes, new_properties, new_attributes):
+    change = {
+        'set': dict((key, value) for key, value in new_properties.items()
+                    if key not in properties or properties[key] != value),
+        'removed': [key for key in properties if key not in new_properties]
+    }
+    if attributes != new_attributes:
+        change['attributes'] = new_attributes
+    return change
+
+def materialize(path, versions, index):
+    """Rebuilds (properties, attributes) of versions[index] from the keyframe before it."""
+    start = index
+    while not versions[start].header['key']:
+        start -= 1
+    properties, attributes = OrderedDict(), OrderedDict()
+    for version in versions[start:index + 1]:
+        payload = journal.read_payload(path, version.offset, version.length)
+        if version.header['key']:
+            properties, attributes = OrderedDict(payload['properties']), payload['attributes']
+            continue
+        properties.update(payload['set'])
+        for key in payload['removed']:
+            properties.pop(key, None)
+        attributes = payload.get('attributes', attributes)
+    return properties, attributes
+
+def find(versions, tag):
+    """Index of the newest version whose tag equals or starts with `tag`, or None."""
+    for index in range(len(versions) - 1, -1, -1):
+        if versions[index].header['tag'].startswith(tag):
+            return index
+    return None
+
+
+class History:
+    """
+    Local history of every version of every config type this process writes or reads,
+    stored per type as deltas between successive versions so any of them can be rebuilt
+    and re-applied (rollback) without asking Ambari for its service_config_versions.
+
+    Like the change journal, observe() and record() only queue the version; a background
+    thread diffs it against the latest stored one and appends it under an flock, so
+    neither reads nor PUTs wait on the disk. A version whose tag is already the latest
+    stored is skipped. Beyond max_versions, the oldest are dropped by rewriting the file
+    with a keyframe of the first kept version.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_versions=DEFAULT_MAX_VERSIONS):
+        self.directory = directory
+        self.max_versions = max_versions
+        self.written = 0
+        self._heads = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def observe(self, ambari, cluster, config_type, tag, properties, attributes):
+        """Queues a version read from the Ambari server ambari ('host:port')."""
+        self._put(ambari, cluster, config_type, tag, properties, attributes, 'observed', None)
+
+    def record(self, ambari, cluster, config_type, tag, properties, attributes, note):
+        """Queues a version this process just wrote."""
+        self._put(ambari, cluster, config_type, tag, properties, attributes, 'write', note)
+
+    def _put(self, ambari, cluster, config_type, tag, properties, attributes, source, note):
+        # Property values are strings; callers go on to mutate the dicts themselves
+        self._queue.put((ambari, cluster, config_type, tag, OrderedDict(properties), copy.deepcopy(attributes),
+                         source, note))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='config-history', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Blocks until every queued version is on disk."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if self.add(*item):
+                    self.written += 1
+            except Exception as e:
+                print(f"[WARN] Could not write config history for {item[2]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def add(self, ambari, cluster, config_type, tag, properties, attributes, source, note=None):
+        """Appends one version; returns False if it already is the latest stored."""
+        path = history_path(self.directory, ambari, cluster, config_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, size = journal.lock(path, MAGIC)
+        try:
+            stat = os.fstat(fd)
+            head = self._heads.get(path)
+            if head is None or head[0] != (stat.st_dev, stat.st_ino, size):
+                versions = read_versions(path)
+                if versions and versions[-1].header['tag'] == tag:
+                    return False
+                current = materialize(path, versions, len(versions) - 1) if versions else (None, None)
+                head = ((stat.st_dev, stat.st_ino, size), versions) + current
+            _, versions, current_properties, current_attributes = head
+            if versions and versions[-1].header['tag'] == tag:
+                return False
+            header = {'tag': tag, 'time': time.time(), 'source': source, 'note': note, 'key': True,
+                      'properties': len(properties)}
+            payload = {'properties': properties, 'attributes': attributes}
+            if versions:
+                change = delta(current_properties, current_attributes, properties, attributes)
+                header.update({'set': len(change['set']), 'removed': len(change['removed']),
+                               'attributes': 'attributes' in change})
+                since_keyframe = next(i for i, v in enumerate(reversed(versions)) if v.header['key'])
+                if since_keyframe + 1 < KEYFRAME_INTERVAL and len(change['set']) + len(change['removed']) <= len(properties) // 2:
+                    header['key'] = False
+                    payload = change
+            frame = journal.pack(header, payload)
+            os.write(fd, (MAGIC if size == 0 else b'') + frame)
+            start = max(size, len(MAGIC))
+            header_length, body_length = journal.FRAME.unpack_from(frame)
+            versions = versions + [Version(header, start, start + journal.FRAME.size + header_length, body_length,
+                                           start + len(frame))]
+            self._heads.pop(path, None)
+            if self.max_versions > 0 and len(versions) > self.max_versions + max(1, self.max_versions // 4):
+                self._compact(path)
+            else:
+                self._heads[path] = ((stat.st_dev, stat.st_ino, start + len(frame)), versions, properties, attributes)
+            return True
+        finally:
+            os.close(fd)
+
+    def _compact(self, path):
+        """Rewrites a history file with only the newest max_versions versions. Called under the flock."""
+        versions = read_versions(path)
+        first = len(versions) - self.max_versions
+        properties, attributes = materialize(path, versions, first)
+        # The version it was a delta from is dropped, so its set/removed counts no longer apply
+        kept = versions[first].header
+        header = {'tag': kept['tag'], 'time': kept['time'], 'source': kept['source'], 'note': kept.get('note'),
+                  'key': True, 'properties': len(properties), 'compacted': True}
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(path, 'rb') as source, open(temporary, 'wb') as f:
+            f.write(MAGIC + journal.pack(header, {'properties': properties, 'attributes': attributes}))
+            # Later deltas are relative to the version before them, which is kept, so they are copied as they are
+            source.seek(versions[first].end)
+            f.write(source.read())
+        os.replace(temporary, path)
+
+
+def _summary(header):
+    if header.get('compacted'):
+        return f"oldest kept, {header['properties']} properties"
+    if 'set' not in header:
+        return f"initial, {header['properties']} properties"
+    detail = [f"{header['set']} set", f"{header['removed']} removed"]
+    if header['attributes']:
+        detail.append('attributes')
+    return ', '.join(detail)
+
+def print_versions(ambari, cluster, config_type, limit=20, directory=DEFAULT_DIR):
+    versions = read_versions(history_path(directory, ambari, cluster, config_type))
+    if not versions:
+        print(f"[INFO] No versions of {config_type} recorded for cluster {cluster} on {ambari} in {directory}")
+        return
+    for version in versions[-limit:] if limit else versions:
+        header = version.header
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['time']))
+        print(f"{stamp}  {header['tag']}  {header['source']:<8}  {_summary(header)}"
+              + (f"  \"{header['note']}\"" if header.get('note') else ''))
+
+def rollback(config_type, tag=None, accessor=None, cluster=None):
+    """
+    Rebuilds an earlier version of config_type from the local history (default: the one before
+    the latest recorded) and PUTs it as a new version in a single request. Only versions recorded
+    for the Ambari server of accessor (default: the configured one) and cluster are considered.
+    """
+    from . import configs
+    from .cluster import get_accessor
+    from .params import CLUSTER_NAME
+    accessor = accessor or get_accessor()
+    cluster = cluster or CLUSTER_NAME
+    path = history_path(configured_dir(), accessor.ambari, cluster, config_type)
+    versions = read_versions(path)
+    if tag:
+        index = find(versions, tag)
+        if index is None:
+            print(f"[ERROR] No version {tag} of {config_type} recorded for cluster {cluster} on {accessor.ambari} in {path}")
+            return 1
+    elif len(versions) < 2:
+        print(f"[ERROR] Fewer than two versions of {config_type} recorded for cluster {cluster} on {accessor.ambari}; pass --to TAG")
+        return 1
+    else:
+        index = len(versions) - 2
+    target = versions[index].header['tag']
+    if index == len(versions) - 1:
+        print(f"[INFO] {config_type} {target} is already the latest recorded version")
+        return 0
+    properties, attributes = materialize(path, versions, index)
+    current_properties, current_attributes = materialize(path, versions, len(versions) - 1)
+    note = f"Rollback to {target}"
+    new_tag = configs.create_new_desired_config(cluster, config_type, properties, attributes, accessor, note)
+    if configs.change_journal is not None:
+        configs.change_journal.append(accessor.ambari, cluster, new_tag, note, [configs.property_changes(
+            config_type, current_properties, current_attributes, properties, attributes)])
+    print(f"[INFO] Rolled {config_type} back to {target} as {new_tag}")
+    return 0
+
+
+def install():
+    """
+    Records every config version read or written through configs.py / the async client in
+    this process in the history configured in config.ini (history_dir, history_max_versions).
+    """
+    from . import configs
+    from .params import HISTORY_MAX_VERSIONS
+    if HISTORY_MAX_VERSIONS <= 0:
+        configs.config_history = None
+        return None
+    if configs.config_history is None:
+        configs.config_history = History(configured_dir(), HISTORY_MAX_VERSIONS)
+    return configs.config_history
+
+def configured_dir():
+    from .params import HISTORY_DIR
+    return HISTORY_DIR or DEFAULT_DIR
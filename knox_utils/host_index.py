@@ -0,0 +1,81 @@
+import sys
+
+# Fields requested per host when building the index; everything else is left out of the response
+HOST_COMPONENTS_FIELDS = 'Hosts/host_name,host_components/HostRoles/component_name'
+
+
+class HostComponentIndex:
+    """
+    Component-to-hosts and host-to-components maps for a cluster, built from the
+    paginated /hosts?fields=Hosts/host_name,host_components/HostRoles/component_name
+    response, so every lookup after the sweep is a dict access.
+    """
+
+    def __init__(self):
+        self._components_by_host = {}
+        self._hosts_by_component = {}
+
+    @classmethod
+    def from_items(cls, items):
+        index = cls()
+        index.add_items(items)
+        return index
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rebuilds an index saved with rows()."""
+        index = cls()
+        for hostname, components in rows:
+            index._components_by_host[hostname] = set(sys.intern(component) for component in components)
+            for component in components:
+                index._hosts_by_component.setdefault(sys.intern(component), []).append(hostname)
+        return index
+
+    def rows(self):
+        """[hostname, [component, ...]] per host in Ambari's host order: the index in a compact, JSON-able form."""
+        return [[hostname, sorted(components)] for hostname, components in self._components_by_host.items()]
+
+    def add_items(self, items):
+        """Adds one page of /hosts items; returns the hostnames it contained."""
+        hostnames = []
+        for item in items:
+            hostname = item.get('Hosts', {}).get('host_name')
+            if not hostname:
+                continue
+            hostnames.append(hostname)
+            components = self._components_by_host.setdefault(hostname, set())
+            for host_component in item.get('host_components', []):
+                component = host_component.get('HostRoles', {}).get('component_name')
+                if component and component not in components:
+                    component = sys.intern(component)
+                    components.add(component)
+                    self._hosts_by_component.setdefault(component, []).append(hostname)
+        return hostnames
+
+    def __len__(self):
+        return len(self._components_by_host)
+
+    def __contains__(self, hostname):
+        return hostname in self._components_by_host
+
+    @property
+    def hostnames(self):
+        return list(self._components_by_host)
+
+    def hosts(self, component_name):
+        """Hosts running component_name, in Ambari's host order."""
+        return list(self._hosts_by_component.get(component_name, ()))
+
+    def first_host(self, component_name):
+        hosts = self._hosts_by_component.get(component_name)
+        return hosts[0] if hosts else None
+
+    def components(self, hostname):
+        return set(self._components_by_host.get(hostname, ()))
+
+    def has_component(self, component_name):
+        return component_name in self._hosts_by_component
+
+    @property
+    def is_namenode_ha(self):
+        return len(self._hosts_by_component.get('NAMENODE', ())) > 1
@@ -0,0 +1,282 @@
+import atexit
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_PATH = os.path.join(
+    os.environ.get('XDG_STATE_HOME', os.path.join(os.path.expanduser('~'), '.local', 'state')),
+    'knox-utility', 'changes.journal')
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_KEEP = 4
+
+# File layout: MAGIC, then one frame per config write:
+#   >II (header length, body length), header (JSON), body (zlib-compressed JSON), END
+# The header is small and uncompressed so listing never inflates a body. END lets a writer
+# notice a frame torn by a crash and cut it off before appending.
+MAGIC = b'KNOXJRN1'
+FRAME = struct.Struct('>II')
+END = b'KJ\r\n'
+
+Entry = namedtuple('Entry', 'header path offset length')
+
+
+def pack(header, payload):
+    """One frame: header (a dict, stored as plain JSON) and payload (stored as zlib-compressed JSON)."""
+    import zlib
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    body = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6)
+    return FRAME.pack(len(header), len(body)) + header + body + END
+
+def encode(record):
+    """Returns the frame for a record {'time', 'ambari', 'cluster', 'tag', 'note', 'changes': [...]}."""
+    summary = dict((change['type'], {'added': len(change['added']), 'changed': len(change['changed']),
+                                     'removed': len(change['removed']), 'attributes': 'attributes' in change})
+                   for change in record['changes'])
+    return pack({'time': record['time'], 'ambari': record['ambari'], 'cluster': record['cluster'],
+                 'tag': record['tag'], 'note': record['note'], 'types': summary}, record['changes'])
+
+
+class Journal:
+    """
+    Append-only log of every config version this process writes, with its property diff.
+
+    append() only queues the record: encoding, compression and the write happen on a
+    background thread, so a PUT is never slowed down by disk I/O. Writers in different
+    processes (CLI, daemon, watch) take an flock on the file for each append. Once the
+    file would grow past max_bytes it is rotated to .1, .2, ... and at most `keep` old
+    files are kept. Queued records are flushed at interpreter exit.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, keep=DEFAULT_KEEP):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = max(0, keep)
+        self.written = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def append(self, ambari, cluster, tag, note, changes):
+        """
+        Queues one config write to cluster on the Ambari server ambari ('host:port');
+        changes is a list of configs.property_changes() dicts.
+        """
+        self._queue.put({'time': time.time(), 'ambari': ambari, 'cluster': cluster, 'tag': tag, 'note': note,
+                         'changes': changes})
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-journal', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Blocks until every queued record is on disk."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self.write(encode(record))
+                self.written += 1
+            except Exception as e:
+                print(f"[WARN] Could not write change journal {self.path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def write(self, frame):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        while True:
+            fd, size = lock(self.path)
+            try:
+                if size > len(MAGIC) and size + len(frame) > self.max_bytes:
+                    self._rotate()
+                    continue
+                os.write(fd, (MAGIC if size == 0 else b'') + frame)
+                return
+            finally:
+                os.close(fd)
+
+    def _rotate(self):
+        """Shifts path -> path.1 -> path.2 ...; the oldest beyond `keep` is deleted. Called under the flock."""
+        for index in range(self.keep, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if self.keep == 0:
+            os.remove(self.path)
+
+
+def lock(path, magic=MAGIC):
+    """
+    Opens a framed file for appending under an exclusive flock and cuts off a frame torn
+    by a crash. Returns (fd, size); the caller closes fd, which releases the lock.
+    """
+    import fcntl
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Another process may have rotated or replaced the file while we waited for the lock
+            if os.path.exists(path) and os.path.samestat(os.fstat(fd), os.stat(path)):
+                size = os.fstat(fd).st_size
+                if size and (size <= len(magic) or os.pread(fd, len(END), size - len(END)) != END):
+                    size = _valid_length(fd, magic)
+                    os.ftruncate(fd, size)
+                return fd, size
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+
+def _valid_length(fd, magic=MAGIC):
+    """Length of the intact prefix of a framed file: magic and every complete frame."""
+    size = os.fstat(fd).st_size
+    if os.pread(fd, len(magic), 0) != magic:
+        return 0
+    offset = len(magic)
+    while offset + FRAME.size <= size:
+        header_length, body_length = FRAME.unpack(os.pread(fd, FRAME.size, offset))
+        end = offset + FRAME.size + header_length + body_length + len(END)
+        if end > size or os.pread(fd, len(END), end - len(END)) != END:
+            break
+        offset = end
+    return offset
+
+def frames(f):
+    """
+    Yields (header, start, offset, length, end) per complete frame of a file positioned after
+    its magic: the parsed header, where the frame starts and ends, and where its body lies.
+    """
+    while True:
+        start = f.tell()
+        prefix = f.read(FRAME.size)
+        if len(prefix) < FRAME.size:
+            return
+        header_length, body_length = FRAME.unpack(prefix)
+        header = f.read(header_length)
+        offset = f.tell()
+        if len(header) < header_length:
+            return
+        try:
+            header = json.loads(header)
+        except ValueError:
+            return
+        # A frame cut short by a crash ends the file
+        f.seek(body_length, os.SEEK_CUR)
+        if f.read(len(END)) != END:
+            return
+        yield header, start, offset, body_length, f.tell()
+
+def read_payload(path, offset, length):
+    import zlib
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(zlib.decompress(f.read(length)))
+
+def journal_files(path=DEFAULT_PATH):
+    """The journal and its rotated files, oldest first."""
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    return list(reversed(rotated)) + ([path] if os.path.exists(path) else [])
+
+def iter_entries(path=DEFAULT_PATH):
+    """Yields an Entry per recorded write, oldest first, reading only the headers."""
+    for file_path in journal_files(path):
+        with open(file_path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                continue
+            for header, _, offset, length, _ in frames(f):
+                yield Entry(header, file_path, offset, length)
+
+def read_changes(entry):
+    """Inflates an entry's body: the list of per-type property changes."""
+    return read_payload(entry.path, entry.offset, entry.length)
+
+def find(tag, path=DEFAULT_PATH):
+    """The newest entry whose tag equals or starts with `tag`, or None."""
+    found = None
+    for entry in iter_entries(path):
+        if entry.header['tag'].startswith(tag):
+            found = entry
+    return found
+
+
+def _summary(types):
+    parts = []
+    for config_type, counts in types.items():
+        detail = [f"{sign}{counts[key]}" for sign, key in (('+', 'added'), ('~', 'changed'), ('-', 'removed'))
+                  if counts[key]]
+        if counts['attributes']:
+            detail.append('attributes')
+        parts.append(f"{config_type}({' '.join(detail)})")
+    return ', '.join(parts)
+
+def _server(header):
+    # Records written before the Ambari server was recorded
+    return header.get('ambari') or '?'
+
+def print_history(limit=20, path=DEFAULT_PATH, cluster=None):
+    entries = [entry for entry in iter_entries(path) if cluster is None or entry.header['cluster'] == cluster]
+    if not entries:
+        print(f"[INFO] No changes recorded in {path}")
+        return
+    for entry in entries[-limit:] if limit else entries:
+        header = entry.header
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['time']))
+        print(f"{stamp}  {_server(header)}  {header['cluster']}  {header['tag']}  {_summary(header['types'])}"
+              + (f"  \"{header['note']}\"" if header.get('note') else ''))
+
+def print_change(tag, path=DEFAULT_PATH):
+    import difflib
+    entry = find(tag, path)
+    if entry is None:
+        print(f"[ERROR] No change with tag {tag} in {path}")
+        return 1
+    header = entry.header
+    print(f"Tag {header['tag']} on cluster {header['cluster']} (Ambari {_server(header)}), "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['time']))}"
+          + (f": {header['note']}" if header.get('note') else ''))
+    for change in read_changes(entry):
+        print(f"--- {change['type']}")
+        for key, value in sorted(change['added'].items()):
+            print(f"+ {key} = {value}")
+        for key, value in sorted(change['removed'].items()):
+            print(f"- {key} (was {value})")
+        for key, (old, new) in sorted(change['changed'].items()):
+            if '\n' in str(old) or '\n' in str(new):
+                print(f"~ {key}:")
+                for line in difflib.unified_diff(str(old).splitlines(), str(new).splitlines(), 'before', 'after',
+                                                 lineterm=''):
+                    print(f"    {line}")
+            else:
+                print(f"~ {key}: {old} -> {new}")
+        if 'attributes' in change:
+            print(f"~ properties_attributes: {json.dumps(change['attributes'][0])} -> {json.dumps(change['attributes'][1])}")
+    return 0
+
+
+def install():
+    """
+    Records every config write made through configs.py / the async client in this process
+    in the journal configured in config.ini (journal_path, journal_max_mb, journal_keep).
+    """
+    from . import configs
+    from .params import JOURNAL_PATH, JOURNAL_MAX_MB, JOURNAL_KEEP
+    if JOURNAL_MAX_MB <= 0:
+        configs.change_journal = None
+        return None
+    if configs.change_journal is None:
+        configs.change_journal = Journal(JOURNAL_PATH or DEFAULT_PATH, JOURNAL_MAX_MB * 1024 * 1024, JOURNAL_KEEP)
+    return configs.change_journal
+
+def configured_path():
+    from .params import JOURNAL_PATH
+    return JOURNAL_PATH or DEFAULT_PATH
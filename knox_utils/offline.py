@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from . import configs
+
+FORMAT = 1
+
+# Layout of a snapshot file (gzip-compressed JSON):
+#   {'format', 'exported' (unix time), 'ambari': {'protocol', 'host', 'port'}, 'cluster',
+#    'knox_installed', 'desired_configs': {type: tag}, 'configs': [{'type', 'tag', 'properties',
+#    'properties_attributes'}], 'hosts': [[hostname, [component, ...]], ...] (HostComponentIndex.rows())}
+# Config bodies are kept for the types get_topology_vars, set_knox_whitelist, set_knox_proxy_users
+# and apply_topology_to_knox read; Ambari credentials are never written.
+
+# (type, tag) pairs of a configurations URL, single or OR-ed into one predicate
+_TYPE_TAG = re.compile(r'type=([^&|()]+)&tag=([^&|()]+)')
+
+
+async def sweep(client, config_types, page_size=None):
+    """
+    Fetches everything a snapshot holds in one concurrent sweep on client (an AsyncAmbariClient):
+    desired_configs and then the config bodies, the host/component pages and the KNOX service lookup.
+    """
+    async def config_bodies():
+        tags = await client.get_desired_tags()
+        return tags, await client.get_configs_by_tag([(t, tags[t]) for t in config_types if t in tags])
+    host_index_call = client.get_host_index(page_size) if page_size else client.get_host_index()
+    (tags, configs_by_tag), host_index, knox = await asyncio.gather(
+        config_bodies(), host_index_call, client.get_service('KNOX'))
+    return {
+        'format': FORMAT,
+        'exported': time.time(),
+        'ambari': {'protocol': client.protocol, 'host': client.host, 'port': str(client.port)},
+        'cluster': client.cluster_name,
+        'knox_installed': knox is not None and 'ServiceInfo' in knox,
+        'desired_configs': tags,
+        'configs': [{'type': config_type, 'tag': tag, 'properties': properties, 'properties_attributes': attributes}
+                    for (config_type, tag), (properties, attributes) in configs_by_tag.items()],
+        'hosts': host_index.rows(),
+    }
+
+def write(path, data):
+    """Writes a snapshot atomically, readable by the owner only (config bodies may hold secrets)."""
+    import tempfile
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as f:
+            f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def load(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f, object_pairs_hook=OrderedDict)
+    if data.get('format') != FORMAT:
+        raise ValueError(f"{path} is not a knox-utility snapshot (format {data.get('format')}, expected {FORMAT})")
+    return data
+
+def export_snapshot(path):
+    """Exports the configured cluster to a snapshot file; returns the snapshot dict."""
+    from .async_client import AsyncAmbariClient
+    from .cluster import KNOX_CONFIG_TYPES, TOPOLOGY_CONFIG_TYPES
+    from .params import HOSTS_PAGE_SIZE
+
+    async def run():
+        async with AsyncAmbariClient.from_params() as client:
+            return await sweep(client, KNOX_CONFIG_TYPES + TOPOLOGY_CONFIG_TYPES, HOSTS_PAGE_SIZE)
+    started = time.perf_counter()
+    data = asyncio.run(run())
+    write(path, data)
+    print(f"[INFO] Snapshot of cluster {data['cluster']} ({len(data['configs'])} config type(s), "
+          f"{len(data['hosts'])} host(s)) written to {path} in {time.perf_counter() - started:.2f}s, "
+          f"{os.path.getsize(path)} bytes")
+    return data
+
+
+class OfflineAccessor:
+    """
+    Stands in for configs.api_accessor in a --snapshot run. The shared ClusterConfigSnapshot and
+    host index are primed from the file, so the few remaining GETs (KNOX lookup, desired_configs,
+    configurations) are answered from it too. A GET for anything the file does not hold gets a
+    404; PUTs are never sent, only reported (dry run).
+    """
+    pool = None
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        self.puts = []
+        self.ambari = configs.ambari_address(data['ambari']['host'], data['ambari']['port'])
+        self._configs = dict(((c['type'], c['tag']), c) for c in data['configs'])
+
+    def __call__(self, api_url, request_type=configs.GET_REQUEST_TYPE, request_body=None):
+        status, body = self.fetch(api_url, request_type, request_body)
+        if status >= 400:
+            raise Exception('Problem with accessing api. Reason: HTTP Error {0}: {1}'.format(status, json.loads(body)['message']))
+        return body
+
+    def fetch(self, api_url, request_type=configs.GET_REQUEST_TYPE, request_body=None):
+        if request_type != configs.GET_REQUEST_TYPE:
+            self.puts.append((request_type, api_url, request_body))
+            print(f"[SNAPSHOT] Dry run: {request_type} {api_url} not sent ({len(request_body or b'')} bytes)")
+            return 200, ''
+        parts = urlsplit(api_url)
+        cluster_path = f"/api/v1/clusters/{self.data['cluster']}"
+        if parts.path == '/api/v1/clusters':
+            body = {'items': [{'Clusters': {'cluster_name': self.data['cluster']}}]}
+        elif parts.path == cluster_path:
+            body = {'Clusters': {'desired_configs': dict((config_type, {'tag': tag})
+                                                         for config_type, tag in self.data['desired_configs'].items())}}
+        elif parts.path == cluster_path + '/services/KNOX':
+            if not self.data['knox_installed']:
+                return 404, json.dumps({'status': 404, 'message': 'Service not found'})
+            body = {'ServiceInfo': {'cluster_name': self.data['cluster'], 'service_name': 'KNOX'}}
+        elif parts.path == cluster_path + '/configurations':
+            body = {'items': [self._configs[type_tag] for type_tag in _TYPE_TAG.findall(unquote(parts.query))
+                              if type_tag in self._configs]}
+        else:
+            return 404, json.dumps({'status': 404, 'message': f"{parts.path} is not in snapshot {self.path}"})
+        return 200, json.dumps(body)
+
+    def close(self):
+        pass
+
+
+def activate(path):
+    """
+    Serves this process's cluster reads from a snapshot file instead of Ambari: the connection
+    settings and cluster name are overridden with the exported ones (so topology variables come
+    out as they would live), and the shared accessor, config snapshot and host index are seeded
+    from the file. Returns the snapshot dict.
+    """
+    from . import cluster, params
+    from .host_index import HostComponentIndex
+    data = load(path)
+    for option, value in data['ambari'].items():
+        params.override(option, value)
+    params.override('cluster_name', data['cluster'])
+    accessor = OfflineAccessor(data, path)
+    snapshot = configs.ClusterConfigSnapshot(data['cluster'], accessor)
+    snapshot.prime(data['desired_configs'], dict(((c['type'], c['tag']), (c['properties'], c['properties_attributes']))
+                                                 for c in data['configs']))
+    cluster.seed(accessor, snapshot, HostComponentIndex.from_rows(data['hosts']))
+    exported = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['exported']))
+    print(f"[INFO] Offline run on snapshot {path} of cluster {data['cluster']} (exported {exported}); "
+          f"nothing is sent to Ambari.")
+    return data
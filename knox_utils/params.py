@@ -1,19 +1,282 @@
 import os
-import configparser
 
-CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.ini'))
-
-config = configparser.ConfigParser()
-config.read(CONFIG_PATH)
+CONFIG_PATH = os.environ.get('KNOX_UTILITY_CONFIG') or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.ini'))
 
 # All possible variables needed for the app
 AMBARI_PROPERTIES_PATH = '/etc/ambari-server/conf/ambari.properties'
-USERNAME = config.get('ambari', 'username', fallback='admin')
-PASSWORD = config.get('ambari', 'password', fallback='admin')
-CLUSTER_NAME = config.get('ambari', 'cluster_name', fallback='mycluster')
-PROTOCOL = config.get('ambari', 'protocol', fallback='http')
-PORT = config.get('ambari', 'port', fallback='8080')
-AMBARI_HOST = config.get('ambari', 'host', fallback='localhost')
-AMBARI_BASE_URL = f"{PROTOCOL}://{AMBARI_HOST}:{PORT}"
-
-# Add more variables as needed for future features
+
+# Overrides any option for one process, e.g. KNOX_UTILITY_PASSWORD or KNOX_UTILITY_REQUEST_TIMEOUT
+ENV_PREFIX = 'KNOX_UTILITY_'
+# Keys of ambari.properties that decide the protocol / port config.ini points at
+SSL_ENABLED_PROPERTY = 'api.ssl'
+SSL_PORT_PROPERTY = 'client.api.ssl.port'
+
+# Settings of the [ambari] section of config.ini: name -> (option, type, fallback).
+# They are resolved (see Resolver) on first access of any of them (see __getattr__), not at
+# import, so commands that do not need them (or run update_config_if_needed first) pay nothing.
+SETTINGS = {
+    'USERNAME': ('username', str, 'admin'),
+    'PASSWORD': ('password', str, 'admin'),
+    'CLUSTER_NAME': ('cluster_name', str, 'mycluster'),
+    'PROTOCOL': ('protocol', str, 'http'),
+    'PORT': ('port', str, '8080'),
+    'AMBARI_HOST': ('host', str, 'localhost'),
+    # Upper bound on keep-alive connections held open to the Ambari server
+    'MAX_CONNECTIONS': ('max_connections', int, 4),
+    # Seconds one Ambari request attempt may take (connect and each read), and a whole GET
+    # including its retries; 0 leaves the GET deadline unbounded
+    'REQUEST_TIMEOUT': ('request_timeout', float, 10.0),
+    'REQUEST_DEADLINE': ('request_deadline', float, 30.0),
+    # Extra attempts for a GET that failed or got a 5xx, after a jittered exponential backoff
+    'REQUEST_RETRIES': ('request_retries', int, 2),
+    # Resend a GET still unanswered after this percentile of recent GET latencies (but at
+    # least hedge_min_ms; hedge_initial_ms while fewer than ten are known) on a second
+    # connection; 0 disables hedging. PUTs are never resent.
+    'HEDGE_PERCENTILE': ('hedge_percentile', int, 0),
+    'HEDGE_MIN_MS': ('hedge_min_ms', int, 50),
+    'HEDGE_INITIAL_MS': ('hedge_initial_ms', int, 1000),
+    # Concurrent service-discovery tasks run by get_topology_vars
+    'DISCOVERY_WORKERS': ('discovery_workers', int, 4),
+    # Hosts fetched per page when enumerating cluster hosts
+    'HOSTS_PAGE_SIZE': ('hosts_page_size', int, 1000),
+    # Sub-domains listed in the whitelist regex under one parent before it is wildcarded
+    'WHITELIST_MAX_ALTERNATIVES': ('whitelist_max_alternatives', int, 32),
+    # A generated whitelist slower than this many microseconds per URL is not applied; 0 skips the timing
+    'WHITELIST_MAX_MATCH_US': ('whitelist_max_match_us', float, 50.0),
+    # On-disk cache of config bodies keyed by (type, tag); 0 MB disables it
+    'CONFIG_CACHE_DIR': ('config_cache_dir', str, None),
+    'CONFIG_CACHE_MAX_MB': ('config_cache_max_mb', int, 64),
+    # Compiled Jinja template bytecode (default ~/.cache/knox-utility/jinja)
+    'TEMPLATE_CACHE_DIR': ('template_cache_dir', str, None),
+    # Optional copy of the rendered topology written before it is applied; unset skips the file
+    'RENDERED_TOPOLOGY_PATH': ('rendered_topology_path', str, None),
+    # Unix socket of the resident daemon (default $XDG_RUNTIME_DIR/knox-utility.sock)
+    'DAEMON_SOCKET': ('daemon_socket', str, None),
+    # Seconds the daemon keeps its host/component index before fetching it again
+    'HOST_INDEX_TTL': ('host_index_ttl', int, 300),
+    # Seconds between desired_configs polls in --watch mode
+    'WATCH_INTERVAL': ('watch_interval', int, 60),
+    # TLS certificate checks for https Ambari (see tls.py): auto (verify, else pin the
+    # self-signed certificate on first use), true (verify only) or false (no checks)
+    'TLS_VERIFY': ('tls_verify', str, 'auto'),
+    'TLS_CA_FILE': ('tls_ca_file', str, None),
+    # Expected SHA-256 of the server certificate; overrides the auto decision
+    'TLS_FINGERPRINT': ('tls_fingerprint', str, None),
+    # Where TLS decisions are remembered (default ~/.cache/knox-utility/tls.json)
+    'TLS_STATE_FILE': ('tls_state_file', str, None),
+    # Append-only journal of every config version written, with its property diff
+    # (default ~/.local/state/knox-utility/changes.journal); rotated past journal_max_mb,
+    # keeping journal_keep old files. 0 MB disables it.
+    'JOURNAL_PATH': ('journal_path', str, None),
+    'JOURNAL_MAX_MB': ('journal_max_mb', int, 16),
+    'JOURNAL_KEEP': ('journal_keep', int, 4),
+    # Local history of every config version read or written, as deltas, for --versions and
+    # --rollback (default ~/.local/state/knox-utility/history); keeps history_max_versions
+    # per config type. 0 disables it.
+    'HISTORY_DIR': ('history_dir', str, None),
+    'HISTORY_MAX_VERSIONS': ('history_max_versions', int, 100),
+}
+
+_resolver = None
+
+
+def fingerprint(path):
+    """(device, inode, mtime, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def read_ambari_properties(path=AMBARI_PROPERTIES_PATH):
+    """The protocol and port an Ambari server's ambari.properties says its API listens on."""
+    protocol, port = 'http', 8080
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition('=')
+            key = key.strip()
+            if key == SSL_PORT_PROPERTY:
+                port = int(value.strip())
+            elif key == SSL_ENABLED_PROPERTY:
+                protocol = 'https' if value.strip().lower() == 'true' else 'http'
+    return {'protocol': protocol, 'port': str(port)}
+
+def write_options(path, values, section='ambari'):
+    """
+    Sets options of one section of an INI file in a single atomic replace. Other lines,
+    comments included, are kept; options not in the file yet are added to the section.
+    """
+    import re
+    import tempfile
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        lines, mode = [], 0o600
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    header = re.compile(r'^\s*\[([^\]]+)\]')
+    option = re.compile(r'^([^\s;#=:][^=:]*?)\s*[=:]')
+    pending = dict((key.lower(), str(value)) for key, value in values.items())
+    output = []
+    in_section = False
+    section_end = None
+    skipping = False
+    for line in lines:
+        match = header.match(line)
+        if match:
+            if in_section:
+                section_end = len(output)
+            in_section = match.group(1).strip() == section
+            skipping = False
+            output.append(line)
+            continue
+        if skipping and line[:1] in (' ', '\t') and line.strip():
+            continue  # continuation of a value being replaced
+        skipping = False
+        match = option.match(line) if in_section else None
+        if match and match.group(1).lower() in pending:
+            key = match.group(1).lower()
+            output.append(f"{key} = {pending.pop(key)}\n")
+            skipping = True
+            continue
+        output.append(line)
+    if in_section:
+        section_end = len(output)
+    added = [f"{key} = {value}\n" for key, value in pending.items()]
+    if section_end is None:
+        output += (['\n'] if output else []) + [f"[{section}]\n"] + added
+    else:
+        # After the section's last option, before the blank lines that separate it from the next one
+        while section_end > 0 and not output[section_end - 1].strip():
+            section_end -= 1
+        output[section_end:section_end] = added
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.config.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(output)
+        os.chmod(temporary, mode)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class Resolver:
+    """
+    Resolves the [ambari] options from every source there is, highest first: overrides
+    (CLI flags), KNOX_UTILITY_<OPTION> environment variables, keys staged with set(), config.ini,
+    and the SETTINGS fallbacks. ambari.properties is merged in by sync_ambari_properties().
+
+    The parsed config.ini is cached with the file's fingerprint and parsed again only once
+    the file changes, so a long-running process can re-resolve cheaply. set() only stages a
+    key; save() writes every staged key to config.ini in one atomic replace.
+    """
+
+    def __init__(self, config_path=CONFIG_PATH, properties_path=AMBARI_PROPERTIES_PATH, environ=None):
+        self.config_path = config_path
+        self.properties_path = properties_path
+        self.environ = os.environ if environ is None else environ
+        self.overrides = {}
+        self.staged = {}
+        self._file = None
+
+    def file_options(self):
+        """The [ambari] options of config.ini, parsed again only if the file changed."""
+        current = fingerprint(self.config_path)
+        if self._file is None or self._file[0] != current:
+            import configparser
+            config = configparser.ConfigParser()
+            config.read(self.config_path)
+            self._file = (current, dict(config['ambari']) if 'ambari' in config else {})
+        return self._file[1]
+
+    def raw(self, option):
+        """The string value of an option from the highest source that sets it, or None."""
+        if option in self.overrides:
+            return self.overrides[option]
+        value = self.environ.get(ENV_PREFIX + option.upper())
+        if value is not None:
+            return value
+        if option in self.staged:
+            return self.staged[option]
+        return self.file_options().get(option)
+
+    def get(self, name):
+        """A SETTINGS entry, converted to its type."""
+        option, kind, fallback = SETTINGS[name]
+        value = self.raw(option)
+        if value is None:
+            return fallback
+        return kind(value.strip()) if kind in (int, float) else value
+
+    def options(self):
+        """Every option set by any source, resolved."""
+        names = set(self.file_options()) | set(self.staged) | set(self.overrides)
+        names |= set(option for option, _, _ in SETTINGS.values()
+                     if self.environ.get(ENV_PREFIX + option.upper()) is not None)
+        return dict((option, self.raw(option)) for option in sorted(names) if self.raw(option) is not None)
+
+    def set(self, option, value):
+        self.staged[option.lower()] = str(value)
+
+    def save(self):
+        """Writes the staged keys that differ from config.ini; returns whether the file was written."""
+        current = self.file_options()
+        changed = dict((key, value) for key, value in self.staged.items() if current.get(key) != value)
+        self.staged = {}
+        if not changed:
+            return False
+        write_options(self.config_path, changed)
+        return True
+
+    def sync_ambari_properties(self):
+        """
+        Stages protocol and port from ambari.properties if it changed after config.ini was last
+        written, and saves them. Returns whether config.ini was written. The common case (nothing
+        to do) costs two stat calls.
+        """
+        properties = fingerprint(self.properties_path)
+        config = fingerprint(self.config_path)
+        if properties is None or config is None or properties[2] <= config[2]:
+            return False
+        for key, value in read_ambari_properties(self.properties_path).items():
+            self.set(key, value)
+        if not self.save():
+            # Same values: mark config.ini as up to date so ambari.properties is not read again
+            os.utime(self.config_path)
+        return True
+
+
+def resolver():
+    """The process-wide Resolver for CONFIG_PATH."""
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+def override(option, value):
+    """Sets an option for this process only, above every other source (e.g. from a CLI flag)."""
+    resolver().overrides[option.lower()] = str(value)
+    reload()
+
+def reload():
+    """Drops every setting resolved so far; the next access resolves it again."""
+    for name in list(SETTINGS) + ['AMBARI_BASE_URL']:
+        globals().pop(name, None)
+
+def _setting(name):
+    return globals()[name] if name in globals() else __getattr__(name)
+
+def __getattr__(name):
+    if name == 'AMBARI_BASE_URL':
+        value = f"{_setting('PROTOCOL')}://{_setting('AMBARI_HOST')}:{_setting('PORT')}"
+    elif name in SETTINGS:
+        value = resolver().get(name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Cache it as a plain module attribute so later lookups (and overrides) skip this hook
+    globals()[name] = value
+    return value
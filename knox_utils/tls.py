@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import ssl
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_STATE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'knox-utility', 'tls.json')
+PROBE_TIMEOUT = 10
+
+# How the certificate of an Ambari server is checked:
+#   verify   - CA chain and hostname (system store, or tls_ca_file)
+#   pinned   - SHA-256 of the server certificate must match (self-signed servers)
+#   insecure - no check at all (tls_verify = false)
+VERIFY = 'verify'
+PINNED = 'pinned'
+INSECURE = 'insecure'
+
+TlsDecision = namedtuple('TlsDecision', 'mode fingerprint')
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+_state_lock = threading.Lock()
+
+
+def fingerprint(der_certificate):
+    return hashlib.sha256(der_certificate).hexdigest()
+
+def normalize_fingerprint(value):
+    return value.replace(':', '').replace(' ', '').lower() if value else None
+
+
+class TlsContext(ssl.SSLContext):
+    """
+    Client SSLContext shared by every connection to one Ambari server.
+
+    Connection pools hand over each connection's TLS session after a response
+    (remember(); TLS 1.3 tickets only arrive then), and it is offered on the next
+    handshake so new connections resume instead of doing a full one. In PINNED mode
+    the peer certificate's SHA-256 is checked right after the handshake, before any
+    request is sent.
+    """
+
+    def __new__(cls, decision, ca_file=None):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self, decision, ca_file=None):
+        super().__init__()
+        self.decision = decision
+        self.handshakes = 0
+        self.resumed = 0
+        self._session = None
+        if decision.mode == VERIFY:
+            self.load_default_certs()
+            if ca_file:
+                self.load_verify_locations(ca_file)
+        else:
+            self.check_hostname = False
+            self.verify_mode = ssl.CERT_NONE
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        tls_socket = super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                         server_hostname, session or self._session)
+        try:
+            self.check_peer(tls_socket)
+        except ssl.SSLError:
+            tls_socket.close()
+            raise
+        return tls_socket
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        # Used by asyncio; the handshake has not happened yet, so the caller runs check_peer afterwards
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session or self._session)
+
+    def remember(self, ssl_object):
+        """Keeps the session of a socket / asyncio ssl_object that has completed a request, for resumption."""
+        session = getattr(ssl_object, 'session', None)
+        if session is not None:
+            self._session = session
+
+    def check_peer(self, ssl_object):
+        """Counts the handshake and enforces the pinned fingerprint on a socket or asyncio ssl_object."""
+        self.handshakes += 1
+        if ssl_object.session_reused:
+            self.resumed += 1
+        if self.decision.mode == PINNED:
+            actual = fingerprint(ssl_object.getpeercert(binary_form=True))
+            if actual != self.decision.fingerprint:
+                raise ssl.SSLCertVerificationError(
+                    f"certificate fingerprint mismatch: pinned sha256 {self.decision.fingerprint}, server sent {actual}. "
+                    f"If the certificate was replaced on purpose, run with --tls-reset")
+
+
+def _state_path():
+    from .params import TLS_STATE_FILE
+    return TLS_STATE_FILE or DEFAULT_STATE_PATH
+
+def load_decisions(path=None):
+    try:
+        with open(path or _state_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_decisions(path, decisions):
+    """Replaces the state file atomically, so a reader never sees a partly written one. Call with _state_lock held."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(decisions, f, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+def save_decision(host, port, decision, path=None):
+    path = path or _state_path()
+    with _state_lock:
+        decisions = load_decisions(path)
+        decisions[f"{host}:{port}"] = {'mode': decision.mode, 'fingerprint': decision.fingerprint,
+                                       'decided': int(time.time())}
+        try:
+            _write_decisions(path, decisions)
+        except OSError as e:
+            print(f"[WARN] Could not save TLS decision to {path}: {e}")
+
+def forget(host, port, path=None):
+    """Drops the stored decision (and cached context) for host:port so the next connection decides again."""
+    path = path or _state_path()
+    with _contexts_lock:
+        _contexts.pop((host, int(port)), None)
+    with _state_lock:
+        decisions = load_decisions(path)
+        if decisions.pop(f"{host}:{port}", None) is not None:
+            try:
+                _write_decisions(path, decisions)
+            except OSError as e:
+                print(f"[WARN] Could not update TLS decisions in {path}: {e}")
+                return
+            print(f"[INFO] Forgot TLS decision for {host}:{port}")
+
+def probe(host, port, ca_file=None, timeout=PROBE_TIMEOUT):
+    """
+    Tries one verified handshake. Returns (True, der) if the certificate verifies,
+    or (False, der) with the certificate the server presented if it does not.
+    """
+    from .configs import connect, get_proxy
+    proxy = get_proxy('https', host, port)
+    context = ssl.create_default_context(cafile=ca_file)
+    with connect(host, port, timeout, proxy) as sock:
+        try:
+            with context.wrap_socket(sock, server_hostname=host) as tls_socket:
+                return True, tls_socket.getpeercert(binary_form=True)
+        except ssl.SSLCertVerificationError:
+            pass
+    unverified = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    unverified.check_hostname = False
+    unverified.verify_mode = ssl.CERT_NONE
+    with connect(host, port, timeout, proxy) as sock:
+        with unverified.wrap_socket(sock, server_hostname=host) as tls_socket:
+            return False, tls_socket.getpeercert(binary_form=True)
+
+def decide(host, port, mode='auto', ca_file=None, pinned=None):
+    """
+    Returns the TlsDecision for host:port. tls_fingerprint pins that certificate, tls_verify = true
+    always verifies and false never checks. With auto the stored decision is used if there is one;
+    otherwise the server is probed once: a certificate that verifies is verified from then on, one
+    that does not (self-signed) is pinned by fingerprint, and the decision is saved for later runs.
+    """
+    mode = (mode or 'auto').lower()
+    if mode in ('false', 'no', 'off', INSECURE):
+        return TlsDecision(INSECURE, None)
+    if pinned:
+        return TlsDecision(PINNED, normalize_fingerprint(pinned))
+    if mode != 'auto':
+        return TlsDecision(VERIFY, None)
+    stored = load_decisions().get(f"{host}:{port}")
+    if stored and stored.get('mode') in (VERIFY, PINNED):
+        return TlsDecision(stored['mode'], stored.get('fingerprint'))
+    verified, der = probe(host, port, ca_file)
+    if verified:
+        decision = TlsDecision(VERIFY, None)
+    else:
+        decision = TlsDecision(PINNED, fingerprint(der))
+        print(f"[WARN] Certificate of {host}:{port} does not verify against the trusted CAs; "
+              f"pinning sha256 {decision.fingerprint} for this and later runs.")
+    save_decision(host, port, decision)
+    return decision
+
+def get_context(host, port):
+    """
+    Returns the process-wide TlsContext for host:port, deciding its verification mode on
+    first use from tls_verify / tls_ca_file / tls_fingerprint in config.ini.
+    """
+    from .params import TLS_VERIFY, TLS_CA_FILE, TLS_FINGERPRINT
+    key = (host, int(port))
+    with _contexts_lock:
+        if key not in _contexts:
+            _contexts[key] = TlsContext(decide(host, int(port), TLS_VERIFY, TLS_CA_FILE, TLS_FINGERPRINT), TLS_CA_FILE)
+        return _contexts[key]
+
+def summary():
+    """One line per context used in this process: mode, handshakes and how many were resumed."""
+    with _contexts_lock:
+        return [f"{host}:{port} {context.decision.mode}, {context.handshakes} handshake(s), {context.resumed} resumed"
+                for (host, port), context in _contexts.items()]
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+TEMPLATE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
+TEMPLATE_NAME = 'advaned_topology_template.j2'
+DEFAULT_BYTECODE_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'knox-utility', 'jinja')
+# Where flush_topology_to_local has always written the rendered topology
+DEFAULT_RENDERED_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rendered_topology.xml'))
+
+RenderedTopology = namedtuple('RenderedTopology', 'xml sha256')
+
+_environment = None
+_environment_lock = threading.Lock()
+
+
+def content_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def get_environment():
+    """
+    Returns the process-wide Jinja Environment. Parsed templates stay in its in-memory
+    cache, and compiled bytecode is kept on disk so later runs skip parsing entirely.
+    """
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+            from .params import TEMPLATE_CACHE_DIR
+            bytecode_cache = None
+            cache_dir = TEMPLATE_CACHE_DIR or DEFAULT_BYTECODE_CACHE_DIR
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            except OSError as e:
+                print(f"[WARN] Template bytecode cache disabled ({cache_dir}): {e}")
+            _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), bytecode_cache=bytecode_cache)
+    return _environment
+
+def render(topology_vars):
+    """Renders the advanced topology template in memory; returns a RenderedTopology."""
+    from . import tracing
+    with tracing.phase('render topology'):
+        xml = get_environment().get_template(TEMPLATE_NAME).render(**topology_vars)
+    return RenderedTopology(xml, content_hash(xml))
+
+def current_hash(snapshot):
+    """sha256 of the topology 'content' currently in Ambari, or None if there is none."""
+    if not snapshot.has('topology'):
+        return None
+    properties, _ = snapshot.get('topology')
+    if 'content' not in properties:
+        return None
+    return content_hash(properties['content'])
+
+def is_current(rendered, snapshot):
+    return rendered.sha256 == current_hash(snapshot)
+
+def write_artifact(rendered, path=None):
+    """
+    Writes the rendered topology to path (default rendered_topology.xml in the repo root),
+    unless the file there already has the same content. Returns the path.
+    """
+    path = path or DEFAULT_RENDERED_PATH
+    try:
+        with open(path, 'r') as f:
+            if content_hash(f.read()) == rendered.sha256:
+                print(f"[INFO] Rendered topology at {path} is already up to date")
+                return path
+    except OSError:
+        pass
+    with open(path, 'w') as f:
+        f.write(rendered.xml)
+    print(f"[SUCCESS] Rendered topology written to {path}")
+    return path
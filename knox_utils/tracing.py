@@ -0,0 +1,237 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+METRIC_PREFIX = 'knox_utility'
+
+_CLUSTER_PATH = re.compile(r'^(/api/v1/clusters/)[^/]+')
+_HOST_PATH = re.compile(r'(/hosts/)[^/]+')
+_DESIRED_CONFIG_FIELD = re.compile(r'(Clusters/desired_configs/)[^,]+')
+# Query parameters whose value identifies the endpoint rather than one call of it
+_TEMPLATE_PARAMS = ('fields', 'minimal_response')
+
+_tracer = None
+
+
+def url_template(url):
+    """
+    Reduces an Ambari URL to the endpoint it calls, e.g.
+    /api/v1/clusters/prod/configurations?(type=a&tag=b)|(..) -> /api/v1/clusters/{cluster}/configurations?{predicate}
+    /api/v1/clusters/prod?fields=Clusters/desired_configs/core-site -> ...?fields=Clusters/desired_configs/{type}
+    """
+    parts = urlsplit(url)
+    path = _HOST_PATH.sub(r'\1{host}', _CLUSTER_PATH.sub(r'\1{cluster}', parts.path))
+    query = unquote(parts.query)
+    if not query:
+        return path
+    if query.startswith('(') or '|' in query:
+        return path + '?{predicate}'
+    params = []
+    for param in query.split('&'):
+        key, _, value = param.partition('=')
+        if key == 'fields':
+            value = _DESIRED_CONFIG_FIELD.sub(r'\1{type}', value)
+        params.append(f"{key}={value}" if key in _TEMPLATE_PARAMS else f"{key}={{}}")
+    return path + '?' + '&'.join(params)
+
+
+class Tracer:
+    """
+    Collects one event per Ambari request (method, URL template, status, latency,
+    bytes on the wire and decoded, retries, whether it was hedged) and per timed phase (rendering, parsing) for a --profile report.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.requests = []
+        self.phases = []
+
+    def add(self, event):
+        """Records an event dict with 'kind' 'request' or 'phase' (see record_request and phase)."""
+        event = dict(event)
+        event.setdefault('thread', threading.current_thread().name)
+        event.setdefault('end_ms', round((time.perf_counter() - self._origin) * 1000, 3))
+        if event.get('kind') == 'request':
+            event['endpoint'] = url_template(event.get('url', ''))
+        with self._lock:
+            (self.requests if event.get('kind') == 'request' else self.phases).append(event)
+
+    def elapsed(self):
+        return time.perf_counter() - self._origin
+
+    def request_summary(self):
+        """Rows per (method, endpoint), slowest total first."""
+        rows = {}
+        with self._lock:
+            requests = list(self.requests)
+        for event in requests:
+            row = rows.setdefault((event['method'], event['endpoint']), {
+                'method': event['method'], 'endpoint': event['endpoint'], 'calls': 0, 'seconds': 0.0,
+                'max_seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0, 'bytes_decoded': 0, 'retries': 0, 'hedged': 0, 'errors': 0,
+                'statuses': {}})
+            row['calls'] += 1
+            row['seconds'] += event['seconds']
+            row['max_seconds'] = max(row['max_seconds'], event['seconds'])
+            row['bytes_sent'] += event.get('bytes_sent', 0)
+            row['bytes_received'] += event.get('bytes_received', 0)
+            row['bytes_decoded'] += event.get('bytes_decoded', event.get('bytes_received', 0))
+            row['retries'] += event.get('retries', 0)
+            row['hedged'] += 1 if event.get('hedged') else 0
+            status = str(event.get('status'))
+            row['statuses'][status] = row['statuses'].get(status, 0) + 1
+            if event.get('error') or (event.get('status') or 0) >= 400:
+                row['errors'] += 1
+        return sorted(rows.values(), key=lambda row: row['seconds'], reverse=True)
+
+    def totals(self):
+        """
+        Whole-run request totals. partial_calls counts the requests that asked for only some
+        fields (fields=); bytes_decoded - bytes_received is what gzip saved on the wire.
+        """
+        requests = self.request_summary()
+        totals = dict((key, sum(row[key] for row in requests))
+                      for key in ('calls', 'seconds', 'bytes_sent', 'bytes_received', 'bytes_decoded', 'errors'))
+        totals['partial_calls'] = sum(row['calls'] for row in requests if 'fields=' in row['endpoint'])
+        return totals
+
+    def phase_summary(self):
+        rows = {}
+        with self._lock:
+            phases = list(self.phases)
+        for event in phases:
+            row = rows.setdefault(event['name'], {'phase': event['name'], 'calls': 0, 'seconds': 0.0})
+            row['calls'] += 1
+            row['seconds'] += event['seconds']
+        return sorted(rows.values(), key=lambda row: row['seconds'], reverse=True)
+
+    def to_dict(self, action=None):
+        summary = {'requests': self.request_summary(), 'phases': self.phase_summary(), 'totals': self.totals()}
+        with self._lock:
+            return {'action': action, 'started': self.started, 'wall_seconds': round(self.elapsed(), 6),
+                    'requests': list(self.requests), 'phases': list(self.phases), 'summary': summary}
+
+    def write_json(self, path, action=None):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(action), f, indent=2)
+
+    def format_summary(self):
+        requests = self.request_summary()
+        totals = self.totals()
+        lines = [f"[PROFILE] {totals['calls']} Ambari request(s) ({totals['partial_calls']} with fields=), "
+                 f"{totals['seconds'] * 1000:.1f} ms in requests, {self.elapsed() * 1000:.1f} ms wall; "
+                 f"{totals['bytes_received']} bytes received, {totals['bytes_decoded']} decoded"]
+        if requests:
+            width = max(len(row['endpoint']) for row in requests)
+            lines.append(f"  {'method':<6} {'endpoint':<{width}} {'calls':>5} {'total ms':>9} {'max ms':>8} "
+                         f"{'bytes in':>10} {'decoded':>10} {'bytes out':>9} {'retries':>7} {'hedged':>6} {'errors':>6}")
+            for row in requests:
+                lines.append(f"  {row['method']:<6} {row['endpoint']:<{width}} {row['calls']:>5} "
+                             f"{row['seconds'] * 1000:>9.1f} {row['max_seconds'] * 1000:>8.1f} "
+                             f"{row['bytes_received']:>10} {row['bytes_decoded']:>10} {row['bytes_sent']:>9} {row['retries']:>7} {row['hedged']:>6} {row['errors']:>6}")
+        phases = self.phase_summary()
+        if phases:
+            width = max(len(row['phase']) for row in phases)
+            lines.append(f"  {'phase':<{width}} {'calls':>5} {'total ms':>9}")
+            for row in phases:
+                lines.append(f"  {row['phase']:<{width}} {row['calls']:>5} {row['seconds'] * 1000:>9.1f}")
+        return '\n'.join(lines)
+
+    def write_prometheus(self, path, action=None):
+        """
+        Writes the run as a node_exporter textfile (metrics of the last run, labelled by action).
+        The file is replaced atomically so the collector never reads a partial one.
+        """
+        action = _label(action or 'none')
+        metrics = [
+            ('last_run_timestamp_seconds', 'Unix time the last run started.', [({}, self.started)]),
+            ('last_run_duration_seconds', 'Wall time of the last run.', [({}, self.elapsed())]),
+            ('last_run_ambari_requests', 'Ambari API requests made by the last run.', []),
+            ('last_run_ambari_partial_requests', 'Ambari API requests of the last run that asked for only some fields.',
+             [({}, self.totals()['partial_calls'])]),
+            ('last_run_ambari_request_seconds', 'Time spent in Ambari API requests by the last run.', []),
+            ('last_run_ambari_response_bytes', 'Response bytes received from Ambari by the last run.', []),
+            ('last_run_ambari_decoded_bytes', 'Response bytes after gzip decoding in the last run.', []),
+            ('last_run_ambari_retries', 'Ambari API request retries in the last run.', []),
+            ('last_run_ambari_hedged', 'Ambari GETs resent on a second connection (hedged) in the last run.', []),
+            ('last_run_ambari_errors', 'Failed Ambari API requests (HTTP >= 400 or no response) in the last run.', []),
+            ('last_run_phase_seconds', 'Time spent rendering and parsing in the last run.', []),
+        ]
+        samples = dict((name, series) for name, _, series in metrics)
+        for row in self.request_summary():
+            labels = {'method': row['method'], 'endpoint': row['endpoint']}
+            for status, calls in sorted(row['statuses'].items()):
+                samples['last_run_ambari_requests'].append((dict(labels, status=status), calls))
+            samples['last_run_ambari_request_seconds'].append((labels, row['seconds']))
+            samples['last_run_ambari_response_bytes'].append((labels, row['bytes_received']))
+            samples['last_run_ambari_decoded_bytes'].append((labels, row['bytes_decoded']))
+            samples['last_run_ambari_retries'].append((labels, row['retries']))
+            samples['last_run_ambari_hedged'].append((labels, row['hedged']))
+            samples['last_run_ambari_errors'].append((labels, row['errors']))
+        for row in self.phase_summary():
+            samples['last_run_phase_seconds'].append(({'phase': row['phase']}, row['seconds']))
+        lines = []
+        for name, help_text, series in metrics:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            for labels, value in series:
+                label_text = ','.join(f'{key}="{_label(val)}"' for key, val in [('action', action)] + sorted(labels.items()))
+                value = round(value, 6) if isinstance(value, float) else value
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary, path)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def enable():
+    """Starts recording every Ambari request and timed phase in this process; returns the Tracer."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+def disable():
+    global _tracer
+    _tracer = None
+
+def get_tracer():
+    return _tracer
+
+def record_request(client, method, url, status, seconds, bytes_sent=0, bytes_received=0, retries=0, error=None,
+                   bytes_decoded=None, hedged=False):
+    """Records one Ambari request when tracing is enabled (configs' connection pool and the asyncio client)."""
+    if _tracer is not None:
+        _tracer.add({'kind': 'request', 'client': client, 'method': method, 'url': url, 'status': status,
+                     'seconds': seconds, 'bytes_sent': bytes_sent, 'bytes_received': bytes_received,
+                     'bytes_decoded': bytes_received if bytes_decoded is None else bytes_decoded,
+                     'retries': retries, 'hedged': hedged, 'error': error})
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as a named phase when tracing is enabled."""
+    if _tracer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _tracer.add({'kind': 'phase', 'name': name, 'seconds': time.perf_counter() - started})
+
+def report(tracer, action=None, trace_path=None, prometheus_path=None):
+    """Prints the summary table and writes the JSON trace / Prometheus textfile if asked to."""
+    print(tracer.format_summary())
+    if trace_path:
+        tracer.write_json(trace_path, action)
+        print(f"[PROFILE] Trace written to {trace_path}")
+    if prometheus_path:
+        tracer.write_prometheus(prometheus_path, action)
+        print(f"[PROFILE] Prometheus metrics written to {prometheus_path}")
@@ -0,0 +1,116 @@
+import time
+
+from . import cluster
+
+
+class TopologyWatcher:
+    """
+    Keeps the Knox advanced topology in line with the cluster by polling only the
+    desired_configs tag map. When a tag that feeds a discovery task moves (see
+    cluster.DISCOVERY_CONFIG_TYPES), only that task runs again; the topology is
+    re-rendered and applied only when the variables or the XML actually changed.
+
+    The 'hosts' task has no config type to watch, so it is re-run once the host
+    index is older than host_index_ttl. A moved 'topology' tag (edited outside this
+    tool) is compared against the last render and re-applied if it drifted.
+    """
+
+    def __init__(self, interval=None, host_index_ttl=None, max_workers=None):
+        from .params import WATCH_INTERVAL, HOST_INDEX_TTL
+        self.interval = WATCH_INTERVAL if interval is None else interval
+        self.host_index_ttl = HOST_INDEX_TTL if host_index_ttl is None else host_index_ttl
+        self.max_workers = max_workers
+        self.tags = None
+        self.results = {}
+        self.topology_vars = None
+        self.polls = 0
+        self.applied = 0
+
+    def changed_types(self, tags):
+        """Config types whose tag differs from the previous poll (all of them on the first)."""
+        if self.tags is None:
+            return set(tags)
+        return set(t for t in set(tags) | set(self.tags) if tags.get(t) != self.tags.get(t))
+
+    def affected_tasks(self, changed):
+        if self.tags is None:
+            return list(cluster.DISCOVERY_TASKS)
+        tasks = [name for name, config_types in cluster.DISCOVERY_CONFIG_TYPES.items()
+                 if changed.intersection(config_types)]
+        age = cluster.host_index_age()
+        if age is None or age > self.host_index_ttl:
+            cluster.reset_host_index()
+            tasks.append('hosts')
+        return tasks
+
+    def poll(self):
+        """
+        Runs one reconciliation pass. Returns True if a new topology version was applied.
+        """
+        snapshot = cluster.get_snapshot()
+        tags = snapshot.refresh_tags()
+        changed = self.changed_types(tags)
+        tasks = self.affected_tasks(changed)
+        if not tasks and 'topology' not in changed:
+            self.tags = dict(tags)
+            return False
+        if tasks:
+            print(f"[INFO] Re-running discovery: {', '.join(tasks)}"
+                  + (f" (changed: {', '.join(sorted(changed))})" if self.tags is not None else ""))
+            self.results.update(cluster.run_discovery(tasks, self.max_workers))
+        topology_vars = cluster.build_topology_vars(self.results)
+        applied = False
+        if topology_vars != self.topology_vars or 'topology' in changed:
+            self._print_vars(topology_vars)
+            applied = self._apply(topology_vars)
+            self.topology_vars = topology_vars
+        else:
+            print("[INFO] Topology variables unchanged; nothing to render.")
+        # Our own write moved the topology tag; remember it so it is not taken for an outside edit
+        self.tags = dict(snapshot.tags)
+        return applied
+
+    def _print_vars(self, topology_vars):
+        previous = self.topology_vars or {}
+        for key, value in topology_vars.items():
+            if self.topology_vars is None or previous.get(key) != value:
+                print(f"  {key}: {value}")
+
+    def _apply(self, topology_vars):
+        from . import configs, topology
+        from .params import CLUSTER_NAME
+        snapshot = cluster.get_snapshot()
+        rendered = topology.render(topology_vars)
+        if topology.is_current(rendered, snapshot):
+            print(f"[INFO] Knox advanced topology unchanged (sha256 {rendered.sha256[:12]}); skipping.")
+            return False
+        change_set = configs.ConfigChangeSet(CLUSTER_NAME, cluster.get_accessor(), snapshot)
+        cluster.apply_topology_to_knox(change_set, topology_vars, rendered)
+        diffs = change_set.apply('Reconcile Knox advanced topology (watch mode)')
+        cluster.report_change_set(diffs)
+        if any(diff.has_changes for diff in diffs):
+            self.applied += 1
+            return True
+        return False
+
+    def run(self, iterations=None):
+        """Polls every `interval` seconds until interrupted (or for `iterations` passes)."""
+        print(f"[INFO] Watching desired_configs every {self.interval}s for topology changes (Ctrl-C to stop)...")
+        try:
+            while iterations is None or self.polls < iterations:
+                started = time.monotonic()
+                self.polls += 1
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"[WARN] Watch poll failed: {e}")
+                if iterations is not None and self.polls >= iterations:
+                    break
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        print(f"[INFO] Watch stopped after {self.polls} poll(s); {self.applied} topology update(s) applied.")
+        return self.applied
+
+def watch(interval=None, iterations=None):
+    return TopologyWatcher(interval).run(iterations)
@@ -0,0 +1,218 @@
+import re
+import time
+
+# Collapse a trie node into a wildcard when it has more distinct sub-domains than this
+DEFAULT_MAX_ALTERNATIVES = 32
+# Nodes at or above this depth (TLD, registered domain) are never collapsed
+MIN_COLLAPSE_DEPTH = 2
+# check_whitelist refuses a regex slower than this per host URL (mean, Python's re); 0 skips timing
+DEFAULT_MAX_MATCH_MICROSECONDS = 50.0
+# How long check_whitelist times the regex for
+CHECK_SECONDS = 0.1
+
+# One or more hostname labels, each with its dot. This is a nested quantifier, but a safe one:
+# the inner class excludes '.', so every repetition has to end at the next literal dot and a
+# URL splits into repetitions in exactly one way, leaving no alternative splits to backtrack into.
+HOST_LABELS = r'(?:[A-Za-z0-9-]+\.)+'
+URL_PREFIX = r'^https?:\/\/'
+URL_SUFFIX = r':[0-9]+(?:[\/?#].*)?$'
+
+# URLs that must never be whitelisted, whatever the cluster domains are
+REJECT_PROBES = [
+    'https://attacker.invalid:443/',
+    'https://attacker.invalid/.{domain}:443/',
+    'https://user@attacker.invalid:443/x.{domain}:80/',
+    'ftp://node1.{domain}:21/',
+]
+
+
+class SuffixTrie:
+    """
+    Trie over the reversed DNS labels of the domains cluster hosts live in
+    (everything after a host's first label). Hosts are added a page at a time;
+    only the trie, counts, the first host seen per domain and a few examples are kept.
+    """
+    MAX_EXAMPLES = 5
+
+    def __init__(self):
+        self.root = {}
+        self.hosts = 0
+        self.skipped = 0
+        self.skipped_examples = []
+        self.samples = {}
+
+    def add(self, hostnames):
+        for hostname in hostnames:
+            labels = hostname.lower().rstrip('.').split('.')
+            if len(labels) < 3:  # Must have at least 3 parts for FQDN
+                self.skipped += 1
+                if len(self.skipped_examples) < self.MAX_EXAMPLES:
+                    self.skipped_examples.append(hostname)
+                continue
+            self.hosts += 1
+            self.samples.setdefault('.'.join(labels[1:]), hostname)
+            node = self.root
+            for label in reversed(labels[1:]):
+                node = node.setdefault(label, {})
+            node[None] = node.get(None, 0) + 1  # hosts whose domain ends here
+
+    def domains(self):
+        """Distinct host domains with their host counts, before minimisation."""
+        found = []
+        def walk(node, suffix):
+            for label, child in node.items():
+                if label is None:
+                    found.append(('.'.join(reversed(suffix)), child))
+                else:
+                    walk(child, suffix + [label])
+        walk(self.root, [])
+        return sorted(found)
+
+    def common_suffix(self):
+        """The 2-label suffix shared by every host, or None if the hosts span several."""
+        if len(self.root) != 1:
+            return None
+        tld, node = next(iter(self.root.items()))
+        labels = [label for label in node if label is not None]
+        if len(labels) != 1 or None in node:
+            return None
+        return f"{labels[0]}.{tld}"
+
+    def minimise(self, max_alternatives=DEFAULT_MAX_ALTERNATIVES):
+        """
+        Returns a pruned copy: domains already covered by a shorter one are dropped,
+        and nodes below MIN_COLLAPSE_DEPTH with more than max_alternatives
+        sub-domains become a wildcard for everything beneath them.
+        """
+        def prune(node, depth):
+            if None in node:
+                return {None: node[None]}
+            children = dict((label, prune(child, depth + 1)) for label, child in node.items())
+            if depth >= MIN_COLLAPSE_DEPTH and len(children) > max_alternatives:
+                return {None: 0}
+            return children
+        return dict((label, prune(child, 1)) for label, child in self.root.items())
+
+
+def _render(label, node):
+    """Regex for every domain ending in `label` under `node`, deepest labels first."""
+    if None in node:
+        return re.escape(label)
+    alternatives = [_render(child_label, child) for child_label, child in sorted(node.items())]
+    group = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    return group + r'\.' + re.escape(label)
+
+def synthesize_whitelist(trie, max_alternatives=DEFAULT_MAX_ALTERNATIVES):
+    """
+    Builds an anchored gateway.dispatch.whitelist regex covering every cluster domain.
+
+    The host part is HOST_LABELS: nested quantifiers, but every label step ends at a
+    literal '.', so matching stays linear in the URL length (see HOST_LABELS). Domains
+    are a trie-factored alternation of literals.
+    """
+    minimal = trie.minimise(max_alternatives)
+    if not minimal:
+        raise ValueError("No valid FQDNs to build a whitelist from")
+    alternatives = [_render(label, node) for label, node in sorted(minimal.items())]
+    domains = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    return URL_PREFIX + HOST_LABELS + domains + URL_SUFFIX
+
+def build_whitelist(trie, max_alternatives=DEFAULT_MAX_ALTERNATIVES):
+    """
+    Reports the domains found in the trie and returns the whitelist regex for them.
+    Raises ValueError if no hostname was a valid FQDN.
+    """
+    print("[INFO] Analyzing hostnames for cluster domains...")
+    if trie.skipped:
+        print(f"[WARN] Skipping {trie.skipped} hostname(s) with insufficient parts, e.g. {trie.skipped_examples}")
+
+    if not trie.hosts:
+        error_msg = "[ERROR] No valid FQDNs found in cluster hostnames. All hostnames must have at least 3 parts (hostname.domain.tld)"
+        print(error_msg)
+        raise ValueError(error_msg)
+
+    domains = trie.domains()
+    print(f"[SUCCESS] Found {len(domains)} domain(s) across {trie.hosts} host(s)")
+    for domain, count in domains[:10]:
+        print(f"[INFO] {domain}: {count} host(s)")
+    if len(domains) > 10:
+        print(f"[INFO] ... and {len(domains) - 10} more")
+
+    whitelist_regex = synthesize_whitelist(trie, max_alternatives)
+    print(f"[INFO] Generated whitelist regex: {whitelist_regex}")
+    return whitelist_regex
+
+def build_whitelist_regex(hostnames, max_alternatives=DEFAULT_MAX_ALTERNATIVES):
+    """
+    Builds the gateway.dispatch.whitelist regex covering every domain of the given
+    cluster hostnames. Raises ValueError if none of them is a valid FQDN.
+    """
+    trie = SuffixTrie()
+    trie.add(hostnames)
+    return build_whitelist(trie, max_alternatives)
+
+def common_suffix(hostnames):
+    """The 2-label suffix shared by every hostname (see SuffixTrie.common_suffix), or None."""
+    trie = SuffixTrie()
+    trie.add(hostnames)
+    return trie.common_suffix()
+
+def legacy_whitelist(domain):
+    """The pattern set_knox_whitelist generated before the synthesis engine, for comparison."""
+    escaped_domain = domain.replace(".", "\\.")
+    return f'^https?:\\/\\/(.+\\.{escaped_domain}):[0-9]+\\/?.*$'
+
+def benchmark_whitelist(regex, hostnames, min_seconds=0.5, port=8443):
+    """
+    Times the regex against a dispatch URL for every host (Python's re as a stand-in for
+    the gateway's java.util.regex) and checks coverage and rejection probes.
+    """
+    pattern = re.compile(regex)
+    urls = [f"https://{hostname}:{port}/gateway/default/" for hostname in hostnames]
+    unmatched = [url for url in urls if not pattern.search(url)]
+    # Every probe against every domain the hosts are in
+    domains = sorted(set(hostname.split('.', 1)[-1] for hostname in hostnames)) or ['example.com']
+    probes = [probe.format(domain=domain) for domain in domains for probe in REJECT_PROBES]
+    accepted_probes = [probe for probe in probes if pattern.search(probe)]
+
+    matches = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds and urls:
+        for url in urls:
+            pattern.search(url)
+        matches += len(urls)
+        elapsed = time.perf_counter() - started
+    return {
+        'regex_length': len(regex),
+        'urls': len(urls),
+        'unmatched': unmatched,
+        'accepted_probes': accepted_probes,
+        'matches_per_second': matches / elapsed if elapsed else 0.0,
+        'mean_microseconds': (elapsed / matches * 1e6) if matches else 0.0,
+    }
+
+def check_whitelist(regex, hostnames, max_microseconds=DEFAULT_MAX_MATCH_MICROSECONDS, min_seconds=CHECK_SECONDS):
+    """
+    Benchmarks the regex against a URL per hostname (see benchmark_whitelist) before it is applied.
+    Raises ValueError if it misses any of them, accepts a REJECT_PROBES URL, or takes longer than
+    max_microseconds per URL on average; returns the benchmark result otherwise.
+    """
+    result = benchmark_whitelist(regex, hostnames, min_seconds)
+    if result['unmatched']:
+        raise ValueError(f"Whitelist does not match {len(result['unmatched'])} host URL(s), e.g. {result['unmatched'][:3]}")
+    if result['accepted_probes']:
+        raise ValueError(f"Whitelist accepts {len(result['accepted_probes'])} URL(s) it must reject, "
+                         f"e.g. {result['accepted_probes'][:2]}")
+    if max_microseconds and result['mean_microseconds'] > max_microseconds:
+        raise ValueError(f"Whitelist takes {result['mean_microseconds']:.2f} us per URL, over the "
+                         f"{max_microseconds:g} us budget (whitelist_max_match_us)")
+    return result
+
+def print_benchmark(label, result):
+    print(f"[INFO] {label}: {result['matches_per_second']:,.0f} matches/s "
+          f"({result['mean_microseconds']:.2f} us/URL, {result['regex_length']} chars) over {result['urls']} host URLs")
+    if result['unmatched']:
+        print(f"[WARN] {label}: {len(result['unmatched'])} host URL(s) not matched, e.g. {result['unmatched'][:3]}")
+    if result['accepted_probes']:
+        print(f"[WARN] {label}: accepts {len(result['accepted_probes'])}/{len(REJECT_PROBES)} rejection probe(s), e.g. {result['accepted_probes'][:2]}")
@@ -1,23 +1,197 @@
 import argparse
-from knox_utils.cluster import is_knox_installed, configure_knox, set_knox_whitelist
-from knox_utils.params import USERNAME, PASSWORD, CLUSTER_NAME, AMBARI_BASE_URL
-from knox_utils.update_config import update_config_if_needed
+import sys
+
+# Each action imports only what it needs (see benchmarks/startup.py); config.ini is read on first use
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--check-knox', action='store_true', help='Check if Knox is installed')
-    parser.add_argument('--local', default='true', choices=['true', 'false'], help='If true, update config.ini based on Ambari properties (local mode)')
+    parser.add_argument('--local', default='true', choices=['true', 'false'], help='If true, update config.ini based on Ambari properties (local mode) before an action that changes configs')
+    parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE', help='Override a config.ini [ambari] option for this run, e.g. request_timeout=30 (repeatable)')
     parser.add_argument('--configure-knox', action='store_true', help='Configure Knox proxyuser in Hadoop')
     parser.add_argument('--set-knox-whitelist', action='store_true', help='Configure Knox gateway whitelist based on cluster hostnames')
+    parser.add_argument('--benchmark-whitelist', action='store_true', help='Build the Knox whitelist regex and time it against cluster hostnames without applying it')
+    parser.add_argument('--inventory', help='Fleet mode: run the selected action on every cluster in this INI inventory')
+    parser.add_argument('--workers', type=int, default=16, help='Fleet mode: clusters processed concurrently')
+    parser.add_argument('--per-server', type=int, default=2, help='Fleet mode: clusters processed concurrently per Ambari server')
+    parser.add_argument('--fleet-log-dir', help='Fleet mode: directory for per-cluster logs')
+    parser.add_argument('--watch', action='store_true', help='Poll desired_configs and re-apply the Knox topology only when the configs it is built from change')
+    parser.add_argument('--interval', type=int, help='Watch mode: seconds between polls (default: watch_interval in config.ini, 60)')
+    parser.add_argument('--serve', action='store_true', help='Daemon mode: keep Ambari connections and cluster state warm and serve actions on a Unix socket')
+    parser.add_argument('--client', action='store_true', help='Send the selected action to a running daemon instead of running it here')
+    parser.add_argument('--daemon', choices=['stats', 'refresh', 'shutdown'], help='Send a control command to a running daemon')
+    parser.add_argument('--socket', help='Daemon Unix socket path (default: daemon_socket in config.ini, else $XDG_RUNTIME_DIR/knox-utility.sock)')
+    parser.add_argument('--history', nargs='?', type=int, const=20, metavar='N', help='List the last N config changes recorded in the change journal (default 20)')
+    parser.add_argument('--show-change', metavar='TAG', help='Show the property diff of a recorded config change (tag or tag prefix)')
+    parser.add_argument('--versions', metavar='CONFIG_TYPE', help='List the versions of a config type recorded in the local config history')
+    parser.add_argument('--rollback', metavar='CONFIG_TYPE', help='Re-apply an earlier version of a config type from the local config history (default: the one before the latest)')
+    parser.add_argument('--to', metavar='TAG', help='Rollback: tag (or tag prefix) of the version to restore')
+    parser.add_argument('--export-snapshot', metavar='PATH', help='Save everything --configure-knox / --set-knox-whitelist read from Ambari to one compressed file, for --snapshot')
+    parser.add_argument('--snapshot', metavar='PATH', help='Run --check-knox, --configure-knox, --set-knox-whitelist or --benchmark-whitelist on an exported snapshot instead of Ambari; config changes are only shown (dry run)')
+    parser.add_argument('--tls-reset', action='store_true', help='Forget the remembered TLS verification decision / pinned certificate for the Ambari server')
+    parser.add_argument('--profile', nargs='?', const='knox-utility-trace.json', metavar='TRACE_JSON',
+                        help='Trace every Ambari request and render/parse step; print a summary and write a JSON trace (default knox-utility-trace.json)')
+    parser.add_argument('--prometheus-textfile', metavar='PATH', help='Write the run\'s request metrics in Prometheus textfile format (node_exporter textfile collector)')
     args = parser.parse_args()
+    if args.snapshot and (args.watch or args.serve or args.client or args.daemon or args.inventory or args.rollback
+                          or args.export_snapshot):
+        parser.error("--snapshot only works with --check-knox, --configure-knox, --set-knox-whitelist and --benchmark-whitelist")
+    if args.option:
+        from knox_utils import params
+        options = set(option for option, _, _ in params.SETTINGS.values())
+        for option in args.option:
+            key, separator, value = option.partition('=')
+            if not separator or key.strip().lower() not in options:
+                parser.error(f"--option {option}: expected KEY=VALUE with KEY one of {', '.join(sorted(options))}")
+            params.override(key.strip(), value.strip())
+
+    if not (args.profile or args.prometheus_textfile):
+        return run(args)
+    from knox_utils import tracing
+    tracer = tracing.enable()
+    try:
+        return run(args)
+    finally:
+        tracing.report(tracer, selected_action(args), args.profile, args.prometheus_textfile)
+
+def selected_action(args):
+    for name in ('serve', 'watch', 'rollback', 'export_snapshot', 'check_knox', 'configure_knox', 'set_knox_whitelist', 'benchmark_whitelist'):
+        if getattr(args, name):
+            return name.replace('_', '-')
+    return None
+
+def run(args):
+    if args.client or args.daemon:
+        # Thin client: the daemon owns config.ini and all cluster state
+        from knox_utils.daemon import run_client
+        if args.daemon:
+            action = args.daemon
+        elif args.check_knox:
+            action = 'check-knox'
+        elif args.configure_knox:
+            action = 'configure-knox'
+        elif args.set_knox_whitelist:
+            action = 'set-knox-whitelist'
+        elif args.benchmark_whitelist:
+            action = 'benchmark-whitelist'
+        else:
+            print("No action specified. Use --check-knox, --configure-knox, --set-knox-whitelist or --benchmark-whitelist with --client.")
+            return
+        try:
+            return run_client(action, args.socket)
+        except Exception as e:
+            print(e)
+            return 1
+
+    if args.history is not None or args.show_change:
+        from knox_utils import journal
+        if args.show_change:
+            return journal.print_change(args.show_change, journal.configured_path())
+        journal.print_history(args.history, journal.configured_path())
+        return
+
+    if args.inventory:
+        from knox_utils.fleet import main_fleet
+        if args.check_knox:
+            action = 'check-knox'
+        elif args.configure_knox:
+            action = 'configure-knox'
+        elif args.set_knox_whitelist:
+            action = 'set-knox-whitelist'
+        else:
+            print("No action specified. Use --check-knox, --configure-knox or --set-knox-whitelist with --inventory.")
+            return
+        try:
+            if action != 'check-knox':
+                install_recorders()
+            main_fleet(args.inventory, action, args.workers, args.per_server, args.fleet_log_dir)
+        except Exception as e:
+            print(f"Error running fleet {action}: {e}")
+        return
+
+    if args.snapshot:
+        # Nothing is read from or written to Ambari, so neither config.ini sync nor journal/history apply
+        from knox_utils import offline
+        try:
+            offline.activate(args.snapshot)
+        except Exception as e:
+            print(f"Error loading snapshot {args.snapshot}: {e}")
+            return 1
+        return run_action(args)
 
-    local = args.local == 'true'
+    if changes_configs(args):
+        # In local mode config.ini is brought up to date with ambari.properties first
+        if args.local == 'true':
+            from knox_utils.update_config import update_config_if_needed
+            update_config_if_needed()
+        install_recorders()
 
-    # Always update config if local, before any other logic
-    if local:
-        update_config_if_needed()
+    if args.tls_reset:
+        from knox_utils import tls
+        from knox_utils.params import AMBARI_HOST, PORT
+        tls.forget(AMBARI_HOST, PORT)
+        if not (selected_action(args) or args.versions):
+            return
 
+    if args.versions:
+        from knox_utils import history
+        from knox_utils.configs import ambari_address
+        from knox_utils.params import AMBARI_HOST, PORT, CLUSTER_NAME
+        history.print_versions(ambari_address(AMBARI_HOST, PORT), CLUSTER_NAME, args.versions,
+                               directory=history.configured_dir())
+        return
+    if args.rollback:
+        from knox_utils import history
+        try:
+            return history.rollback(args.rollback, args.to)
+        except Exception as e:
+            print(f"Error rolling back {args.rollback}: {e}")
+            return 1
+    if args.export_snapshot:
+        from knox_utils import offline
+        try:
+            offline.export_snapshot(args.export_snapshot)
+        except Exception as e:
+            print(f"Error exporting snapshot: {e}")
+            return 1
+        return
+    if args.watch:
+        from knox_utils.watch import watch
+        try:
+            watch(args.interval)
+        except Exception as e:
+            print(f"Error in watch mode: {e}")
+            return 1
+        from knox_utils.cluster import print_cache_stats
+        print_cache_stats()
+        return
+    if args.serve:
+        from knox_utils.daemon import serve
+        try:
+            serve(args.socket)
+        except Exception as e:
+            print(f"Error running daemon: {e}")
+            return 1
+        return
+    return run_action(args)
+
+def changes_configs(args):
+    """Whether the selected action writes configs to Ambari (or may, for --watch / --serve)."""
+    return bool(args.configure_knox or args.set_knox_whitelist or args.rollback or args.watch or args.serve)
+
+def install_recorders():
+    """
+    Records every config version written from here on in the change journal, and every version
+    read or written in the config history. Only for actions that touch configs: --check-knox and
+    --benchmark-whitelist never load either module.
+    """
+    from knox_utils import history, journal
+    journal.install()
+    history.install()
+
+def run_action(args):
     if args.check_knox:
+        from knox_utils.cluster import is_knox_installed
         try:
             if is_knox_installed():
                 print("KNOX is installed.")
@@ -26,17 +200,27 @@ def main():
         except Exception as e:
             print(e)
     elif args.configure_knox:
+        from knox_utils.cluster import configure_knox
         try:
             configure_knox()
         except Exception as e:
             print(f"Error configuring Knox: {e}")
     elif args.set_knox_whitelist:
+        from knox_utils.cluster import set_knox_whitelist
         try:
             set_knox_whitelist()
         except Exception as e:
             print(f"Error setting Knox whitelist: {e}")
+    elif args.benchmark_whitelist:
+        from knox_utils.cluster import benchmark_knox_whitelist
+        try:
+            benchmark_knox_whitelist()
+        except Exception as e:
+            print(f"Error benchmarking Knox whitelist: {e}")
     else:
         print("No action specified. Use --check-knox, --configure-knox, --set-knox-whitelist or other flags.")
+    from knox_utils.cluster import print_cache_stats
+    print_cache_stats()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Runs benchmarks/mock_ambari.py's MockAmbariServer for tests that talk to Ambari."""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import mock_ambari  # noqa: E402
+
+from knox_utils import cluster, configs, params  # noqa: E402
+
+
+class MockAmbariTestCase(unittest.TestCase):
+    """Starts a mock Ambari server per test; self.accessor is a configs.api_accessor for it."""
+    hosts = 20
+    domains = 1
+
+    def setUp(self):
+        self.cluster = mock_ambari.MockCluster(hosts=self.hosts, domains=self.domains, properties=10)
+        self.server = mock_ambari.MockAmbariServer(self.cluster).start()
+        self.addCleanup(self.server.stop)
+        self.accessor = configs.api_accessor('127.0.0.1', mock_ambari.DEFAULT_USERNAME, mock_ambari.DEFAULT_PASSWORD,
+                                             configs.HTTP_PROTOCOL, self.server.port)
+        self.addCleanup(self.accessor.close)
+
+    def override(self, **options):
+        """Sets config.ini options (params.override) for this test only."""
+        for option, value in options.items():
+            params.override(option, value)
+
+        def restore():
+            for option in options:
+                params.resolver().overrides.pop(option, None)
+            params.reload()
+        self.addCleanup(restore)
+
+    def install(self, **options):
+        """
+        Points knox_utils.cluster's shared accessor and config snapshot at this server, with
+        no host index loaded yet, and returns the snapshot. options are passed to override().
+        """
+        self.override(cluster_name=self.cluster.name, **options)
+        snapshot = configs.ClusterConfigSnapshot(self.cluster.name, self.accessor)
+        for name, value in (('_accessor', self.accessor), ('_snapshot', snapshot), ('_host_index', None),
+                            ('_host_index_time', None)):
+            patcher = mock.patch.object(cluster, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return snapshot
@@ -0,0 +1,38 @@
+import asyncio
+import unittest
+
+from knox_utils.async_client import AsyncAmbariClient
+
+
+class InterimResponseTest(unittest.TestCase):
+
+    def test_100_continue_is_skipped_on_a_keep_alive_connection(self):
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            for body in (b'{"first": 1}', b'{"second": 2}'):
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n"
+                             b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                async with AsyncAmbariClient('127.0.0.1', port, 'http', 'admin', 'admin', 'c1') as client:
+                    return [await client.fetch('/api/v1/clusters'), await client.fetch('/api/v1/clusters')]
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        responses = asyncio.run(run())
+        self.assertEqual(responses, [(200, '{"first": 1}'), (200, '{"second": 2}')])
+        self.assertEqual(len(connections), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from knox_utils.config_cache import ConfigCache
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+
+    def test_rewriting_an_entry_does_not_grow_the_total(self):
+        properties = dict((f"key{i}", os.urandom(8).hex()) for i in range(50))
+        probe = ConfigCache('ambari', 8080, 'c1', self.cache_dir)
+        probe.put('core-site', 'version1', properties, {})
+        entry_size = os.path.getsize(probe._entry_path('core-site', 'version1'))
+        os.remove(probe._entry_path('core-site', 'version1'))
+
+        cache = ConfigCache('ambari', 8080, 'c1', self.cache_dir, max_bytes=entry_size * 4)
+        cache.put('hdfs-site', 'version1', properties, {})
+        for _ in range(8):
+            cache.put('core-site', 'version1', properties, {})
+
+        self.assertEqual(cache.get('hdfs-site', 'version1'), (properties, {}))
+        self.assertEqual(cache.get('core-site', 'version1'), (properties, {}))
+        # The running total matches the files on disk, so it never has to be recounted
+        self.assertEqual(cache._size, sum(size for _, size, _ in cache._entries()))
+
+
+if __name__ == '__main__':
+    unittest.main()
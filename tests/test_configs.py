@@ -0,0 +1,127 @@
+import asyncio
+import json
+import unittest
+
+from mock_server import MockAmbariTestCase
+
+from knox_utils import configs, tracing
+from knox_utils.async_client import AsyncAmbariClient
+
+
+class DiffConfigTest(unittest.TestCase):
+
+    def test_added_changed_removed_and_attributes(self):
+        diff = configs.diff_config('core-site', {'a': '1', 'b': '2', 'c': '3'}, {'final': {'a': 'true'}},
+                                   {'a': '1', 'b': '20', 'd': '4'}, {'final': {'a': 'false'}})
+        self.assertEqual((diff.added, diff.changed, diff.removed, diff.attributes_changed), (['d'], ['b'], ['c'], True))
+        self.assertTrue(diff.has_changes)
+        self.assertEqual(diff.summary(), 'added: d; changed: b; removed: c; attributes changed')
+
+    def test_values_and_empty_attributes_compare_as_ambari_stores_them(self):
+        diff = configs.diff_config('core-site', {'port': '8080'}, {}, {'port': 8080}, {'final': {}})
+        self.assertFalse(diff.has_changes)
+        self.assertEqual(diff.summary(), 'unchanged')
+
+
+class UpdateConfigTest(MockAmbariTestCase):
+
+    def update(self, properties):
+        def updater(cluster, config_type, accessor):
+            current, attributes = configs.get_current_config(cluster, config_type, accessor)
+            current.update(properties)
+            return current, attributes
+        return configs.update_config(self.cluster.name, 'core-site', updater, self.accessor, 'note')
+
+    def test_unchanged_config_is_not_put(self):
+        diff = self.update({'fs.defaultFS': self.cluster.configs[('core-site', 'version1')][0]['fs.defaultFS']})
+        self.assertFalse(diff.has_changes)
+        self.assertIsNone(diff.tag)
+        self.assertNotIn('PUT', self.server.stats())
+        self.assertEqual(self.cluster.desired['core-site'], 'version1')
+
+    def test_changed_config_is_put_once(self):
+        diff = self.update({'hadoop.proxyuser.knox.hosts': '*'})
+        self.assertEqual(diff.added, ['hadoop.proxyuser.knox.hosts'])
+        self.assertEqual(self.server.stats()['PUT'], 1)
+        self.assertEqual(self.cluster.desired['core-site'], diff.tag)
+        self.assertEqual(self.cluster.configs[('core-site', diff.tag)][0]['hadoop.proxyuser.knox.hosts'], '*')
+
+
+class ConfigChangeSetTest(MockAmbariTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.puts = []
+        accessor = self.accessor
+
+        def recording(api_url, request_type=configs.GET_REQUEST_TYPE, request_body=None):
+            if request_type == configs.PUT_REQUEST_TYPE:
+                self.puts.append(json.loads(request_body))
+            return accessor(api_url, request_type, request_body)
+        recording.ambari = accessor.ambari
+        self.snapshot = configs.ClusterConfigSnapshot(self.cluster.name, recording)
+        self.change_set = configs.ConfigChangeSet(self.cluster.name, recording, self.snapshot)
+
+    def plan(self, config_type, **properties):
+        current, attributes = self.snapshot.get(config_type)
+        current.update(properties)
+        self.change_set.add(config_type, current, attributes)
+
+    def test_changed_types_are_put_in_one_request(self):
+        self.plan('core-site', **{'hadoop.proxyuser.knox.groups': '*'})
+        self.plan('gateway-site', **{'gateway.dispatch.whitelist': '^x$'})
+        self.plan('topology')
+        diffs = self.change_set.apply('one note')
+
+        self.assertEqual(len(self.puts), 1)
+        entries = self.puts[0]['Clusters']['desired_configs']
+        tag = diffs[0].tag
+        self.assertEqual([(entry['type'], entry['tag'], entry['service_config_version_note']) for entry in entries],
+                         [('core-site', tag, 'one note'), ('gateway-site', tag, 'one note')])
+        self.assertEqual(entries[1]['properties']['gateway.dispatch.whitelist'], '^x$')
+        self.assertEqual([(diff.config_type, diff.tag) for diff in diffs],
+                         [('core-site', tag), ('gateway-site', tag), ('topology', None)])
+        self.assertEqual(self.server.stats()['config_versions'], 2)
+        self.assertEqual((self.cluster.desired['core-site'], self.cluster.desired['topology']), (tag, 'version1'))
+
+    def test_nothing_changed_sends_nothing(self):
+        self.plan('core-site')
+        self.plan('topology')
+        self.assertEqual([diff.has_changes for diff in self.change_set.apply('note')], [False, False])
+        self.assertEqual(self.puts, [])
+
+
+class ConfigTagTest(MockAmbariTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tracer = tracing.enable()
+        self.addCleanup(tracing.disable)
+
+    def test_only_the_type_asked_for_is_fetched(self):
+        self.assertEqual(configs.get_config_tag(self.cluster.name, 'core-site', self.accessor), 'version1')
+        configs.get_desired_tags(self.cluster.name, self.accessor)
+
+        narrow, full = self.tracer.requests
+        self.assertEqual(narrow['endpoint'], '/api/v1/clusters/{cluster}?fields=Clusters/desired_configs/{type}')
+        self.assertLess(narrow['bytes_decoded'], full['bytes_decoded'])
+        self.assertEqual(self.tracer.totals()['partial_calls'], 2)
+
+    def test_missing_type(self):
+        self.assertIsNone(configs.find_config_tag(self.cluster.name, 'no-such-site', self.accessor))
+        self.assertEqual(configs.get_current_config_or_empty(self.cluster.name, 'no-such-site', self.accessor), ({}, {}))
+        with self.assertRaisesRegex(Exception, '"no-such-site" not found'):
+            configs.get_config_tag(self.cluster.name, 'no-such-site', self.accessor)
+
+    def test_async_client(self):
+        async def get_tag():
+            async with AsyncAmbariClient('127.0.0.1', self.server.port, configs.HTTP_PROTOCOL, 'admin', 'admin',
+                                         self.cluster.name) as client:
+                return await client.get_config_tag('core-site')
+
+        self.assertEqual(asyncio.run(get_tag()), 'version1')
+        self.assertTrue(self.tracer.requests[0]['url'].endswith('?fields=Clusters/desired_configs/core-site'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from mock_server import MockAmbariTestCase
+
+from knox_utils import cluster, configs
+
+
+class RunDiscoveryTest(MockAmbariTestCase):
+
+    def test_missing_config_only_fails_its_own_task(self):
+        # admin-properties is in desired_configs, but its version is not served
+        del self.cluster.configs[('admin-properties', 'version1')]
+        snapshot = configs.ClusterConfigSnapshot(self.cluster.name, self.accessor)
+
+        with mock.patch.object(cluster, '_snapshot', snapshot), redirect_stdout(io.StringIO()) as output:
+            results = cluster.run_discovery(['hdfs', 'ranger', 'solr', 'yarn'], max_workers=4)
+
+        self.assertEqual(results['ranger'], {'is_ranger_installed': False})
+        self.assertIn('admin-properties', output.getvalue())
+        self.assertEqual(results['hdfs'], {'hdfsui_protocol': 'http', 'hdfsui_port': '50070'})
+        self.assertEqual(results['solr'], {'is_solr_installed': True, 'solr_protocol': 'http', 'solr_port': '8886'})
+        self.assertEqual(results['yarn']['yarnui_port'], '8188')
+        # Every config type was still fetched in one batched request
+        self.assertEqual(self.server.stats()['GET'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
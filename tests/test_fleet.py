@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from knox_utils import async_client, fleet
+
+
+class _Client:
+    def __init__(self, host, port, *args, **kwargs):
+        self.host = host
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class RunFleetTest(unittest.TestCase):
+
+    def test_busy_server_does_not_hold_worker_slots(self):
+        # Three clusters on Ambari server a are listed before three on server b
+        targets = [fleet.FleetTarget(f"{host}{i}", host, '8080', 'http', 'admin', 'admin', f"{host}{i}", 4)
+                   for host in ('a', 'b') for i in range(3)]
+        running = []
+        overlaps = []
+
+        async def action(client):
+            running.append(client.host)
+            overlaps.append(sorted(running))
+            await asyncio.sleep(0.02)
+            running.remove(client.host)
+            return 'done'
+
+        with mock.patch.dict(fleet.FLEET_ACTIONS, {'check-knox': action}), \
+                mock.patch.object(fleet, 'AsyncAmbariClient', _Client), \
+                mock.patch.object(fleet, 'get_config_cache', return_value=None):
+            results = asyncio.run(fleet.run_fleet(targets, 'check-knox', workers=2, per_server=1))
+
+        self.assertEqual([r.status for r in results], ['OK'] * 6)
+        # Never two clusters of one server at a time
+        self.assertTrue(all(len(set(hosts)) == len(hosts) for hosts in overlaps))
+        # Server b's clusters run next to server a's rather than after them: with the worker
+        # slot taken first, a1 would hold the second worker while waiting on server a
+        self.assertEqual(overlaps[:2], [['a'], ['a', 'b']])
+
+    def test_executor_output_goes_to_its_cluster_log(self):
+        targets = [fleet.FleetTarget(name, name, '8080', 'http', 'admin', 'admin', name, 4) for name in ('a', 'b')]
+
+        def blocking(host):
+            print(f"[INFO] Probed {host}")
+
+        async def action(client):
+            await async_client.run_in_executor(blocking, client.host)
+            return 'done'
+
+        with mock.patch.dict(fleet.FLEET_ACTIONS, {'check-knox': action}), \
+                mock.patch.object(fleet, 'AsyncAmbariClient', _Client), \
+                mock.patch.object(fleet, 'get_config_cache', return_value=None):
+            results = asyncio.run(fleet.run_fleet(targets, 'check-knox'))
+
+        self.assertEqual([r.output for r in results], ['[INFO] Probed a\n', '[INFO] Probed b\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
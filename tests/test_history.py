@@ -0,0 +1,113 @@
+import io
+import tempfile
+import unittest
+from collections import OrderedDict
+from contextlib import redirect_stdout
+
+from mock_server import MockAmbariTestCase
+
+from knox_utils import history
+
+AMBARI = 'ambari:8080'
+
+
+def versions_of(count, keys=20):
+    """count successive (tag, properties, attributes), each changing one property of the one before it."""
+    properties = OrderedDict((f"key{i}", 'initial') for i in range(keys))
+    result = []
+    for n in range(count):
+        properties = OrderedDict(properties)
+        properties[f"key{n % keys}"] = f"value{n}"
+        if n == 5:
+            del properties['key19']
+        attributes = {'final': {'key0': 'true'}} if n >= 7 else {}
+        result.append((f"version{n}", properties, attributes))
+    return result
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def add(self, store, versions):
+        for tag, properties, attributes in versions:
+            store.add(AMBARI, 'c1', 'core-site', tag, properties, attributes, 'write', f"note {tag}")
+        path = history.history_path(self.directory, AMBARI, 'c1', 'core-site')
+        return path, history.read_versions(path)
+
+    def test_every_version_is_rebuilt_from_deltas_and_keyframes(self):
+        expected = versions_of(40)
+        path, versions = self.add(history.History(self.directory), expected)
+
+        self.assertEqual([version.header['key'] for version in versions].count(True), 3)
+        for index, (tag, properties, attributes) in enumerate(expected):
+            self.assertEqual(versions[index].header['tag'], tag)
+            self.assertEqual(history.materialize(path, versions, index), (properties, attributes))
+
+    def test_a_large_change_is_stored_as_a_keyframe(self):
+        first = OrderedDict((f"key{i}", 'a') for i in range(10))
+        second = OrderedDict((f"key{i}", 'b') for i in range(10))
+        path, versions = self.add(history.History(self.directory), [('version1', first, {}), ('version2', second, {})])
+
+        self.assertEqual([version.header['key'] for version in versions], [True, True])
+        self.assertEqual(versions[1].header['set'], 10)
+        self.assertEqual(history.materialize(path, versions, 1), (second, {}))
+
+    def test_compaction_rewrites_the_first_kept_header(self):
+        expected = versions_of(10)
+        path, versions = self.add(history.History(self.directory, max_versions=4), expected)
+
+        # Compacted on the 6th, 8th and 10th version, down to the newest 4 each time
+        self.assertEqual([version.header['tag'] for version in versions], [tag for tag, _, _ in expected[-4:]])
+        first = versions[0].header
+        self.assertTrue(first['key'] and first['compacted'])
+        self.assertNotIn('set', first)
+        self.assertEqual(first['note'], 'note version6')
+        for index, (_, properties, attributes) in enumerate(expected[-4:]):
+            self.assertEqual(history.materialize(path, versions, index), (properties, attributes))
+
+        with redirect_stdout(io.StringIO()) as output:
+            history.print_versions(AMBARI, 'c1', 'core-site', directory=self.directory)
+        lines = output.getvalue().splitlines()
+        self.assertIn('version6  write     oldest kept, 19 properties  "note version6"', lines[0])
+        self.assertIn('version7  write     1 set, 0 removed, attributes', lines[1])
+
+
+class RollbackTest(MockAmbariTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.override(history_dir=directory.name)
+        self.store = history.History(directory.name, max_versions=4)
+        self.expected = versions_of(6)
+        for tag, properties, attributes in self.expected:
+            self.store.add(self.accessor.ambari, self.cluster.name, 'core-site', tag, properties, attributes, 'write')
+
+    def rollback(self, tag=None):
+        with redirect_stdout(io.StringIO()) as output:
+            status = history.rollback('core-site', tag, self.accessor, self.cluster.name)
+        self.assertEqual(status, 0, output.getvalue())
+        desired = self.cluster.desired['core-site']
+        return self.cluster.configs[('core-site', desired)], output.getvalue()
+
+    def test_rollback_to_the_version_before_the_latest(self):
+        applied, output = self.rollback()
+        self.assertEqual(applied, self.expected[-2][1:])
+        self.assertIn('[INFO] Rolled core-site back to version4 as ', output)
+        self.assertEqual(self.server.stats()['PUT'], 1)
+
+    def test_rollback_to_the_compacted_keyframe(self):
+        self.assertTrue(history.read_versions(history.history_path(
+            self.store.directory, self.accessor.ambari, self.cluster.name, 'core-site'))[0].header['compacted'])
+        applied, output = self.rollback('version2')
+        self.assertEqual(applied, self.expected[2][1:])
+        self.assertIn('back to version2 as ', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from knox_utils import journal
+
+
+def record(tag, note='note'):
+    return {'time': 1700000000.0, 'ambari': 'ambari:8080', 'cluster': 'c1', 'tag': tag, 'note': note,
+            'changes': [{'type': 'core-site', 'added': {'a': '1'}, 'changed': {'b': ['2', '3']}, 'removed': {},
+                         'attributes': [{}, {'final': {'a': 'true'}}]}]}
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'changes.journal')
+
+    def test_entries_read_back_from_their_frames(self):
+        writer = journal.Journal(self.path)
+        writer.write(journal.encode(record('version1')))
+        writer.write(journal.encode(record('version2', note='second')))
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(len(journal.MAGIC)), journal.MAGIC)
+        entries = list(journal.iter_entries(self.path))
+        self.assertEqual([(entry.header['tag'], entry.header['note']) for entry in entries],
+                         [('version1', 'note'), ('version2', 'second')])
+        self.assertEqual(entries[0].header['types'],
+                         {'core-site': {'added': 1, 'changed': 1, 'removed': 0, 'attributes': True}})
+        self.assertEqual(journal.read_changes(entries[1]), record('version2')['changes'])
+        self.assertEqual(journal.find('version2', self.path).header['note'], 'second')
+
+    def test_torn_tail_is_cut_off_before_the_next_append(self):
+        writer = journal.Journal(self.path)
+        writer.write(journal.encode(record('version1')))
+        intact = os.path.getsize(self.path)
+        # A crash halfway through writing the second frame
+        with open(self.path, 'ab') as f:
+            f.write(journal.encode(record('version2'))[:20])
+        self.assertEqual([entry.header['tag'] for entry in journal.iter_entries(self.path)], ['version1'])
+
+        writer.write(journal.encode(record('version3')))
+
+        self.assertEqual(os.path.getsize(self.path), intact + len(journal.encode(record('version3'))))
+        self.assertEqual([entry.header['tag'] for entry in journal.iter_entries(self.path)], ['version1', 'version3'])
+
+    def test_full_journal_is_rotated_and_old_files_dropped(self):
+        frame = journal.encode(record('version0'))
+        writer = journal.Journal(self.path, max_bytes=len(journal.MAGIC) + 2 * len(frame), keep=2)
+        for i in range(7):
+            writer.write(journal.encode(record(f"version{i}")))
+
+        self.assertEqual(journal.journal_files(self.path), [f"{self.path}.2", f"{self.path}.1", self.path])
+        self.assertFalse(os.path.exists(f"{self.path}.3"))
+        # Two frames per file; the oldest file (version0, version1) was dropped
+        self.assertEqual([entry.header['tag'] for entry in journal.iter_entries(self.path)],
+                         [f"version{i}" for i in range(2, 7)])
+
+    def test_append_queues_and_flush_writes(self):
+        writer = journal.Journal(self.path)
+        writer.append('ambari:8080', 'c1', 'version1', 'note', record('version1')['changes'])
+        writer.flush()
+
+        self.assertEqual(writer.written, 1)
+        with redirect_stdout(io.StringIO()) as output:
+            journal.print_history(path=self.path)
+        self.assertIn('ambari:8080  c1  version1  core-site(+1 ~1 attributes)  "note"', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import configparser
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from knox_utils import KnoxConfig, params
+
+
+class KnoxConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'config.ini')
+        with open(self.path, 'w') as f:
+            f.write("[ambari]\nhost = ambari.example.com\nport = 8080\n")
+
+    def read(self):
+        config = configparser.ConfigParser()
+        config.read(self.path)
+        return dict(config['ambari'])
+
+    def test_bare_set_is_saved(self):
+        KnoxConfig(self.path).set('port', 8443)
+        self.assertEqual(self.read()['port'], '8443')
+
+    def test_set_in_with_block_is_saved_on_exit(self):
+        with KnoxConfig(self.path) as config:
+            config.set('protocol', 'https')
+            config.set('port', 8443)
+            self.assertEqual(self.read(), {'host': 'ambari.example.com', 'port': '8080'})
+            self.assertEqual(config.get('port'), '8443')
+        self.assertEqual(self.read(), {'host': 'ambari.example.com', 'port': '8443', 'protocol': 'https'})
+
+    def test_with_block_is_not_saved_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with KnoxConfig(self.path) as config:
+                config.set('port', 8443)
+                raise RuntimeError
+        self.assertEqual(self.read()['port'], '8080')
+        self.assertEqual(config.get('port'), '8080')
+
+    def test_failed_nested_block_keeps_the_enclosing_blocks_keys(self):
+        with KnoxConfig(self.path) as config:
+            config.set('port', 8443)
+            with self.assertRaises(RuntimeError):
+                with config:
+                    config.set('protocol', 'https')
+                    config.set('port', 9443)
+                    raise RuntimeError
+            self.assertEqual(config.get('port'), '8443')
+        self.assertEqual(self.read(), {'host': 'ambari.example.com', 'port': '8443'})
+
+    def test_failed_block_keeps_keys_staged_by_another_instance(self):
+        self.addCleanup(params.reload)
+        with mock.patch.object(params, '_resolver', params.Resolver(self.path, environ={})):
+            with KnoxConfig() as outer:
+                outer.set('port', 8443)
+                with self.assertRaises(RuntimeError):
+                    with KnoxConfig() as inner:
+                        inner.set('protocol', 'https')
+                        raise RuntimeError
+                self.assertIsNone(outer.get('protocol'))
+        self.assertEqual(self.read(), {'host': 'ambari.example.com', 'port': '8443'})
+
+
+if __name__ == '__main__':
+    unittest.main()
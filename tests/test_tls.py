@@ -0,0 +1,50 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from knox_utils import tls
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class ForgetTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(directory.name, 'tls.json')
+        with redirect_stdout(io.StringIO()):
+            tls.save_decision('a', 8443, tls.TlsDecision(tls.PINNED, 'ab:cd'), self.path)
+            tls.save_decision('b', 8443, tls.TlsDecision(tls.VERIFY, None), self.path)
+
+    def test_forget_replaces_the_file_atomically(self):
+        with mock.patch.object(tls.os, 'replace', wraps=os.replace) as replace, \
+                redirect_stdout(io.StringIO()) as output:
+            tls.forget('a', 8443, self.path)
+
+        replace.assert_called_once()
+        self.assertEqual(replace.call_args[0][1], self.path)
+        self.assertEqual(list(tls.load_decisions(self.path)), ['b:8443'])
+        self.assertEqual(os.listdir(self.directory), ['tls.json'])
+        self.assertIn('[INFO] Forgot TLS decision for a:8443', output.getvalue())
+
+    def test_tls_reset_alone_is_an_action(self):
+        config = os.path.join(self.directory, 'config.ini')
+        with open(config, 'w') as f:
+            f.write(f"[ambari]\nhost = a\nport = 8443\ntls_state_file = {self.path}\n")
+        result = subprocess.run([sys.executable, 'main.py', '--tls-reset', '--local', 'false'], cwd=REPO_ROOT,
+                                env=dict(os.environ, KNOX_UTILITY_CONFIG=config), capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, '[INFO] Forgot TLS decision for a:8443\n')
+        self.assertEqual(list(tls.load_decisions(self.path)), ['b:8443'])
+
+
+if __name__ == '__main__':
+    unittest.main()
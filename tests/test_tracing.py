@@ -0,0 +1,29 @@
+import unittest
+
+from mock_server import MockAmbariTestCase
+
+from knox_utils import configs, tracing
+
+
+class ConfigsTracingTest(MockAmbariTestCase):
+
+    def test_pooled_requests_and_parses_reach_the_tracer(self):
+        tracer = tracing.enable()
+        self.addCleanup(tracing.disable)
+        configs.get_desired_tags(self.cluster.name, self.accessor)
+
+        [event] = tracer.requests
+        self.assertEqual((event['client'], event['method'], event['status'], event['hedged']),
+                         ('http.client', 'GET', 200, False))
+        self.assertGreater(event['bytes_received'], 0)
+        self.assertEqual([event['name'] for event in tracer.phases], ['parse desired_configs'])
+
+    def test_nothing_is_recorded_when_disabled(self):
+        tracer = tracing.enable()
+        tracing.disable()
+        configs.get_desired_tags(self.cluster.name, self.accessor)
+        self.assertEqual((tracer.requests, tracer.phases), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import re
+import unittest
+from contextlib import redirect_stdout
+
+from mock_server import MockAmbariTestCase
+
+from knox_utils import cluster, tracing, whitelist
+
+HOSTS = ['node1.dc1.corp.com', 'node2.dc2.corp.com', 'edge.lab.example.org']
+
+
+def trie_of(hostnames):
+    trie = whitelist.SuffixTrie()
+    trie.add(hostnames)
+    return trie
+
+
+class SuffixTrieTest(unittest.TestCase):
+
+    def test_covered_domains_are_dropped(self):
+        trie = trie_of(['a.corp.com', 'b.x.corp.com', 'c.dc1.x.corp.com'])
+        self.assertEqual(trie.minimise(), {'com': {'corp': {None: 1}}})
+
+    def test_wide_nodes_collapse_below_the_registered_domain(self):
+        trie = trie_of([f"node.dc{i}.corp.com" for i in range(5)] + ['node.a.b.com'])
+        self.assertEqual(trie.minimise(max_alternatives=4), {'com': {'corp': {None: 0}, 'b': {'a': {None: 1}}}})
+
+    def test_synthesized_whitelist_matches_the_readme_example(self):
+        self.assertEqual(whitelist.synthesize_whitelist(trie_of(HOSTS)),
+                         r'^https?:\/\/(?:[A-Za-z0-9-]+\.)+(?:(?:dc1|dc2)\.corp\.com|lab\.example\.org)'
+                         r':[0-9]+(?:[\/?#].*)?$')
+
+
+class CheckWhitelistTest(unittest.TestCase):
+
+    def test_synthesized_whitelist_passes(self):
+        regex = whitelist.synthesize_whitelist(trie_of(HOSTS))
+        result = whitelist.check_whitelist(regex, HOSTS, min_seconds=0.01)
+        self.assertEqual((result['unmatched'], result['accepted_probes']), ([], []))
+
+    def test_whitelist_accepting_a_probe_is_refused(self):
+        with self.assertRaisesRegex(ValueError, 'must reject'):
+            whitelist.check_whitelist(r'^https?:\/\/.*$', HOSTS, min_seconds=0.01)
+
+    def test_whitelist_missing_a_host_is_refused(self):
+        regex = whitelist.synthesize_whitelist(trie_of(HOSTS[:2]))
+        with self.assertRaisesRegex(ValueError, 'does not match 1 host'):
+            whitelist.check_whitelist(regex, HOSTS, min_seconds=0.01)
+
+    def test_slow_whitelist_is_refused(self):
+        regex = whitelist.synthesize_whitelist(trie_of(HOSTS))
+        with self.assertRaisesRegex(ValueError, 'budget'):
+            whitelist.check_whitelist(regex, HOSTS, max_microseconds=1e-6, min_seconds=0.01)
+
+
+class SetKnoxWhitelistTest(MockAmbariTestCase):
+    hosts = 25
+    domains = 2
+
+    def setUp(self):
+        super().setUp()
+        self.install(hosts_page_size=10)
+        tracer = tracing.enable()
+        self.addCleanup(tracing.disable)
+        self.requests = tracer.requests
+
+    def whitelist(self):
+        return self.cluster.configs[('gateway-site', self.cluster.desired['gateway-site'])][0]['gateway.dispatch.whitelist']
+
+    def test_host_names_are_paged_into_the_trie(self):
+        with redirect_stdout(io.StringIO()) as output:
+            cluster.set_knox_whitelist()
+
+        host_urls = [event['url'] for event in self.requests if '/hosts?' in event['url']]
+        self.assertEqual(len(host_urls), 3)
+        self.assertTrue(all('fields=Hosts/host_name&' in url for url in host_urls), host_urls)
+        self.assertIn('[INFO] Page 3: 5 host(s), 25 so far', output.getvalue())
+        self.assertIsNone(cluster._host_index)
+        pattern = re.compile(self.whitelist())
+        self.assertTrue(all(pattern.match(f"https://{hostname}:8443/gateway/") for hostname in self.cluster.hostnames))
+
+    def test_a_loaded_host_index_is_reused(self):
+        with redirect_stdout(io.StringIO()):
+            cluster.get_host_index()
+            sweeps = len(self.requests)
+            cluster.set_knox_whitelist()
+
+        self.assertFalse([event for event in self.requests[sweeps:] if '/hosts?' in event['url']])
+        self.assertIn('dc1', self.whitelist())
+
+    def test_short_host_names_do_not_fail_the_checks(self):
+        self.cluster.hostnames.append('localhost')
+        self.cluster.components['localhost'] = []
+        with redirect_stdout(io.StringIO()) as output:
+            cluster.set_knox_whitelist()
+
+        self.assertIn("[WARN] Skipping 1 hostname(s)", output.getvalue())
+        self.assertEqual(self.server.stats()['PUT'], 1)
+
+    def test_whitelist_failing_its_checks_is_not_put(self):
+        self.override(whitelist_max_match_us=1e-6)
+        tag = self.cluster.desired['gateway-site']
+        with redirect_stdout(io.StringIO()) as output, self.assertRaises(ValueError):
+            cluster.set_knox_whitelist()
+
+        self.assertIn('[ERROR] Generated whitelist failed its checks', output.getvalue())
+        self.assertNotIn('PUT', self.server.stats())
+        self.assertEqual(self.cluster.desired['gateway-site'], tag)
+
+
+if __name__ == '__main__':
+    unittest.main()